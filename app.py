@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, Response, make_response
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, Response, abort
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf import FlaskForm, CSRFProtect
 from flask_ckeditor import CKEditor, CKEditorField
@@ -6,37 +6,49 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.sql import func
 from wtforms import StringField, PasswordField, SubmitField, SelectField, FileField
 from wtforms.validators import DataRequired, ValidationError
-import logging
-from logging.handlers import RotatingFileHandler
-from PIL import Image
 import os
 import json
+import shutil
+import tempfile
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from flask_wtf.csrf import validate_csrf
-from supabase import create_client, Client
+from supabase_storage import SupabaseStorage
+from storage import Storage
+from assets import AssetManifest
+from bundles import AssetBundles
+from compression import Compression
+from log_pipeline import LogPipeline
+from db_pool import DatabasePool
+from query_profiler import QueryProfiler
+from metrics import Metrics
+from conditional import ConditionalGet
+from feed_cache import FeedCache
 from bs4 import BeautifulSoup
 import pytz
+from view_counter import ViewCounter
+from ratings import RatingEngine
+from homepage import HomepageCache
+from search import SearchIndex
+from page_cache import PageCache
+from category_registry import CategoryRegistry
+from queries import ListingQueries
+from category_stats import CategoryStats
+import images
+from images import ImagePipeline
+import post_text
+from pagination import keyset_paginate, per_page_arg, wants_fragment, fragment_response
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-logging.basicConfig(level=logging.INFO)
-file_handler = RotatingFileHandler('logs/app.log', maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-
 # Initialize Flask app
 app = Flask(__name__)
 
+# JSON logs with request IDs, written off the request thread (see log_pipeline.py)
+log_pipeline = LogPipeline(app)
+
 # App configuration
 app.secret_key = os.environ.get('SECRET_KEY', 'hepsihikaye-dev-key')
 app.config['UPLOADS_FOLDER'] = 'uploads'
@@ -51,64 +63,27 @@ app.config['CKEDITOR_FILE_UPLOADER'] = 'upload'  # Set the upload route for CKEd
 # Supabase Configuration
 supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_SERVICE_KEY")
+app.config['SUPABASE_BUCKET'] = os.environ.get('SUPABASE_BUCKET', 'uploads')
 
 if not supabase_url or not supabase_key:
     app.logger.warning("Supabase URL or Key not found in environment variables. Storage uploads will fail.")
-    supabase = None
+    supabase_storage = None
 else:
-    try:
-        supabase = create_client(supabase_url, supabase_key)
-        app.logger.info("Supabase client initialized successfully.")
-    except Exception as e:
-        app.logger.error(f"Failed to initialize Supabase client: {e}")
-        supabase = None
+    # Streaming uploads over one pooled HTTP client per worker (see supabase_storage.py)
+    supabase_storage = SupabaseStorage(supabase_url, supabase_key, bucket=app.config['SUPABASE_BUCKET'])
+    app.logger.info("Supabase storage client initialized successfully.")
 
-# Function to upload files to Supabase
-def upload_to_supabase(file, folder="posts"):
-    """
-    Upload a file to Supabase Storage and return its public URL
-    
-    Parameters:
-    - file: The file object from Flask request
-    - folder: The folder within the bucket to store the file (default: "posts")
-    
-    Returns:
-    - The public URL of the uploaded file, or None if upload failed
-    """
-    if not supabase or not file:
-        return None
-        
-    try:
-        # Generate a unique filename
-        original_filename = secure_filename(file.filename)
-        unique_filename = f"{datetime.now().timestamp()}_{original_filename}"
-        supabase_path = f"{folder}/{unique_filename}"
-        
-        app.logger.info(f"Uploading to Supabase bucket 'uploads' at path: {supabase_path}")
-        
-        # Reset file pointer and read data
-        file.seek(0)
-        file_data = file.read()
-        
-        # Get content type
-        content_type = file.content_type or 'application/octet-stream'
-        
-        # Upload to Supabase Storage
-        supabase.storage.from_("uploads").upload(
-            path=supabase_path,
-            file=file_data,
-            file_options={"content-type": content_type}
-        )
-        
-        # Get the public URL
-        public_url = supabase.storage.from_("uploads").get_public_url(supabase_path)
-        app.logger.info(f"Successfully uploaded to Supabase. Public URL: {public_url}")
-        
-        return public_url
-        
-    except Exception as e:
-        app.logger.error(f"Supabase upload failed: {e}")
-        return None
+# Local, Supabase and content-addressed file storage for uploads (see storage.py)
+storage = Storage(app, supabase_storage)
+
+# Fingerprinted, far-future cached static assets (see assets.py, build_assets.py)
+asset_manifest = AssetManifest(app)
+
+# Self-hosted CSS/JS bundles with inlined critical CSS, CDN links until built (see bundles.py)
+asset_bundles = AssetBundles(app)
+
+# gzip/brotli for HTML, JSON and feed responses (see compression.py)
+compression = Compression(app)
 
 # Database configuration
 database_url = os.environ.get('DATABASE_URL')
@@ -125,20 +100,16 @@ elif not database_url and app.config['DEBUG']:
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool sizing, PgBouncer mode and pool metrics; must run before SQLAlchemy(app) (see db_pool.py)
+database_pool = DatabasePool(app)
 db = SQLAlchemy(app)
+database_pool.watch(db)
+# Per-request SQL timing, Server-Timing headers and /admin/perf (see query_profiler.py)
+query_profiler = QueryProfiler(app)
+# Request, template and upload metrics scraped at /metrics (see metrics.py)
+metrics = Metrics(app)
 
-# Configure logger
-if not app.logger.handlers:
-    handler = logging.StreamHandler()
-    handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s '
-        '[in %(pathname)s:%(lineno)d]'
-    ))
-    handler.setLevel(logging.INFO)
-    app.logger.addHandler(handler)
-    app.logger.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('Application startup')
+app.logger.info('Application startup')
 
 # Initialize extensions
 csrf = CSRFProtect(app)
@@ -161,6 +132,9 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     slug = db.Column(db.String(100), unique=True, nullable=False)
+    # Maintained only when CATEGORY_COUNTS is 'denormalized' (see category_stats.py)
+    post_count = db.Column(db.Integer, default=0)
+    video_count = db.Column(db.Integer, default=0)
     posts = db.relationship('Post', backref='category', lazy=True)
     videos = db.relationship('Video', backref='category', lazy=True)
 
@@ -169,12 +143,20 @@ class Post(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     excerpt = db.Column(db.Text)
+    # Derived from content on every write by post_text (plain-text excerpt and stats)
+    summary = db.Column(db.Text)
+    word_count = db.Column(db.Integer, default=0)
+    reading_time = db.Column(db.Integer, default=1)
     image = db.Column(db.String(200))
+    # Widths/formats of the responsive copies of image (see images.py)
+    image_variants = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
     views = db.Column(db.Integer, default=0)
     likes = db.Column(db.Integer, default=0)
     dislikes = db.Column(db.Integer, default=0)
+    # likes * 2 + views, refreshed in the background by homepage_cache
+    trending_score = db.Column(db.Integer, default=0)
     published = db.Column(db.Boolean, default=True)
     featured = db.Column(db.Boolean, default=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
@@ -183,6 +165,35 @@ class Post(db.Model):
     # Add the new foreign key and relationship
     author_id = db.Column(db.Integer, db.ForeignKey('admin_users.id'), nullable=True)
     author_relationship = db.relationship('AdminUser', backref=db.backref('posts', lazy='dynamic'))
+    
+    __table_args__ = (
+        db.Index('ix_post_published_trending', 'published', 'trending_score'),
+        # Newest-first listings (homepage, feeds, keyset pages), overall and per category
+        db.Index('ix_post_published_created_at', 'published', created_at.desc(), id.desc()),
+        db.Index('ix_post_category_published_created_at', 'category_id', 'published',
+                 created_at.desc(), id.desc()),
+        db.Index('ix_post_created_at', created_at.desc()),
+    )
+
+    @property
+    def display_excerpt(self):
+        """The author's excerpt, or the one derived from the content"""
+        return self.excerpt or self.summary or ''
+
+@db.event.listens_for(Post, 'before_insert')
+@db.event.listens_for(Post, 'before_update')
+def derive_post_text(mapper, connection, post):
+    """Recompute the plain-text fields whenever the content changes"""
+    if post.summary is None or db.inspect(post).attrs.content.history.has_changes():
+        post_text.apply(post)
+
+class PostRatingShard(db.Model):
+    """Counter shard for post likes/dislikes, used when RATING_MODE is 'sharded'"""
+    __tablename__ = 'post_rating_shard'
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    dislikes = db.Column(db.Integer, nullable=False, default=0)
 
 class Video(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -197,6 +208,13 @@ class Video(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     comments = db.relationship('Comment', backref='video', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_video_published_created_at', 'published', created_at.desc(), id.desc()),
+        db.Index('ix_video_category_published_created_at', 'category_id', 'published',
+                 created_at.desc(), id.desc()),
+        db.Index('ix_video_created_at', created_at.desc()),
+    )
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -207,6 +225,12 @@ class Comment(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
     video_id = db.Column(db.Integer, db.ForeignKey('video.id'))
 
+    __table_args__ = (
+        db.Index('ix_comment_post_status', 'post_id', 'status'),
+        db.Index('ix_comment_video_id', 'video_id'),
+        db.Index('ix_comment_status_created_at', 'status', created_at.desc()),
+    )
+
 class AdminUser(db.Model):
     __tablename__ = 'admin_users'
     id = db.Column(db.Integer, primary_key=True)
@@ -237,6 +261,63 @@ class RegistrationSettings(db.Model):
     default_user_role = db.Column(db.String(50), default='user')
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+# Buffered post view counts, flushed in batches (see view_counter.py)
+view_counter = ViewCounter(app, db, Post)
+# Like/dislike counters with atomic, sharded or buffered updates (see ratings.py)
+ratings = RatingEngine(app, db, Post, PostRatingShard)
+# In-memory homepage lists and background trending score refresh (see homepage.py)
+homepage_cache = HomepageCache(app, db, Post, Video)
+# Full-text search over posts and videos (see search.py)
+search_index = SearchIndex(app, db, Post, Video)
+# Rendered public pages, tagged by the content they show (see page_cache.py)
+page_cache = PageCache(app)
+# ETag/Last-Modified checked before rendering post pages, feeds and API responses (see conditional.py)
+conditional_get = ConditionalGet(app, db, Post)
+# RSS feed rebuilt on content changes and served as stored bytes (see feed_cache.py)
+feed_cache = FeedCache(app, db, Post)
+# Categories loaded once per worker (see category_registry.py)
+category_registry = CategoryRegistry(app, db, Category)
+# Eager-loading listing queries and per-view query budgets (see queries.py)
+listing_queries = ListingQueries(app, db, Post, Video, Comment)
+# Post/video counts per category in one query (see category_stats.py)
+category_stats = CategoryStats(app, db, Category, Post, Video)
+
+def invalidate_content_caches(*tags):
+    """
+    Drop cached public content after a write. Tags: 'posts', 'post-<id>',
+    'videos' and 'categories'.
+    """
+    try:
+        page_cache.invalidate(*tags)
+        if 'posts' in tags or 'videos' in tags:
+            homepage_cache.invalidate()
+        if 'categories' in tags:
+            category_registry.invalidate()
+    except Exception as e:
+        app.logger.error(f"Cache invalidation error: {str(e)}")
+
+# Responsive post image variants generated in a worker pool (see images.py)
+image_pipeline = ImagePipeline(app, db, Post,
+                               on_change=lambda post_id: invalidate_content_caches('posts', f'post-{post_id}'))
+
+def queue_post_image_variants(post, image):
+    """Generate responsive copies of a post's newly uploaded image in the background"""
+    _, key = storage.locate(post.image)
+    if not key:
+        return
+    source = storage.local_path(post.image)
+    discard_source = False
+    if source is None:
+        # The request's file goes away with the request; give the worker a copy on disk
+        image.stream.seek(0)
+        with tempfile.NamedTemporaryFile(prefix='post-image-', suffix=os.path.splitext(key)[1],
+                                         delete=False) as tmp:
+            shutil.copyfileobj(image.stream, tmp)
+        source = tmp.name
+        discard_source = True
+    image_pipeline.submit_post_image(post.id, post.image, source, storage.store_for(post.image), key=key,
+                                     discard_source=discard_source)
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -297,28 +378,53 @@ def format_datetime_filter(dt):
             return dt # Return original string if parsing fails
     return dt
 
+def image_file_url(name):
+    """URL of an uploaded file stored either as a full URL or a local filename"""
+    return storage.url(name)
+
 @app.template_filter('post_image_url')
-def post_image_url_filter(post):
+def post_image_url_filter(post, width=None):
     # Check if post object exists and has an image attribute
     image_attr = getattr(post, 'image', None)
     if image_attr:
-        # If the image is already a full URL (from Supabase), return it directly
-        if image_attr.startswith('http'):
-            return image_attr
-        # Otherwise, treat it as a local file
-        return url_for('static', filename=f'uploads/{image_attr}')
+        # Prefer a scaled JPEG copy (the largest, or the smallest >= width) once it exists
+        variants = images.load_variants(getattr(post, 'image_variants', None))
+        if variants:
+            widths = sorted(variants['widths'])
+            chosen = next((w for w in widths if width and w >= width), widths[-1])
+            return image_file_url(images.variant_name(image_attr, chosen, 'jpeg'))
+        # If the image is already a full URL (from Supabase), return it directly;
+        # otherwise, treat it as a local file
+        return image_file_url(image_attr)
     # Use default image if post has no image or image attribute doesn't exist
     return url_for('static', filename='uploads/default_post_image.png')
 
+@app.template_filter('post_image_srcset')
+def post_image_srcset_filter(post, fmt='jpeg'):
+    """srcset value listing the scaled copies of a post image in one format"""
+    image_attr = getattr(post, 'image', None)
+    variants = images.load_variants(getattr(post, 'image_variants', None))
+    if not image_attr or not variants or fmt not in variants['formats']:
+        return ''
+    return ', '.join(
+        f"{image_file_url(images.variant_name(image_attr, width, fmt))} {width}w"
+        for width in sorted(variants['widths'])
+    )
+
+@app.template_filter('post_image_formats')
+def post_image_formats_filter(post):
+    """Modern formats (AVIF/WebP) available for a post image, best first"""
+    variants = images.load_variants(getattr(post, 'image_variants', None))
+    if not getattr(post, 'image', None) or not variants:
+        return []
+    return [fmt for fmt in variants['formats'] if fmt != 'jpeg']
+
 @app.template_filter('video_thumbnail_url')
 def video_thumbnail_url_filter(video):
     """Generate URL for video thumbnail or default image."""
     if hasattr(video, 'thumbnail_url') and video.thumbnail_url:
-        # If the thumbnail is already a full URL (from Supabase), return it directly
-        if video.thumbnail_url.startswith('http'):
-            return video.thumbnail_url
-        # Otherwise, treat thumbnail_url as a filename
-        return url_for('static', filename=f'uploads/{video.thumbnail_url}')
+        # Full URL (from Supabase) or a path under static/uploads
+        return storage.url(video.thumbnail_url)
     # Provide a default video thumbnail
     return url_for('static', filename='uploads/default_video_thumb.png')
 
@@ -335,28 +441,19 @@ def rss_date_format(dt):
 
 # Routes
 @app.route('/')
+@page_cache.cached(tags=('posts', 'videos', 'categories'))
+@listing_queries.budget(6)
 def index():
     try:
-        # Get trending posts (most liked and most viewed posts)
-        trending_posts = Post.query.filter_by(published=True) \
-            .order_by((Post.likes * 2 + Post.views).desc()) \
-            .limit(3).all()
-        
-        # Get recent posts (exclude trending ones to avoid duplication)
-        trending_ids = [post.id for post in trending_posts]
-        recent_posts = Post.query.filter(Post.published == True, ~Post.id.in_(trending_ids)) \
-            .order_by(Post.created_at.desc()) \
-            .limit(6).all()
-        
-        # Get recent videos
-        recent_videos = Video.query.filter_by(published=True) \
-            .order_by(Video.created_at.desc()) \
-            .limit(3).all()
-        
+        # Trending, recent posts and recent videos, served from memory
+        homepage = homepage_cache.get()
+        # One query for the counts shown on the cards instead of one per post
+        ratings.prefetch(homepage['trending_posts'] + homepage['posts'])
+
         return render_template('index.html', 
-                              trending_posts=trending_posts,
-                              posts=recent_posts, 
-                              videos=recent_videos)
+                              trending_posts=homepage['trending_posts'],
+                              posts=homepage['posts'], 
+                              videos=homepage['videos'])
     except Exception as e:
         app.logger.error(f"Index error: {str(e)}")
         return render_template('errors/500.html')
@@ -383,6 +480,7 @@ def admin_login():
 
 @app.route('/admin/dashboard')
 @login_required
+@listing_queries.budget(15)
 def admin_dashboard():
     try:
         # Get counts and recent items
@@ -392,8 +490,8 @@ def admin_dashboard():
         total_views = db.session.query(func.sum(Post.views)).scalar() or 0
         total_views += db.session.query(func.sum(Video.views)).scalar() or 0
         
-        recent_posts = Post.query.order_by(Post.created_at.desc()).limit(5).all()
-        recent_videos = Video.query.order_by(Video.created_at.desc()).limit(5).all()
+        recent_posts = listing_queries.posts().order_by(Post.created_at.desc()).limit(5).all()
+        recent_videos = listing_queries.videos().order_by(Video.created_at.desc()).limit(5).all()
         
         return render_template('admin/dashboard.html',
                               total_posts=total_posts,
@@ -420,14 +518,38 @@ def admin_logout():
     flash('Başarıyla çıkış yaptınız.', 'success')
     return redirect(url_for('admin_login'))
 
+@app.route('/admin/perf', methods=['GET', 'POST'])
+@login_required
+def admin_perf():
+    """SQL and response times per endpoint, slow queries and pool state of this worker"""
+    if request.method == 'POST':
+        query_profiler.reset()
+        flash('Performans istatistikleri sıfırlandı.', 'success')
+        return redirect(url_for('admin_perf'))
+    return render_template('admin/perf.html',
+                           endpoints=query_profiler.stats(),
+                           slow_queries=query_profiler.recent_slow_queries(),
+                           since=datetime.fromtimestamp(query_profiler.started_at),
+                           pool_stats=database_pool.stats(),
+                           pid=os.getpid())
+
+@app.route('/admin/db-pool')
+@login_required
+def admin_db_pool():
+    """Connection pool occupancy and counters of this worker, for monitoring"""
+    return jsonify({'pid': os.getpid(), 'engines': database_pool.stats()})
+
 @app.route('/post/<int:post_id>')
+@conditional_get.post(tags=('categories',), per_visitor=True,
+                      on_not_modified=lambda post_id: view_counter.increment(post_id))
+@page_cache.cached(tags=lambda post_id: (f'post-{post_id}', 'categories'),
+                   on_hit=lambda post_id: view_counter.increment(post_id))
 def post_detail(post_id):
     try:
         post = Post.query.get_or_404(post_id)
         
-        # Increment views
-        post.views += 1
-        db.session.commit()
+        # Increment views (buffered, written to the database in batches)
+        view_counter.increment(post.id)
         
         # Get approved comments for this post
         comments = Comment.query.filter_by(post_id=post_id, status='approved').all()
@@ -481,19 +603,15 @@ def rate_post(post_id, action):
         if action not in ['like', 'dislike']:
             return jsonify({'success': False, 'message': 'Geçersiz işlem.'}), 400
         
-        post = Post.query.get_or_404(post_id)
-        
-        if action == 'like':
-            post.likes += 1
-        else:
-            post.dislikes += 1
-        
-        db.session.commit()
+        counts = ratings.rate(post_id, action)
+        if counts is None:
+            return jsonify({'success': False, 'message': 'Hikaye bulunamadı.'}), 404
+        likes, dislikes = counts
         
         return jsonify({
             'success': True,
-            'likes': post.likes,
-            'dislikes': post.dislikes,
+            'likes': likes,
+            'dislikes': dislikes,
             'message': 'Oyunuz kaydedildi!'
         })
     except Exception as e:
@@ -503,21 +621,41 @@ def rate_post(post_id, action):
             'message': 'Bir hata oluştu. Lütfen daha sonra tekrar deneyin.'
         })
 
+@app.route('/post/<int:post_id>/rating')
+def post_rating(post_id):
+    # Votes don't invalidate the cached post page; post.js reads the current counts from here
+    counts = ratings.counts(post_id)
+    if counts is None:
+        abort(404)
+    likes, dislikes = counts
+    response = jsonify({'likes': likes, 'dislikes': dislikes})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 @app.route('/admin/posts')
 @login_required
+@listing_queries.budget(10)
 def admin_posts():
     try:
         search_query = request.args.get('search', '')
+        page = request.args.get('page', 1, type=int)
         
         if search_query:
-            posts = Post.query.filter(
-                Post.title.ilike(f'%{search_query}%') | 
-                Post.content.ilike(f'%{search_query}%')
-            ).order_by(Post.created_at.desc()).all()
+            # Ranked full-text matches, including unpublished posts
+            results = search_index.search_posts(search_query, page=page, per_page=50, published_only=False,
+                                                base_query=listing_queries.posts())
+            posts = results.items
         else:
-            posts = Post.query.order_by(Post.created_at.desc()).all()
+            results = listing_queries.posts().order_by(Post.created_at.desc()).paginate(
+                page=page, per_page=50, error_out=False
+            )
+            posts = results.items
         
-        return render_template('admin/posts.html', posts=posts, search_query=search_query)
+        return render_template('admin/posts.html',
+                              posts=posts,
+                              search_query=search_query,
+                              current_page=results.page,
+                              total_pages=results.pages)
     except Exception as e:
         app.logger.error(f"Admin posts error: {str(e)}")
         flash('Hikayeler yüklenirken bir hata oluştu!', 'danger')
@@ -560,48 +698,20 @@ def admin_new_post():
             )
             
             # Handle image upload
+            image_value = None
             if image and image.filename:
-                # Check if Supabase integration is available
-                if supabase:
-                    # Upload to Supabase Storage
-                    image_url = upload_to_supabase(image, folder="posts")
-                    if image_url:
-                        new_post.image = image_url  # Store the full URL
-                    else:
-                        app.logger.warning("Supabase upload failed, falling back to local storage")
-                        # Fall back to local storage if Supabase upload fails
-                        filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-                        image_path = os.path.join('static', 'uploads', filename)
-                        
-                        # Ensure uploads directory exists
-                        os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                        
-                        # Save the image
-                        image.save(image_path)
-                        
-                        # Resize image if needed
-                        resize_image(image_path)
-                        
-                        new_post.image = filename  # Store just the filename
-                else:
-                    # Supabase integration not available, use local storage
-                    filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-                    image_path = os.path.join('static', 'uploads', filename)
-                    
-                    # Ensure uploads directory exists
-                    os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                    
-                    # Save the image
-                    image.save(image_path)
-                    
-                    # Resize image if needed
-                    resize_image(image_path)
-                    
-                    new_post.image = filename  # Store just the filename
+                # Stored on Supabase (or locally); scaled copies are made in the background
+                image_value = storage.save_upload(image, folder='posts')
+                if image_value:
+                    new_post.image = image_value
             
             # Add to database
             db.session.add(new_post)
             db.session.commit()
+            search_index.index_post(new_post)
+            invalidate_content_caches('posts')
+            if image_value:
+                queue_post_image_variants(new_post, image)
             
             flash('Hikaye başarıyla eklendi!', 'success')
             return redirect(url_for('admin_posts'))
@@ -660,48 +770,23 @@ def admin_edit_post(post_id):
             if remove_image and post.image:
                 # Remove image reference
                 post.image = None
+                post.image_variants = None
             
+            image_value = None
             if image and image.filename:
-                # Check if Supabase integration is available
-                if supabase:
-                    # Upload to Supabase Storage
-                    image_url = upload_to_supabase(image, folder="posts")
-                    if image_url:
-                        post.image = image_url  # Store the full URL
-                    else:
-                        app.logger.warning("Supabase upload failed, falling back to local storage")
-                        # Fall back to local storage if Supabase upload fails
-                        filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-                        image_path = os.path.join('static', 'uploads', filename)
-                        
-                        # Ensure uploads directory exists
-                        os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                        
-                        # Save the image
-                        image.save(image_path)
-                        
-                        # Resize image if needed
-                        resize_image(image_path)
-                        
-                        post.image = filename  # Store just the filename
-                else:
-                    # Supabase integration not available, use local storage
-                    filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{image.filename}")
-                    image_path = os.path.join('static', 'uploads', filename)
-                    
-                    # Ensure uploads directory exists
-                    os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                    
-                    # Save the image
-                    image.save(image_path)
-                    
-                    # Resize image if needed
-                    resize_image(image_path)
-                    
-                    post.image = filename  # Store just the filename
+                # Stored on Supabase (or locally); scaled copies are made in the background
+                image_value = storage.save_upload(image, folder='posts')
+                if image_value:
+                    post.image = image_value
+                    # Variants of the old image no longer apply
+                    post.image_variants = None
             
             # Save changes
             db.session.commit()
+            search_index.index_post(post)
+            invalidate_content_caches('posts', f'post-{post.id}')
+            if image_value:
+                queue_post_image_variants(post, image)
             
             flash('Hikaye başarıyla güncellendi!', 'success')
             return redirect(url_for('admin_posts'))
@@ -721,17 +806,19 @@ def admin_delete_post(post_id):
         post = Post.query.get_or_404(post_id)
         
         if post.image:
-            # Try to remove the image file
-            try:
-                image_path = os.path.join('static', 'uploads', post.image)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            except Exception as e:
-                app.logger.error(f"Error removing image: {str(e)}")
+            # Remove the image file and its scaled copies
+            variants = images.load_variants(post.image_variants)
+            stored = [post.image]
+            if variants:
+                stored += [images.variant_name(post.image, width, fmt)
+                           for width in variants['widths'] for fmt in variants['formats']]
+            storage.delete(*stored)
         
         # Delete the post (and associated comments via cascade)
         db.session.delete(post)
         db.session.commit()
+        search_index.remove_post(post_id)
+        invalidate_content_caches('posts', f'post-{post_id}')
         
         flash('Gönderi başarıyla silindi.', 'success')
     except Exception as e:
@@ -756,16 +843,15 @@ def admin_view_post(post_id):
 
 @app.route('/admin/categories')
 @login_required
+@listing_queries.budget(6)
 def admin_categories():
     try:
         categories = Category.query.all()
         
-        # Add post and video counts to each category
-        for category in categories:
-            category.post_count = Post.query.filter_by(category_id=category.id).count()
-            category.video_count = Video.query.filter_by(category_id=category.id).count()
+        # Post and video counts for all categories in a single query
+        category_counts = category_stats.counts()
             
-        return render_template('admin/categories.html', categories=categories)
+        return render_template('admin/categories.html', categories=categories, category_counts=category_counts)
     except Exception as e:
         app.logger.error(f"Admin categories error: {str(e)}")
         flash('Kategoriler yüklenirken bir hata oluştu.', 'danger')
@@ -792,6 +878,7 @@ def admin_new_category():
         new_category = Category(name=name, slug=slug)
         db.session.add(new_category)
         db.session.commit()
+        invalidate_content_caches('categories')
         
         flash('Kategori başarıyla oluşturuldu.', 'success')
     except Exception as e:
@@ -814,6 +901,7 @@ def admin_delete_category(category_id):
         # Delete the category
         db.session.delete(category)
         db.session.commit()
+        invalidate_content_caches('categories', 'posts', 'videos')
         
         flash('Kategori başarıyla silindi.', 'success')
     except Exception as e:
@@ -844,6 +932,7 @@ def admin_edit_category(category_id):
         # Update category name
         category.name = name
         db.session.commit()
+        invalidate_content_caches('categories')
         
         flash('Kategori başarıyla güncellendi.', 'success')
     except Exception as e:
@@ -855,9 +944,10 @@ def admin_edit_category(category_id):
 
 @app.route('/admin/comments')
 @login_required
+@listing_queries.budget(10)
 def admin_comments():
     try:
-        comments = Comment.query.all()
+        comments = listing_queries.comments().all()
         return render_template('admin/comments.html', comments=comments)
     except Exception as e:
         app.logger.error(f"Admin comments error: {str(e)}")
@@ -870,6 +960,8 @@ def approve_comment(comment_id):
         comment = Comment.query.get_or_404(comment_id)
         comment.status = 'approved'
         db.session.commit()
+        if comment.post_id:
+            invalidate_content_caches(f'post-{comment.post_id}')
         flash(f'Yorum onaylandı.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -884,6 +976,8 @@ def reject_comment(comment_id):
         comment = Comment.query.get_or_404(comment_id)
         comment.status = 'rejected'
         db.session.commit()
+        if comment.post_id:
+            invalidate_content_caches(f'post-{comment.post_id}')
         flash(f'Yorum reddedildi.', 'warning')
     except Exception as e:
         db.session.rollback()
@@ -896,8 +990,11 @@ def reject_comment(comment_id):
 def delete_comment(comment_id):
     try:
         comment = Comment.query.get_or_404(comment_id)
+        post_id = comment.post_id
         db.session.delete(comment)
         db.session.commit()
+        if post_id:
+            invalidate_content_caches(f'post-{post_id}')
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -909,21 +1006,21 @@ def delete_comment(comment_id):
 def admin_settings():
     try:
         # Add debug output
-        app.logger.info("Starting admin_settings route")
+        app.logger.debug("Starting admin_settings route")
         
         # First, ensure the current admin user is also in admin_users table
         sync_admin_user(current_user)
-        app.logger.info(f"Synced admin user: {current_user.username}")
+        app.logger.debug(f"Synced admin user: {current_user.username}")
         
         # Fetch admin users, email settings, and registration settings
         admins = AdminUser.query.order_by(AdminUser.username).all()
-        app.logger.info(f"Found {len(admins)} admin users")
+        app.logger.debug(f"Found {len(admins)} admin users")
         
         email_settings = EmailSettings.query.first()
-        app.logger.info(f"Email settings found: {email_settings is not None}")
+        app.logger.debug(f"Email settings found: {email_settings is not None}")
         
         registration_settings = RegistrationSettings.query.first()
-        app.logger.info(f"Registration settings found: {registration_settings is not None}")
+        app.logger.debug(f"Registration settings found: {registration_settings is not None}")
 
         # If no email settings exist, create default settings
         if not email_settings:
@@ -957,8 +1054,8 @@ def admin_settings():
             registration_settings = RegistrationSettings.query.first()
             app.logger.info("Committed default settings")
 
-        app.logger.info("Rendering admin/settings.html with all context variables")
-        app.logger.info(f"Template variables: admins={len(admins)}, email_settings={email_settings is not None}, registration_settings={registration_settings is not None}")
+        app.logger.debug("Rendering admin/settings.html with all context variables")
+        app.logger.debug(f"Template variables: admins={len(admins)}, email_settings={email_settings is not None}, registration_settings={registration_settings is not None}")
         
         return render_template('admin/settings.html',
                               admins=admins,
@@ -1134,13 +1231,14 @@ def admin_update_registration_settings():
 
 @app.route('/admin/videos')
 @login_required
+@listing_queries.budget(10)
 def admin_videos():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = 10 # Show 10 videos per page
         
         # Query videos with pagination
-        pagination = Video.query.order_by(Video.created_at.desc()).paginate(
+        pagination = listing_queries.videos().order_by(Video.created_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
         
@@ -1194,41 +1292,8 @@ def admin_new_video():
             
             thumbnail_url = None
             if thumbnail_file and thumbnail_file.filename:
-                # Check if Supabase integration is available
-                if supabase:
-                    # Upload to Supabase Storage
-                    thumbnail_url = upload_to_supabase(thumbnail_file, folder="video_thumbnails")
-                    if not thumbnail_url:
-                        app.logger.warning("Supabase upload failed, falling back to local storage")
-                        # Fall back to local storage if Supabase upload fails
-                        filename = secure_filename(f"video_thumb_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{thumbnail_file.filename}")
-                        image_path = os.path.join('static', 'uploads', filename)
-                        
-                        # Ensure uploads directory exists
-                        os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                        
-                        # Save the image
-                        thumbnail_file.save(image_path)
-                        
-                        # Resize image if needed
-                        resize_image(image_path)
-                        
-                        thumbnail_url = filename  # Store just the filename
-                else:
-                    # Supabase integration not available, use local storage
-                    filename = secure_filename(f"video_thumb_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{thumbnail_file.filename}")
-                    image_path = os.path.join('static', 'uploads', filename)
-                    
-                    # Ensure uploads directory exists
-                    os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                    
-                    # Save the image
-                    thumbnail_file.save(image_path)
-                    
-                    # Resize image if needed
-                    resize_image(image_path)
-                    
-                    thumbnail_url = filename  # Store just the filename
+                thumbnail_url = storage.save_upload(thumbnail_file, folder='video_thumbnails',
+                                                     prefix='video_thumb_', max_size=(800, 800))
 
             # Create new video
             new_video = Video(
@@ -1243,6 +1308,8 @@ def admin_new_video():
             
             db.session.add(new_video)
             db.session.commit()
+            search_index.index_video(new_video)
+            invalidate_content_caches('videos')
             
             flash('Video başarıyla eklendi!', 'success')
             return redirect(url_for('admin_videos'))
@@ -1282,12 +1349,7 @@ def admin_delete_video(video_id):
         
         # If the video has a thumbnail, try to delete it
         if video.thumbnail_url:
-            try:
-                thumbnail_path = os.path.join('static', 'uploads', video.thumbnail_url)
-                if os.path.exists(thumbnail_path):
-                    os.remove(thumbnail_path)
-            except Exception as e:
-                app.logger.error(f"Error removing thumbnail for video {video_id}: {str(e)}")
+            storage.delete(video.thumbnail_url)
         
         # Delete any comments associated with this video (should be handled by cascade)
         video_title = video.title  # Store title before deletion
@@ -1295,6 +1357,8 @@ def admin_delete_video(video_id):
         # Delete the video
         db.session.delete(video)
         db.session.commit()
+        search_index.remove_video(video_id)
+        invalidate_content_caches('videos')
         
         flash(f'"{video_title}" videosu başarıyla silindi.', 'success')
     except Exception as e:
@@ -1309,17 +1373,6 @@ def admin_delete_video(video_id):
 def admin_index():
     return redirect(url_for('admin_dashboard'))
 
-# Create a function to resize images to save space
-def resize_image(image_path, max_size=(800, 800)):
-    """Resize an image if it's larger than max_size"""
-    try:
-        img = Image.open(image_path)
-        if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-            img.thumbnail(max_size)
-            img.save(image_path)
-    except Exception as e:
-        app.logger.error(f"Error resizing image: {str(e)}")
-
 # File upload route for CKEditor
 @app.route('/upload', methods=['POST'])
 @login_required
@@ -1331,30 +1384,11 @@ def upload():
             return jsonify({'error': {'message': 'No file provided'}})
         
         if f and f.filename:
-            url = None
-            
-            # Check if Supabase integration is available
-            if supabase:
-                # Upload to Supabase Storage
-                url = upload_to_supabase(f, folder="editor")
-            
-            # If Supabase upload failed or is not available, fall back to local storage
-            if not url:
-                # Generate secure filename
-                filename = secure_filename(f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{f.filename}")
-                file_path = os.path.join('static', 'uploads', filename)
-                
-                # Ensure uploads directory exists
-                os.makedirs(os.path.join('static', 'uploads'), exist_ok=True)
-                
-                # Save the file
-                f.save(file_path)
-                
-                # Resize image if it's too large
-                resize_image(file_path)
-                
-                # Generate URL for CKEditor
-                url = url_for('static', filename=f"uploads/{filename}")
+            # Large images are scaled down before they are stored
+            stored = storage.save_upload(f, folder='editor', max_size=(800, 800))
+            if not stored:
+                raise RuntimeError(f"could not store {f.filename}")
+            url = storage.url(stored)
             
             # Return success response
             return jsonify({
@@ -1561,47 +1595,54 @@ def migrate_from_json():
 def search():
     try:
         query = request.args.get('search', '')
+        page = request.args.get('page', 1, type=int)
         
         if not query:
             return redirect(url_for('index'))
         
-        # Use database queries instead of JSON files
-        matching_posts = Post.query.filter(
-            (Post.title.ilike(f'%{query}%') | Post.content.ilike(f'%{query}%')),
-            Post.published == True
-        ).order_by(Post.created_at.desc()).all()
-        
-        matching_videos = Video.query.filter(
-            (Video.title.ilike(f'%{query}%') | Video.description.ilike(f'%{query}%')),
-            Video.published == True
-        ).order_by(Video.created_at.desc()).all()
+        # Ranked, paginated full-text matches with highlighted snippets
+        matching_posts = search_index.search_posts(query, page=page)
+        matching_videos = search_index.search_videos(query, page=page)
         
         return render_template('search.html', 
                               posts=matching_posts, 
                               videos=matching_videos, 
-                              query=query)
+                              query=query,
+                              page=page,
+                              has_prev=page > 1,
+                              has_next=matching_posts.has_next or matching_videos.has_next)
     except Exception as e:
         app.logger.error(f"Search error: {str(e)}")
         return render_template('errors/500.html')
 
 @app.route('/videos')
+@page_cache.cached(tags=('videos', 'categories'))
+@listing_queries.budget(4)
 def videos():
+    # Get all videos or filter by category if provided
+    category_slug = request.args.get('category')
+    category = category_registry.by_slug(category_slug) if category_slug else None
+    if category_slug and category is None:
+        abort(404)
+
     try:
-        # Get all videos or filter by category if provided
-        category_slug = request.args.get('category')
-        
-        if category_slug:
-            category = Category.query.filter_by(slug=category_slug).first_or_404()
-            videos_list = Video.query.filter_by(category_id=category.id, published=True).order_by(Video.created_at.desc()).all()
-        else:
-            videos_list = Video.query.filter_by(published=True).order_by(Video.created_at.desc()).all()
-            
-        return render_template('videos.html', videos=videos_list, category=category if category_slug else None)
+        query = Video.query.filter_by(published=True)
+        if category is not None:
+            query = query.filter_by(category_id=category.id)
+
+        # Newest first, one page at a time; ?cursor= continues after the last video shown
+        page = keyset_paginate(query, Video, request.args.get('cursor'), per_page_arg())
+        next_url = page.next_url('videos', category=category_slug)
+
+        if wants_fragment():
+            return fragment_response('partials/video_cards.html', next_url, videos=page.items)
+        return render_template('videos.html', videos=page, category=category, next_url=next_url)
     except Exception as e:
         app.logger.error(f"Videos list error: {str(e)}")
         return render_template('errors/500.html')
 
 @app.route('/manifesto')
+@page_cache.cached(tags=('categories',))
 def manifesto():
     return render_template('manifesto.html')
 
@@ -1609,26 +1650,40 @@ def manifesto():
 def inject_categories():
     """Make categories available to all templates"""
     try:
-        categories = Category.query.all()
-        return {'categories': categories}
+        return {'categories': category_registry.all()}
     except Exception as e:
         app.logger.error(f"Context processor error: {str(e)}")
         return {'categories': []}
 
 @app.route('/category/<slug>')
+@page_cache.cached(tags=('posts', 'videos', 'categories'))
+@listing_queries.budget(4)
 def category_posts(slug):
+    category = category_registry.by_slug(slug)
+    if category is None:
+        abort(404)
+
     try:
-        category = Category.query.filter_by(slug=slug).first_or_404()
-        
+        cursor = request.args.get('cursor')
+        per_page = per_page_arg()
+
         # Check if this is the video category
         if slug == 'video':
             # For video category, fetch videos instead of posts
-            videos = Video.query.filter_by(category_id=category.id, published=True).order_by(Video.created_at.desc()).all()
-            return render_template('videos.html', videos=videos, category=category)
+            query = Video.query.filter_by(category_id=category.id, published=True)
+            page = keyset_paginate(query, Video, cursor, per_page)
+            next_url = page.next_url('category_posts', slug=slug)
+            if wants_fragment():
+                return fragment_response('partials/video_cards.html', next_url, videos=page.items)
+            return render_template('videos.html', videos=page, category=category, next_url=next_url)
         else:
             # For other categories, fetch posts as before
-            posts = Post.query.filter_by(category_id=category.id, published=True).order_by(Post.created_at.desc()).all()
-            return render_template('category.html', category=category, posts=posts)
+            query = Post.query.filter_by(category_id=category.id, published=True)
+            page = keyset_paginate(query, Post, cursor, per_page)
+            next_url = page.next_url('category_posts', slug=slug)
+            if wants_fragment():
+                return fragment_response('partials/post_cards.html', next_url, posts=page.items)
+            return render_template('category.html', category=category, posts=page, next_url=next_url)
     except Exception as e:
         app.logger.error(f"Category posts error: {str(e)}")
         return render_template('errors/500.html')
@@ -1655,19 +1710,8 @@ def sync_admin_user(user):
 
 @app.route('/feed')
 def feed():
-    posts = Post.query.filter_by(published=True).order_by(Post.created_at.desc()).limit(20).all()
-    
-    # Get current time in Turkey timezone
-    turkey_tz = pytz.timezone('Europe/Istanbul')
-    now = turkey_tz.localize(datetime.now())
-    
-    feed_xml = render_template('feed.xml', 
-                              posts=posts, 
-                              site_url=request.url_root.rstrip('/'),
-                              last_build_date=rss_date_format(now))
-    response = make_response(feed_xml)
-    response.headers['Content-Type'] = 'application/rss+xml'
-    return response
+    # Built once per content change, served from memory (see feed_cache.py)
+    return feed_cache.response()
 
 # Import and register mobile API
 from mobile_api import register_mobile_api
@@ -0,0 +1,219 @@
+"""
+Fingerprinted static assets.
+
+``url_for('static', filename='css/style.css')`` is rewritten to
+``/static/css/style.<hash>.css``, where the hash is taken from the file's
+contents. Since a fingerprinted URL always refers to the same bytes, it is
+served with ``Cache-Control: immutable`` and a one-year lifetime; a changed
+file gets a new URL on the next deploy. Uploads are left alone.
+
+``build_assets.py`` (run at build time) writes the manifest and gzip/brotli
+copies of the CSS, JS and SVG files to ``ASSETS_BUILD_DIR``; these are sent
+with ``Content-Encoding`` to clients that accept them. Without a build, the
+files are hashed at startup (and again when they change) and served
+uncompressed. Set ``ASSETS_FINGERPRINT=0`` to serve plain static URLs.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import time
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip copies are built without it
+    brotli = None
+
+FINGERPRINT_EXTENSIONS = {'.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico',
+                          '.woff', '.woff2', '.ttf', '.eot', '.otf'}
+COMPRESS_EXTENSIONS = {'.css', '.js', '.svg'}
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+ONE_YEAR = 365 * 24 * 60 * 60
+IMMUTABLE_CACHE_CONTROL = f'public, max-age={ONE_YEAR}, immutable'
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprinted_name(filename, digest):
+    """css/style.css -> css/style.<first 12 hex digits>.css"""
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest[:12]}{ext}"
+
+
+def scan(static_folder, exclude=('uploads',)):
+    """Yield (filename, path) for every asset under static_folder worth fingerprinting"""
+    for root, dirs, files in os.walk(static_folder):
+        relative_root = os.path.relpath(root, static_folder).replace(os.sep, '/')
+        if relative_root == '.':
+            relative_root = ''
+            dirs[:] = [d for d in dirs if d not in exclude]
+        for name in files:
+            if os.path.splitext(name)[1].lower() in FINGERPRINT_EXTENSIONS:
+                filename = f"{relative_root}/{name}" if relative_root else name
+                yield filename, os.path.join(root, name)
+
+
+def compress(data):
+    """{encoding: compressed bytes} for the encodings that make data smaller"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def build(static_folder, build_dir, exclude=('uploads',)):
+    """Hash every asset, write compressed copies and the manifest to build_dir; return the manifest"""
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir, exist_ok=True)
+    files = {}
+    compressed = {}
+    for filename, path in scan(static_folder, exclude):
+        fingerprinted = fingerprinted_name(filename, file_digest(path))
+        files[filename] = fingerprinted
+        if os.path.splitext(filename)[1].lower() not in COMPRESS_EXTENSIONS:
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        variants = compress(data)
+        for encoding, suffix in ENCODINGS:
+            if encoding in variants:
+                target = os.path.join(build_dir, *f"{fingerprinted}{suffix}".split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as f:
+                    f.write(variants[encoding])
+        if variants:
+            compressed[fingerprinted] = sorted(variants)
+    manifest = {'built_at': time.time(), 'files': files, 'compressed': compressed}
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class AssetManifest:
+    """Rewrite static URLs to fingerprinted ones and serve those with far-future caching"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.build_dir = None
+        self.files = {}
+        self.sources = {}
+        self.compressed = {}
+        self.mtimes = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Load the built manifest (or hash the files) and take over the static route"""
+        self.app = app
+        app.config.setdefault('ASSETS_FINGERPRINT',
+                              os.environ.get('ASSETS_FINGERPRINT', '1').lower() in ('1', 'true', 'yes'))
+        app.config.setdefault('ASSETS_BUILD_DIR', os.environ.get(
+            'ASSETS_BUILD_DIR', os.path.join(app.root_path, 'build', 'static')))
+        self.enabled = app.config['ASSETS_FINGERPRINT'] and app.static_folder is not None
+        self.build_dir = app.config['ASSETS_BUILD_DIR']
+        app.extensions['assets'] = self
+        if not self.enabled:
+            return
+
+        self.load()
+        app.url_defaults(self._fingerprint_url)
+        app.view_functions['static'] = self.send_static_file
+
+    def load(self):
+        """Use the manifest from build_assets.py when it is current, else hash the files now"""
+        manifest = self._read_manifest()
+        if manifest is not None:
+            self.files = manifest['files']
+            self.compressed = {name: set(encodings) for name, encodings in manifest.get('compressed', {}).items()}
+            self.mtimes = None
+        else:
+            self.files = {}
+            self.mtimes = {}
+            for filename, path in scan(self.app.static_folder):
+                self.mtimes[filename] = os.path.getmtime(path)
+                self.files[filename] = fingerprinted_name(filename, file_digest(path))
+            self.compressed = {}
+        self.sources = {fingerprinted: filename for filename, fingerprinted in self.files.items()}
+        self.app.logger.info(f"Fingerprinted {len(self.files)} static assets "
+                             f"({'from build manifest' if manifest is not None else 'hashed at startup'})")
+
+    def url_filename(self, filename):
+        """Fingerprinted name of a static file (the name itself if it isn't an asset)"""
+        if self.mtimes is not None and filename in self.mtimes:
+            self._refresh(filename)
+        return self.files.get(filename, filename)
+
+    def send_static_file(self, filename):
+        source = self.sources.get(filename)
+        if source is None:
+            # Not a fingerprinted URL (uploads, or an asset requested by its plain name)
+            return self.app.send_static_file(filename)
+
+        response = self._send_compressed(filename, source)
+        if response is None:
+            response = send_from_directory(self.app.static_folder, source, max_age=ONE_YEAR)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _send_compressed(self, filename, source):
+        available = self.compressed.get(filename)
+        if not available:
+            return None
+        for encoding, suffix in ENCODINGS:
+            if encoding in available and request.accept_encodings[encoding]:
+                response = send_from_directory(self.build_dir, f"{filename}{suffix}", max_age=ONE_YEAR,
+                                               mimetype=mimetypes.guess_type(source)[0])
+                response.headers['Content-Encoding'] = encoding
+                return response
+        return None
+
+    def _refresh(self, filename):
+        # Without a build, pick up files edited while the app is running
+        path = os.path.join(self.app.static_folder, *filename.split('/'))
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime != self.mtimes[filename]:
+            fingerprinted = fingerprinted_name(filename, file_digest(path))
+            self.mtimes[filename] = mtime
+            self.files[filename] = fingerprinted
+            self.sources[fingerprinted] = filename
+
+    def _read_manifest(self):
+        path = os.path.join(self.build_dir, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            self.app.logger.warning(f"Ignoring unreadable asset manifest {path}: {e}")
+            return None
+        # A file edited after the build would be served under its old fingerprint
+        for filename, path in scan(self.app.static_folder):
+            if filename not in manifest['files'] or os.path.getmtime(path) > manifest['built_at']:
+                self.app.logger.warning(f"Asset manifest is older than {filename}; hashing files at startup")
+                return None
+        return manifest
+
+    def _fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.url_filename(values['filename'])
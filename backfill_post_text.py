@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Fill the derived plain-text fields (summary, word_count, reading_time) for
+existing posts.
+
+New and edited posts get them automatically; run this once after
+migrations.py has added the columns, or with --all after changing how the
+fields are computed.
+"""
+import logging
+import sys
+from app import app, db, Post
+import post_text
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    only_missing = '--all' not in sys.argv[1:]
+    with app.app_context():
+        logger.info(f"Deriving plain-text fields for {'posts missing them' if only_missing else 'all posts'}...")
+        count = post_text.backfill(db, Post, only_missing=only_missing)
+        logger.info(f"Updated {count} posts")
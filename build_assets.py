@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Build the front-end assets:
+
+1. with --vendor, download the pinned Bootstrap, Font Awesome, animate.css,
+   Google Fonts and jQuery files into static/vendor (needs network; the
+   Render build passes it)
+2. bundle, tree-shake and minify them with our CSS/JS into static/dist,
+   including the critical CSS inlined into index.html and post.html
+   (offline; skipped with a warning while static/vendor is incomplete)
+3. fingerprint the static assets and write gzip/brotli copies of the CSS,
+   JS and SVG files, so workers start without hashing anything and can
+   send compressed files straight from disk
+
+Run at build time (render.yaml does) after any change under static/ or
+templates/. Step 3 writes to ASSETS_BUILD_DIR (default build/static).
+"""
+import logging
+import os
+import sys
+import assets
+import bundles
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    root = os.path.dirname(os.path.abspath(__file__))
+    static_folder = os.path.join(root, 'static')
+    templates_folder = os.path.join(root, 'templates')
+    build_dir = os.environ.get('ASSETS_BUILD_DIR', os.path.join(root, 'build', 'static'))
+
+    if '--vendor' in sys.argv[1:]:
+        try:
+            downloaded = bundles.vendor(static_folder)
+        except Exception as e:
+            # Deploy anyway; pages fall back to the CDN links
+            logger.error(f"Downloading the vendor files failed: {str(e)}")
+        else:
+            logger.info(f"Downloaded {len(downloaded)} files into {os.path.join(static_folder, 'vendor')}")
+
+    missing = bundles.missing_vendor_files(static_folder)
+    if missing:
+        logger.warning(f"static/vendor is missing {', '.join(missing)}; pages keep the CDN links "
+                       f"(run with --vendor to download them)")
+    else:
+        sizes = bundles.build(static_folder, templates_folder)
+        for name, size in sorted(sizes.items()):
+            logger.info(f"static/dist/{name}: {size / 1024:.1f} KB")
+
+    if assets.brotli is None:
+        logger.warning("brotli is not installed; writing gzip copies only")
+    manifest = assets.build(static_folder, build_dir)
+    logger.info(f"Fingerprinted {len(manifest['files'])} assets, compressed {len(manifest['compressed'])} "
+                f"into {build_dir}")
@@ -0,0 +1,452 @@
+"""
+Self-hosted, bundled front-end assets.
+
+Instead of loading Bootstrap, Font Awesome, animate.css, Google Fonts and
+jQuery from five CDNs, pages load one CSS and one JS file from our own
+origin.
+
+``build_assets.py --vendor`` downloads the pinned files in ``VENDOR_CSS`` /
+``VENDOR_JS`` (and the fonts their stylesheets reference) into
+``static/vendor``. Those files are not in the repository: the Render build
+passes ``--vendor``, and a fresh checkout needs network access for it once.
+After that, ``build_assets.py`` runs without ``--vendor`` work offline:
+
+- CSS rules whose classes or ids appear nowhere in the templates or
+  scripts are dropped, along with keyframes and font faces nothing uses
+- the stylesheets are concatenated and minified into ``static/dist/site.css``
+  and the scripts into ``static/dist/site.js``
+- the rules needed by the part of ``index.html`` / ``post.html`` above the
+  ``{# critical-css-end #}`` marker are written to
+  ``static/dist/critical/<page>.css`` and inlined into those pages, which
+  then load the full bundle without blocking rendering
+
+Until a bundle has been built, ``base.html`` keeps using the CDN links.
+"""
+import os
+import re
+import shutil
+from urllib.parse import urljoin, urlsplit
+
+from flask import url_for
+from markupsafe import Markup
+
+import assets
+
+GOOGLE_FONTS_URL = ('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@400;500;600;700'
+                    '&family=Poppins:wght@300;400;500;600;700&display=swap')
+
+# (file in static/vendor, pinned source URL), in page order
+VENDOR_CSS = (
+    ('bootstrap.min.css', 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/css/bootstrap.min.css'),
+    ('fontawesome.min.css', 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css'),
+    ('fonts.css', GOOGLE_FONTS_URL),
+    ('animate.min.css', 'https://cdnjs.cloudflare.com/ajax/libs/animate.css/4.1.1/animate.min.css'),
+)
+VENDOR_JS = (
+    ('jquery.min.js', 'https://code.jquery.com/jquery-3.6.0.min.js'),
+    ('bootstrap.bundle.min.js', 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0-alpha1/dist/js/bootstrap.bundle.min.js'),
+)
+
+# Our own files loaded by base.html: (file in static, media query)
+SITE_CSS = (
+    ('css/style.css', None),
+    ('css/mobile.css', 'screen and (max-width: 768px)'),
+)
+SITE_JS = ('js/ajax-navigation.js',)
+
+CRITICAL_PAGES = ('index', 'post')
+CRITICAL_MARKER = '{# critical-css-end #}'
+
+# Class prefixes kept regardless of the templates: markup stored in post
+# bodies by CKEditor
+SAFELIST = ('image', 'table', 'text-', 'align-', 'ck-')
+
+# Google serves WOFF2 only to browsers it recognises
+FONTS_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                    '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+GROUPING_AT_RULES = ('@media', '@supports', '@layer', '@container', '@document')
+
+_COMMENT_OR_STRING = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_IMPORT_URL = re.compile(r'@import\s+(?:url\()?\s*[\'"]?([^\'")\s]+)')
+_FUNCTIONAL_PSEUDO = re.compile(r':(?:not|is|where|has|matches|-webkit-any|-moz-any)\((?:[^()]|\([^()]*\))*\)')
+_ATTRIBUTE = re.compile(r'\[[^\]]*\]')
+_SELECTOR_NAME = re.compile(r'[.#](-?[_a-zA-Z\\][\w\\-]*)')
+_TOKEN = re.compile(r'[A-Za-z_][\w-]*')
+# alert-{{ category }}, 'btn-' + kind, `bg-${name}`
+_DYNAMIC_PREFIX = re.compile(r'([A-Za-z][\w-]*-)(?:\{\{|[\'"]\s*\+|\$\{)')
+_TEMPLATE_IMPORT = re.compile(r'{%\s*(?:from|import|include)\s+[\'"]([^\'"]+)[\'"]')
+_FONT_FAMILY = re.compile(r'font-family\s*:\s*([\'"]?)([^;\'"}]+)\1', re.I)
+
+
+# --- CSS handling -----------------------------------------------------------
+
+def strip_comments(css):
+    return _COMMENT_OR_STRING.sub(lambda m: m.group(1) or '', css)
+
+
+def _skip_string(css, i):
+    quote = css[i]
+    i += 1
+    while i < len(css):
+        if css[i] == '\\':
+            i += 2
+            continue
+        if css[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def parse_css(css):
+    """
+    Split comment-free CSS into [(prelude, body)]: body is a list of rules
+    for @media and other grouping rules, the declaration text for other
+    blocks and None for statements such as @import.
+    """
+    rules = []
+    i = start = 0
+    n = len(css)
+    while i < n:
+        c = css[i]
+        if c in '"\'':
+            i = _skip_string(css, i)
+        elif c == ';':
+            prelude = css[start:i].strip()
+            if prelude:
+                rules.append((prelude, None))
+            i = start = i + 1
+        elif c == '{':
+            prelude = css[start:i].strip()
+            depth, j = 1, i + 1
+            while j < n and depth:
+                if css[j] in '"\'':
+                    j = _skip_string(css, j)
+                    continue
+                if css[j] == '{':
+                    depth += 1
+                elif css[j] == '}':
+                    depth -= 1
+                j += 1
+            inner = css[i + 1:j - 1]
+            if prelude.lower().startswith(GROUPING_AT_RULES):
+                rules.append((prelude, parse_css(inner)))
+            else:
+                rules.append((prelude, inner))
+            i = start = j
+        elif c == '}':
+            # Unbalanced brace; skip it like browsers do
+            i = start = i + 1
+        else:
+            i += 1
+    return rules
+
+
+def serialize_css(rules):
+    out = []
+    for prelude, body in rules:
+        if body is None:
+            out.append(f'{prelude};')
+        elif isinstance(body, list):
+            inner = serialize_css(body)
+            if inner:
+                out.append(f'{prelude}{{{inner}}}')
+        else:
+            out.append(f'{prelude}{{{body}}}')
+    return '\n'.join(out)
+
+
+def split_selectors(prelude):
+    """Split a selector list on top-level commas"""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(prelude):
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(prelude[start:i].strip())
+            start = i + 1
+    parts.append(prelude[start:].strip())
+    return [part for part in parts if part]
+
+
+def selector_used(selector, used, prefixes=()):
+    """Whether every class and id the selector requires is used somewhere"""
+    bare = _ATTRIBUTE.sub('', _FUNCTIONAL_PSEUDO.sub('', selector))
+    for name in _SELECTOR_NAME.findall(bare):
+        if '\\' in name or name in used or name.startswith(prefixes):
+            continue
+        return False
+    return True
+
+
+def purge_css(rules, used, prefixes=()):
+    """Drop selectors (and then rules) that need classes or ids outside used"""
+    kept = []
+    for prelude, body in rules:
+        if isinstance(body, list):
+            inner = purge_css(body, used, prefixes)
+            if inner:
+                kept.append((prelude, inner))
+        elif prelude.startswith('@'):
+            kept.append((prelude, body))
+        else:
+            selectors = [s for s in split_selectors(prelude) if selector_used(s, used, prefixes)]
+            if selectors:
+                kept.append((','.join(selectors), body))
+    return kept
+
+
+def _declarations(rules):
+    for prelude, body in rules:
+        if isinstance(body, list):
+            yield from _declarations(body)
+        elif body is not None and not _is_definition(prelude):
+            yield body
+
+
+def _is_definition(prelude):
+    lowered = prelude.lower()
+    return lowered.startswith('@font-face') or 'keyframes' in lowered.split(None, 1)[0]
+
+
+def prune_unreferenced(rules, keep_font_faces=True):
+    """Drop @keyframes and @font-face rules no remaining declaration refers to"""
+    text = '\n'.join(_declarations(rules))
+    families = {family.strip().strip('\'"').lower()
+                for match in _FONT_FAMILY.finditer(text)
+                for family in match.group(2).split(',')}
+
+    def keep(prelude, body):
+        lowered = prelude.lower()
+        if lowered.startswith('@font-face'):
+            match = _FONT_FAMILY.search(body or '')
+            return keep_font_faces and bool(match) and match.group(2).strip().lower() in families
+        if 'keyframes' in lowered.split(None, 1)[0]:
+            name = prelude.split(None, 1)[1].strip().strip('\'"') if ' ' in prelude else ''
+            return bool(re.search(rf'(?<![\w-]){re.escape(name)}(?![\w-])', text))
+        return True
+
+    def walk(items):
+        kept = []
+        for prelude, body in items:
+            if isinstance(body, list):
+                inner = walk(body)
+                if inner:
+                    kept.append((prelude, inner))
+            elif keep(prelude, body):
+                kept.append((prelude, body))
+        return kept
+    return walk(rules)
+
+
+def rewrite_urls(css, css_path, static_folder, url_path='/static'):
+    """Point relative url()s at absolute, fingerprinted static URLs"""
+    base = os.path.dirname(css_path)
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '#', '/')):
+            return match.group(0)
+        clean = re.split(r'[?#]', ref, 1)[0]
+        target = os.path.normpath(os.path.join(base, clean))
+        if not target.startswith(os.path.abspath(static_folder)) or not os.path.isfile(target):
+            return match.group(0)
+        filename = os.path.relpath(target, static_folder).replace(os.sep, '/')
+        if os.path.splitext(filename)[1].lower() in assets.FINGERPRINT_EXTENSIONS:
+            filename = assets.fingerprinted_name(filename, assets.file_digest(target))
+        return f'url("{url_path}/{filename}{ref[len(clean):]}")'
+    return _URL.sub(replace, css)
+
+
+# --- Template scanning ------------------------------------------------------
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def collect_used(texts):
+    """(tokens, dynamic class prefixes) found in template/script sources"""
+    used, prefixes = set(), set()
+    for text in texts:
+        used.update(_TOKEN.findall(text))
+        prefixes.update(_DYNAMIC_PREFIX.findall(text))
+    return used, prefixes
+
+
+def above_the_fold(templates_folder, page):
+    """Template source rendered above the critical marker of page.html"""
+    base = _read(os.path.join(templates_folder, 'base.html'))
+    header = base[base.find('<body'):base.find('{% block content %}')]
+    source = _read(os.path.join(templates_folder, f'{page}.html'))
+    start = source.find('{% block content %}')
+    end = source.find(CRITICAL_MARKER)
+    parts = [header, source[max(start, 0):end if end != -1 else len(source)]]
+    for name in _TEMPLATE_IMPORT.findall(source):
+        path = os.path.join(templates_folder, *name.split('/'))
+        if os.path.isfile(path):
+            parts.append(_read(path))
+    return '\n'.join(parts)
+
+
+def _walk_files(folder, extensions):
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1] in extensions:
+                yield os.path.join(root, name)
+
+
+# --- Vendoring and building -------------------------------------------------
+
+def vendor(static_folder):
+    """Download the pinned third-party files (and the fonts they use) into static/vendor"""
+    import httpx
+
+    vendor_dir = os.path.join(static_folder, 'vendor')
+    fonts_dir = os.path.join(vendor_dir, 'fonts')
+    os.makedirs(fonts_dir, exist_ok=True)
+    downloaded = []
+    with httpx.Client(headers={'User-Agent': FONTS_USER_AGENT}, follow_redirects=True, timeout=30) as client:
+        def fetch(url):
+            response = client.get(url)
+            response.raise_for_status()
+            return response
+
+        for name, url in VENDOR_CSS:
+            def localize(match, source=url):
+                ref = match.group(2).strip()
+                if ref.startswith('data:'):
+                    return match.group(0)
+                absolute = urljoin(source, ref)
+                fragment = f"#{urlsplit(absolute).fragment}" if urlsplit(absolute).fragment else ''
+                font_name = os.path.basename(urlsplit(absolute).path)
+                font_path = os.path.join(fonts_dir, font_name)
+                if not os.path.exists(font_path):
+                    with open(font_path, 'wb') as f:
+                        f.write(fetch(absolute).content)
+                    downloaded.append(font_path)
+                return f'url(fonts/{font_name}{fragment})'
+
+            css = _URL.sub(localize, fetch(url).text)
+            with open(os.path.join(vendor_dir, name), 'w', encoding='utf-8') as f:
+                f.write(css)
+            downloaded.append(os.path.join(vendor_dir, name))
+
+        for name, url in VENDOR_JS:
+            with open(os.path.join(vendor_dir, name), 'wb') as f:
+                f.write(fetch(url).content)
+            downloaded.append(os.path.join(vendor_dir, name))
+    return downloaded
+
+
+def missing_vendor_files(static_folder):
+    vendor_dir = os.path.join(static_folder, 'vendor')
+    return [name for name, _ in VENDOR_CSS + VENDOR_JS if not os.path.isfile(os.path.join(vendor_dir, name))]
+
+
+def build(static_folder, templates_folder):
+    """
+    Write static/dist/site.css, site.js and critical/<page>.css from the
+    vendored and site files; returns {output file: size in bytes}.
+    """
+    import rcssmin
+    import rjsmin
+
+    vendor_dir = os.path.join(static_folder, 'vendor')
+    dist_dir = os.path.join(static_folder, 'dist')
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(os.path.join(dist_dir, 'critical'))
+    sizes = {}
+
+    def write(name, text):
+        with open(os.path.join(dist_dir, *name.split('/')), 'w', encoding='utf-8') as f:
+            f.write(text)
+        sizes[name] = len(text.encode('utf-8'))
+
+    # Scripts: vendored files are already minified
+    scripts = [_read(os.path.join(vendor_dir, name)) for name, _ in VENDOR_JS]
+    scripts += [rjsmin.jsmin(_read(os.path.join(static_folder, *name.split('/')))) for name in SITE_JS]
+    write('site.js', '\n;'.join(scripts))
+
+    # Everything a class name can come from
+    sources = [_read(path) for path in _walk_files(templates_folder, {'.html', '.xml'})]
+    sources += [_read(path) for path in _walk_files(os.path.join(static_folder, 'js'), {'.js'})]
+    sources += scripts[:len(VENDOR_JS)]
+    used, prefixes = collect_used(sources)
+    prefixes = tuple(sorted(prefixes)) + SAFELIST
+
+    stylesheets = [(os.path.join(vendor_dir, name), None) for name, _ in VENDOR_CSS]
+    stylesheets += [(os.path.join(static_folder, *name.split('/')), media) for name, media in SITE_CSS]
+    parts = []
+    for path, media in stylesheets:
+        css = rewrite_urls(strip_comments(_read(path)), path, static_folder)
+        parts.append(f'@media {media}{{{css}}}' if media else css)
+    rules = parse_css('\n'.join(parts))
+
+    # The vendored stylesheets replace remote @imports of the same files; any
+    # other import has to come first to be honoured
+    vendored_urls = {url for _, url in VENDOR_CSS}
+    imports = [(prelude, body) for prelude, body in rules
+               if body is None and prelude.lower().startswith('@import')
+               and _IMPORT_URL.match(prelude) and _IMPORT_URL.match(prelude).group(1) not in vendored_urls]
+    rules = imports + [(prelude, body) for prelude, body in rules
+                       if not (body is None and prelude.lower().startswith(('@import', '@charset')))]
+
+    site_rules = prune_unreferenced(purge_css(rules, used, prefixes))
+    write('site.css', rcssmin.cssmin(serialize_css(site_rules)))
+
+    for page in CRITICAL_PAGES:
+        page_used, page_prefixes = collect_used([above_the_fold(templates_folder, page)])
+        critical = purge_css([rule for rule in site_rules if rule[1] is not None], page_used,
+                             tuple(sorted(page_prefixes)))
+        # Fonts arrive with the full bundle (text is shown in a fallback font until then)
+        critical = prune_unreferenced(critical, keep_font_faces=False)
+        write(f'critical/{page}.css', rcssmin.cssmin(serialize_css(critical)))
+    return sizes
+
+
+class AssetBundles:
+    """Emit the bundled stylesheet/script tags (with inlined critical CSS) for base.html"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.built = False
+        self.critical = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Use the bundles in static/dist when they exist and ASSET_BUNDLES is on"""
+        self.app = app
+        app.config.setdefault('ASSET_BUNDLES',
+                              os.environ.get('ASSET_BUNDLES', '1').lower() in ('1', 'true', 'yes'))
+        dist_dir = os.path.join(app.static_folder, 'dist')
+        self.built = app.config['ASSET_BUNDLES'] and all(
+            os.path.isfile(os.path.join(dist_dir, name)) for name in ('site.css', 'site.js'))
+        self.critical = {}
+        if self.built:
+            for page in CRITICAL_PAGES:
+                path = os.path.join(dist_dir, 'critical', f'{page}.css')
+                if os.path.isfile(path):
+                    # Nothing in a stylesheet may close the <style> element early
+                    self.critical[page] = _read(path).replace('</', '<\\/')
+        app.jinja_env.globals['asset_bundles'] = self
+        app.extensions['asset_bundles'] = self
+
+    def stylesheet_tags(self, page=None):
+        """Link to the CSS bundle; pages with critical CSS inline it and load the bundle without blocking"""
+        href = url_for('static', filename='dist/site.css')
+        critical = self.critical.get(page) if page else None
+        if not critical:
+            return Markup(f'<link rel="stylesheet" href="{href}">')
+        return Markup(
+            f'<style>{critical}</style>\n'
+            f'    <link rel="preload" href="{href}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+            f'    <noscript><link rel="stylesheet" href="{href}"></noscript>'
+        )
+
+    def script_tags(self):
+        return Markup(f'<script src="{url_for("static", filename="dist/site.js")}"></script>')
@@ -0,0 +1,42 @@
+"""
+Shared cache version stamps.
+
+Each gunicorn worker keeps its own in-memory caches. To invalidate them
+everywhere, a writer bumps a named stamp stored as a small file, and
+readers compare the stamp against the one their cached data was built for.
+"""
+import os
+import tempfile
+import threading
+import time
+
+VERSION_DIR = os.environ.get(
+    'CACHE_VERSION_DIR',
+    os.path.join(tempfile.gettempdir(), 'hepsihikaye-cache-versions')
+)
+
+
+def _path(name):
+    return os.path.join(VERSION_DIR, f'{name}.version')
+
+
+def current(name):
+    """Return the current stamp for name (0 if it was never bumped)"""
+    try:
+        with open(_path(name), 'r') as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def bump(name):
+    """Advance the stamp for name so every worker drops data built before now"""
+    os.makedirs(VERSION_DIR, exist_ok=True)
+    stamp = time.time_ns()
+    # One temp file per thread; threads of a gthread worker bump the same stamps
+    tmp_path = f'{_path(name)}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(stamp))
+    # Atomic replace so readers never see a partially written stamp
+    os.replace(tmp_path, _path(name))
+    return stamp
@@ -0,0 +1,82 @@
+"""
+Per-worker category registry.
+
+Categories change rarely but are needed by every template (navigation) and
+by the category/video listings. They are loaded once per worker into an
+immutable snapshot with slug and id indexes, and reloaded only after
+``CategoryRegistry.invalidate`` is called from one of the category admin
+routes (in any worker).
+"""
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import cache_versions
+
+VERSION_NAME = 'categories'
+
+CategoryInfo = namedtuple('CategoryInfo', ['id', 'name', 'slug'])
+
+
+class CategorySnapshot:
+    """Immutable view of all categories with slug and id lookups"""
+
+    def __init__(self, categories):
+        self.categories = tuple(categories)
+        self.by_slug = MappingProxyType({category.slug: category for category in self.categories})
+        self.by_id = MappingProxyType({category.id: category for category in self.categories})
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+
+class CategoryRegistry:
+    """Serve categories from memory, reloading when another worker changes them"""
+
+    def __init__(self, app=None, db=None, model=None):
+        self.app = None
+        self.model = None
+        self._snapshot = None
+        self._version = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        """Bind the registry to the app and the Category model"""
+        self.app = app
+        self.model = model
+        app.extensions['category_registry'] = self
+
+    def snapshot(self):
+        """Return the current CategorySnapshot, loading it if stale"""
+        version = cache_versions.current(VERSION_NAME)
+        snapshot = self._snapshot
+        if snapshot is not None and self._version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None and self._version == version:
+                return self._snapshot
+            categories = self.model.query.order_by(self.model.id).all()
+            self._snapshot = CategorySnapshot(
+                CategoryInfo(category.id, category.name, category.slug) for category in categories
+            )
+            self._version = version
+            return self._snapshot
+
+    def all(self):
+        return self.snapshot().categories
+
+    def by_slug(self, slug):
+        return self.snapshot().by_slug.get(slug)
+
+    def by_id(self, category_id):
+        return self.snapshot().by_id.get(category_id)
+
+    def invalidate(self):
+        """Make every worker reload categories on next use"""
+        self._snapshot = None
+        cache_versions.bump(VERSION_NAME)
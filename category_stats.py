@@ -0,0 +1,122 @@
+"""
+Post and video counts per category.
+
+``CATEGORY_COUNTS`` selects how the counts are obtained:
+
+- ``grouped`` (default): one query with two ``GROUP BY category_id``
+  subqueries joined to the category table
+- ``denormalized``: read the ``category.post_count`` / ``category.video_count``
+  columns, which are kept up to date by ORM hooks on post and video inserts,
+  deletes and category changes. Run ``CategoryStats.recount`` (migrations.py
+  does) after switching to this mode or after bulk changes made outside the ORM.
+"""
+import os
+from collections import namedtuple
+
+from sqlalchemy import event, func, inspect, select
+
+CategoryCounts = namedtuple('CategoryCounts', ['posts', 'videos'])
+
+EMPTY_COUNTS = CategoryCounts(0, 0)
+
+
+class CategoryStats:
+    """Serve per-category post/video counts without a query per category"""
+
+    def __init__(self, app=None, db=None, category_model=None, post_model=None, video_model=None):
+        self.app = None
+        self.db = None
+        self.Category = None
+        self.Post = None
+        self.Video = None
+        self.mode = 'grouped'
+        if app is not None:
+            self.init_app(app, db, category_model, post_model, video_model)
+
+    def init_app(self, app, db, category_model, post_model, video_model):
+        """Bind to the models and install the counter hooks in denormalized mode"""
+        self.app = app
+        self.db = db
+        self.Category = category_model
+        self.Post = post_model
+        self.Video = video_model
+        app.config.setdefault('CATEGORY_COUNTS', os.environ.get('CATEGORY_COUNTS', 'grouped'))
+        self.mode = app.config['CATEGORY_COUNTS']
+        if self.mode not in ('grouped', 'denormalized'):
+            app.logger.warning(f"Unknown CATEGORY_COUNTS '{self.mode}', using grouped counts")
+            self.mode = 'grouped'
+        if self.mode == 'denormalized':
+            self._install_hooks()
+        app.extensions['category_stats'] = self
+
+    def counts(self):
+        """Return {category_id: CategoryCounts} for every category"""
+        Category = self.Category
+        if self.mode == 'denormalized':
+            statement = select(Category.id, Category.post_count, Category.video_count)
+        else:
+            posts = self._grouped(self.Post)
+            videos = self._grouped(self.Video)
+            statement = select(Category.id, posts.c.total, videos.c.total) \
+                .outerjoin(posts, posts.c.category_id == Category.id) \
+                .outerjoin(videos, videos.c.category_id == Category.id)
+        return {
+            category_id: CategoryCounts(post_count or 0, video_count or 0)
+            for category_id, post_count, video_count in self.db.session.execute(statement)
+        }
+
+    def get(self, category_id):
+        """Counts for one category"""
+        return self.counts().get(category_id, EMPTY_COUNTS)
+
+    def recount(self):
+        """Rewrite the denormalized counters from the post and video tables"""
+        table = self.Category.__table__
+        self.db.session.execute(table.update().values(
+            post_count=self._count_for(self.Post, table),
+            video_count=self._count_for(self.Video, table),
+        ))
+        self.db.session.commit()
+
+    @staticmethod
+    def _grouped(model):
+        return select(model.category_id, func.count().label('total')) \
+            .where(model.category_id.isnot(None)) \
+            .group_by(model.category_id) \
+            .subquery()
+
+    @staticmethod
+    def _count_for(model, category_table):
+        return select(func.count()).select_from(model.__table__) \
+            .where(model.category_id == category_table.c.id) \
+            .scalar_subquery()
+
+    def _install_hooks(self):
+        for model, column in ((self.Post, 'post_count'), (self.Video, 'video_count')):
+            event.listen(model, 'after_insert', self._make_hook(column, 'insert'))
+            event.listen(model, 'after_update', self._make_hook(column, 'update'))
+            event.listen(model, 'after_delete', self._make_hook(column, 'delete'))
+
+    def _make_hook(self, column, kind):
+        table = self.Category.__table__
+
+        def bump(connection, category_id, delta):
+            if category_id is not None:
+                connection.execute(
+                    table.update().where(table.c.id == category_id)
+                    .values({column: func.coalesce(table.c[column], 0) + delta})
+                )
+
+        def hook(mapper, connection, target):
+            if kind == 'insert':
+                bump(connection, target.category_id, 1)
+            elif kind == 'delete':
+                bump(connection, target.category_id, -1)
+            else:
+                history = inspect(target).attrs.category_id.history
+                if history.has_changes():
+                    for old_id in history.deleted:
+                        bump(connection, old_id, -1)
+                    for new_id in history.added:
+                        bump(connection, new_id, 1)
+        return hook
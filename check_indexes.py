@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Verify that the hot queries of the public routes and the mobile API use an
+index.
+
+Each query below is built the way app.py / mobile_api.py build it and run
+through EXPLAIN (EXPLAIN QUERY PLAN on SQLite). A query fails when the plan
+scans its table sequentially, or, for newest-first listings, sorts the rows
+instead of reading them in index order. On PostgreSQL sequential scans are
+disabled for the check so small tables still show whether an index *can*
+serve the query. Exits non-zero if any query fails; run after migrations.py.
+"""
+import logging
+import re
+import sys
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import app, db, Post, Video, Comment, listing_queries
+from pagination import encode_cursor, keyset_query
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CURSOR = encode_cursor(datetime(2024, 1, 1), 1000)
+
+
+def hot_queries():
+    """(description, table, ordered, query) for every hot path"""
+    published_posts = Post.query.filter_by(published=True)
+    return [
+        ('homepage trending posts', 'post', True,
+         published_posts.order_by(Post.trending_score.desc()).limit(3)),
+        ('homepage recent posts', 'post', True,
+         Post.query.filter(Post.published == True, ~Post.id.in_([1, 2, 3]))
+         .order_by(Post.created_at.desc()).limit(6)),
+        ('homepage recent videos', 'video', True,
+         Video.query.filter_by(published=True).order_by(Video.created_at.desc()).limit(3)),
+        ('RSS feed', 'post', True,
+         db.session.query(Post.id, Post.updated_at, Post.created_at).filter(Post.published == True)
+         .order_by(Post.created_at.desc()).limit(20)),
+        ('category page', 'post', True,
+         keyset_query(Post.query.filter_by(category_id=1, published=True), Post)),
+        ('category page, next page', 'post', True,
+         keyset_query(Post.query.filter_by(category_id=1, published=True), Post, CURSOR)),
+        ('mobile feed', 'post', True,
+         listing_queries.posts(with_author=True, with_content=False).filter_by(published=True)
+         .order_by(Post.created_at.desc()).limit(10).offset(10)),
+        ('mobile feed by category', 'post', True,
+         listing_queries.posts(with_author=True, with_content=False).filter_by(published=True)
+         .filter_by(category_id=1).order_by(Post.created_at.desc()).limit(10)),
+        ('mobile public post', 'post', False,
+         Post.query.filter_by(id=1, published=True)),
+        ('feed validators', 'post', False,
+         db.session.query(func.max(func.coalesce(Post.updated_at, Post.created_at)), func.count(Post.id))
+         .filter(Post.published == True)),
+        ('admin post list', 'post', True,
+         listing_queries.posts().order_by(Post.created_at.desc()).limit(20)),
+        ('videos page', 'video', True,
+         keyset_query(Video.query.filter_by(published=True), Video)),
+        ('videos page, next page', 'video', True,
+         keyset_query(Video.query.filter_by(published=True), Video, CURSOR)),
+        ('video category page', 'video', True,
+         keyset_query(Video.query.filter_by(category_id=1, published=True), Video)),
+        ('admin video list', 'video', True,
+         listing_queries.videos().order_by(Video.created_at.desc()).limit(20)),
+        ('post comments', 'comment', False,
+         Comment.query.filter_by(post_id=1, status='approved')),
+        ('video comments', 'comment', False,
+         Comment.query.filter_by(video_id=1)),
+        ('mobile comments by status', 'comment', True,
+         listing_queries.comments().filter_by(status='pending').order_by(Comment.created_at.desc()).limit(20)),
+    ]
+
+
+def explain(connection, query):
+    """Plan lines for query on the current connection"""
+    compiled = query.statement.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql(f"EXPLAIN {compiled}", params).fetchall()
+    return [row[0] for row in rows]
+
+
+def problems(dialect, plan, table, ordered):
+    """Why plan doesn't serve the query from an index (empty if it does)"""
+    text = '\n'.join(plan)
+    found = []
+    if dialect == 'sqlite':
+        if re.search(rf'^SCAN {table}\b(?! USING)', text, re.MULTILINE):
+            found.append(f'scans {table}')
+        if ordered and 'USE TEMP B-TREE FOR ORDER BY' in text:
+            found.append('sorts rows')
+    else:
+        if re.search(rf'Seq Scan on {table}\b', text):
+            found.append(f'scans {table}')
+        if ordered and re.search(r'^\s*(->\s*)?Sort\b', text, re.MULTILINE):
+            found.append('sorts rows')
+    return found
+
+
+def check():
+    failures = 0
+    with app.app_context():
+        with db.engine.connect() as connection:
+            dialect = connection.dialect.name
+            if dialect == 'postgresql':
+                connection.exec_driver_sql("SET enable_seqscan = off")
+            for description, table, ordered, query in hot_queries():
+                plan = explain(connection, query)
+                found = problems(dialect, plan, table, ordered)
+                if found:
+                    failures += 1
+                    logger.error(f"{description}: {', '.join(found)}\n    " + '\n    '.join(plan))
+                else:
+                    logger.info(f"{description}: uses an index")
+    return failures
+
+
+if __name__ == '__main__':
+    failed = check()
+    if failed:
+        logger.error(f"{failed} hot queries are not served by an index")
+        sys.exit(1)
+    logger.info("All hot queries use an index")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Verify that the listing views stay within their query budgets.
+
+Each listing (home page, category and video pages, the public mobile feed
+and the admin lists) is requested through the test client with
+``TESTING`` on, which makes ``ListingQueries.budget`` raise
+``QueryBudgetExceeded`` instead of logging a warning. The page and
+homepage caches are bypassed so every view builds its page from the
+database. Exits non-zero if any view goes over its budget; run it with
+each ``RATING_MODE`` the site may use.
+"""
+import logging
+import sys
+
+from app import app, User, category_registry, homepage_cache, page_cache
+from queries import QueryBudgetExceeded
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ADMIN_URLS = ['/admin/dashboard', '/admin/posts', '/admin/categories', '/admin/comments', '/admin/videos']
+
+
+def public_urls():
+    """Every public listing, first page and infinite-scroll fragment"""
+    urls = ['/', '/videos', '/videos?fragment=1', '/api/v1/public/feed']
+    for category in category_registry.all():
+        urls.append(f'/category/{category.slug}')
+        urls.append(f'/category/{category.slug}?fragment=1')
+        urls.append(f'/videos?category={category.slug}')
+    return urls
+
+
+def request(client, url):
+    """Request url; returns the failure message, or None if it stayed within budget"""
+    # Rebuild the home page lists instead of reading them from memory
+    homepage_cache.invalidate()
+    try:
+        response = client.get(url)
+    except QueryBudgetExceeded as e:
+        return str(e)
+    if response.status_code >= 500:
+        return f"responded {response.status_code}"
+    timing = response.headers.get('Server-Timing', '')
+    logger.info(f"{url}: {response.status_code} {timing}")
+    return None
+
+
+def check():
+    app.config['TESTING'] = True
+    page_cache.enabled = False
+    failures = 0
+    with app.app_context():
+        urls = public_urls()
+        admin = User.query.first()
+
+    client = app.test_client()
+    for url in urls:
+        failure = request(client, url)
+        if failure:
+            failures += 1
+            logger.error(f"{url}: {failure}")
+
+    if admin is None:
+        logger.warning("No user to log in with; skipping the admin lists")
+        return failures
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    for url in ADMIN_URLS:
+        failure = request(client, url)
+        if failure:
+            failures += 1
+            logger.error(f"{url}: {failure}")
+    return failures
+
+
+if __name__ == '__main__':
+    failed = check()
+    if failed:
+        logger.error(f"{failed} listing views went over their query budget")
+        sys.exit(1)
+    logger.info("All listing views are within their query budgets")
@@ -0,0 +1,179 @@
+"""
+gzip/brotli compression of responses.
+
+Text responses (HTML, JSON, RSS/XML, CSS, JS, SVG) of at least
+``COMPRESS_MIN_SIZE`` bytes are compressed with the best encoding the
+client accepts: brotli (when the package is installed) or gzip. Media
+types that are already compressed, streamed or file responses, and
+responses that already carry a ``Content-Encoding`` are sent as they are.
+
+Cached pages are compressed once per content version instead of per
+request: ``PageCache`` stores the encoded variants built by
+``encode_entry`` next to the page and ``PageCache`` hits are answered
+with ``respond_encoded``. Cached pages embed a per-visitor CSRF token, so
+their gzip variant is stored as separately compressed deflate segments
+around the token; on a hit only the visitor's token is compressed and
+spliced in. Brotli streams can't be spliced, so brotli variants are only
+kept for pages without a token.
+"""
+import os
+import struct
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/xml', 'text/javascript', 'text/csv',
+    'application/json', 'application/xml', 'application/rss+xml', 'application/atom+xml',
+    'application/javascript', 'application/manifest+json', 'image/svg+xml',
+}
+
+# gzip header: no file name, mtime 0, unknown OS
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# Cached variants are built once, so they get the slower, smaller settings
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+
+
+def _deflate(data, level, final):
+    """Raw deflate segment; non-final segments end byte-aligned so they can be concatenated"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_FULL_FLUSH)
+
+
+def gzip_segments(parts, level=CACHED_GZIP_LEVEL):
+    """Compress parts separately so a gzip stream can be assembled around replaceable text"""
+    return [_deflate(part, level, final=(i == len(parts) - 1)) for i, part in enumerate(parts)]
+
+
+def assemble_gzip(parts, segments, separator=b'', level=CACHED_GZIP_LEVEL):
+    """gzip body for separator.join(parts) from the precompressed segments of parts"""
+    out = [GZIP_HEADER]
+    crc = 0
+    size = 0
+    glue = _deflate(separator, level, final=False) if separator else b''
+    for i, (part, segment) in enumerate(zip(parts, segments)):
+        if i:
+            out.append(glue)
+            crc = zlib.crc32(separator, crc)
+            size += len(separator)
+        out.append(segment)
+        crc = zlib.crc32(part, crc)
+        size += len(part)
+    out.append(struct.pack('<II', crc & 0xffffffff, size & 0xffffffff))
+    return b''.join(out)
+
+
+def is_compressible(response, min_size):
+    if request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.content_length is None or response.content_length >= min_size
+
+
+class Compression:
+    """Negotiate and apply response compression"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.min_size = 500
+        self.level = 6
+        self.brotli_quality = 4
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Compress responses after each request according to COMPRESS_* settings"""
+        self.app = app
+        app.config.setdefault('COMPRESS_RESPONSES',
+                              os.environ.get('COMPRESS_RESPONSES', '1').lower() in ('1', 'true', 'yes'))
+        app.config.setdefault('COMPRESS_MIN_SIZE', int(os.environ.get('COMPRESS_MIN_SIZE', 500)))
+        app.config.setdefault('COMPRESS_LEVEL', int(os.environ.get('COMPRESS_LEVEL', 6)))
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4)))
+        self.enabled = app.config['COMPRESS_RESPONSES']
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.level = app.config['COMPRESS_LEVEL']
+        self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+        app.after_request(self.compress_response)
+        app.extensions['compression'] = self
+
+    @property
+    def encodings(self):
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self, available=None):
+        """Best encoding the client accepts (among available), or None"""
+        offered = [e for e in self.encodings if available is None or e in available]
+        if not self.enabled or not offered:
+            return None
+        return request.accept_encodings.best_match(offered)
+
+    def compress_response(self, response):
+        if not self.enabled or not is_compressible(response, self.min_size):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            compressed = GZIP_HEADER + _deflate(body, self.level, final=True) + \
+                struct.pack('<II', zlib.crc32(body) & 0xffffffff, len(body) & 0xffffffff)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        self._weaken_etag(response)
+        return response
+
+    # --- cached pages ---------------------------------------------------------
+
+    def encode_entry(self, body, token=None):
+        """Encoded variants of a cached page body whose token (bytes or None) is swapped per visitor"""
+        if not self.enabled or len(body) < self.min_size:
+            return {}
+        parts = body.split(token) if token else [body]
+        variants = {'gzip': gzip_segments(parts)}
+        if brotli is not None and len(parts) == 1:
+            variants['br'] = brotli.compress(body, quality=CACHED_BROTLI_QUALITY)
+        return variants
+
+    def respond_encoded(self, response, body, variants, token=None, new_token=None):
+        """Send a cached page in its best precompressed variant (response already holds the plain body)"""
+        if not variants or not is_compressible(response, self.min_size):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(variants)
+        if encoding is None:
+            return response
+        if encoding == 'br':
+            response.set_data(variants['br'])
+        else:
+            parts = body.split(token) if token else [body]
+            response.set_data(assemble_gzip(parts, variants['gzip'], new_token or b''))
+        response.headers['Content-Encoding'] = encoding
+        self._weaken_etag(response)
+        return response
+
+    @staticmethod
+    def _weaken_etag(response):
+        # The encoded bytes differ from the identity representation; a weak
+        # validator still lets If-None-Match revalidate against the view's ETag
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
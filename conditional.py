@@ -0,0 +1,188 @@
+"""
+Conditional GET for post pages and the mobile API.
+
+A view wrapped by ``ConditionalGet.post`` or ``ConditionalGet.listing``
+gets an ETag (and, for responses that are the same for every visitor, a
+Last-Modified date) computed *before* the view runs from cheap state:
+the post's ``updated_at`` (or the newest ``updated_at`` and the number of
+published posts for listings) and the page cache tag stamps bumped by
+every write (see cache_versions.py). A request whose ``If-None-Match`` /
+``If-Modified-Since`` still matches is answered with a 304 without
+rendering a template or serializing JSON.
+
+View and like counts are shown live, so responses that include them are
+treated as unchanged for at most ``CONDITIONAL_GET_LIVE_WINDOW`` seconds.
+HTML pages embed a per-visitor CSRF token, so their validator also covers
+the visitor's session (``per_visitor``) and no 304 is sent while flash
+messages are pending. ``CONDITIONAL_GET_VERSION`` (the deployed commit on
+Render) changes every validator on a new release.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import g, request, session
+from flask_login import current_user
+from sqlalchemy import func
+from werkzeug.http import is_resource_modified
+
+import cache_versions
+
+
+def _timestamp(value):
+    # Model timestamps are naive UTC (datetime.utcnow)
+    if value is None:
+        return 0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ConditionalGet:
+    """ETag/Last-Modified validators checked before views run"""
+
+    def __init__(self, app=None, db=None, post_model=None):
+        self.app = None
+        self.db = db
+        self.Post = post_model
+        self.enabled = True
+        self.live_window = 60
+        self.version = ''
+        if app is not None:
+            self.init_app(app, db, post_model)
+
+    def init_app(self, app, db=None, post_model=None):
+        """Read CONDITIONAL_GET_* settings"""
+        self.app = app
+        self.db = db or self.db
+        self.Post = post_model or self.Post
+        app.config.setdefault('CONDITIONAL_GET',
+                              os.environ.get('CONDITIONAL_GET', '1').lower() in ('1', 'true', 'yes'))
+        app.config.setdefault('CONDITIONAL_GET_LIVE_WINDOW',
+                              int(os.environ.get('CONDITIONAL_GET_LIVE_WINDOW', 60)))
+        app.config.setdefault('CONDITIONAL_GET_VERSION', os.environ.get(
+            'CONDITIONAL_GET_VERSION', os.environ.get('RENDER_GIT_COMMIT', '')))
+        self.enabled = app.config['CONDITIONAL_GET']
+        self.live_window = max(1, app.config['CONDITIONAL_GET_LIVE_WINDOW'])
+        self.version = app.config['CONDITIONAL_GET_VERSION']
+        app.extensions['conditional_get'] = self
+
+    # --- validators -----------------------------------------------------------
+
+    def post_state(self, post_id, published_only=False):
+        """(parts, last modified timestamp) of one post, or None if it doesn't exist"""
+        Post = self.Post
+        query = self.db.session.query(Post.updated_at, Post.created_at).filter(Post.id == post_id)
+        if published_only:
+            query = query.filter(Post.published == True)
+        row = query.first()
+        if row is None:
+            return None
+        modified = max(_timestamp(row.updated_at), _timestamp(row.created_at))
+        return [post_id, modified], modified
+
+    def listing_state(self, category_id=None):
+        """(parts, last modified timestamp) of the published posts, optionally in one category"""
+        Post = self.Post
+        query = self.db.session.query(
+            func.max(func.coalesce(Post.updated_at, Post.created_at)), func.count(Post.id)
+        ).filter(Post.published == True)
+        if category_id:
+            query = query.filter(Post.category_id == category_id)
+        newest, count = query.one()
+        modified = _timestamp(newest)
+        return [category_id, modified, count], modified
+
+    # --- decorators -----------------------------------------------------------
+
+    def post(self, tags=(), published_only=False, live=True, per_visitor=False, on_not_modified=None):
+        """
+        Conditional GET for a view taking post_id. The post-<id> tag is
+        always included; tags adds further page cache tags the response
+        depends on.
+        """
+        def state(**kwargs):
+            post_id = kwargs['post_id']
+            return self.post_state(post_id, published_only), (f'post-{post_id}',) + tuple(tags)
+        return self.conditional(state, live=live, per_visitor=per_visitor, on_not_modified=on_not_modified)
+
+    def listing(self, tags=('posts',), category_arg=None, live=False, per_visitor=False):
+        """Conditional GET for a list of published posts (category_arg: query argument filtering it)"""
+        def state(**kwargs):
+            category_id = request.args.get(category_arg, type=int) if category_arg else None
+            return self.listing_state(category_id), tuple(tags)
+        return self.conditional(state, live=live, per_visitor=per_visitor)
+
+    def conditional(self, state, live=False, per_visitor=False, on_not_modified=None):
+        """
+        Decorator answering matching conditional requests with a 304.
+
+        state is called with the view arguments and returns
+        ((parts, last_modified) or None, tags); None runs the view without
+        validators (e.g. to let it 404). on_not_modified is called with the
+        view arguments when a 304 is sent.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                    return view(*args, **kwargs)
+                try:
+                    current, tags = state(**kwargs)
+                except Exception as e:
+                    self.app.logger.error(f"Conditional GET validator failed for {request.path}: {str(e)}")
+                    current = None
+                if current is None:
+                    return view(*args, **kwargs)
+
+                parts, last_modified = self._validators(current, tags, live)
+                if per_visitor:
+                    last_modified = None
+                etag = self._etag(parts, per_visitor)
+                if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                    if on_not_modified is not None:
+                        on_not_modified(*args, **kwargs)
+                    response = self.app.response_class(status=304)
+                else:
+                    response = self.app.make_response(view(*args, **kwargs))
+                    # Routes render the error templates with a 200 status (see page_cache.py)
+                    if response.status_code != 200 or \
+                            any(name.startswith('errors/') for name in g.get('rendered_templates', [])):
+                        return response
+                    if per_visitor:
+                        # Rendering may have given the visitor their first CSRF token
+                        etag = self._etag(parts, per_visitor)
+                response.set_etag(etag, weak=True)
+                if last_modified is not None:
+                    response.last_modified = last_modified
+                response.headers.setdefault('Cache-Control', 'no-cache')
+                if per_visitor:
+                    response.vary.add('Cookie')
+                return response
+            return wrapper
+        return decorator
+
+    def _validators(self, current, tags, live):
+        parts, modified = current
+        parts = [self.version] + list(parts)
+        for tag in tags:
+            stamp = cache_versions.current(f'page-{tag}')
+            parts.append(stamp)
+            modified = max(modified, stamp / 1e9)
+        if live:
+            # Buffered view/like counts move all the time; revalidate them per window
+            window = int(time.time() // self.live_window)
+            parts.append(window)
+            modified = max(modified, window * self.live_window)
+        return parts, datetime.fromtimestamp(int(modified), timezone.utc)
+
+    @staticmethod
+    def _etag(parts, per_visitor):
+        if per_visitor:
+            # The page embeds the visitor's CSRF token (rotated with the session).
+            # Only the ETag can tell visitors apart, so such pages get no Last-Modified
+            parts = parts + [current_user.get_id() if current_user.is_authenticated else '',
+                             session.get('csrf_token', ''), int(time.time() // 1800)]
+        return hashlib.sha1(':'.join(map(str, parts)).encode('utf-8')).hexdigest()
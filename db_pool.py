@@ -0,0 +1,139 @@
+"""
+Database connection pool settings and metrics.
+
+``DatabasePool`` fills ``SQLALCHEMY_ENGINE_OPTIONS`` before the engine is
+created: a bounded pool per worker (``DB_POOL_SIZE`` + ``DB_MAX_OVERFLOW``
+connections, waiting at most ``DB_POOL_TIMEOUT`` seconds for one), stale
+connections replaced after ``DB_POOL_RECYCLE`` seconds and checked with a
+ping before use. Connections opened before a fork (gunicorn's
+``preload_app``) are dropped in the child so no two processes share one.
+
+``DB_PGBOUNCER=1`` adapts the engine to a PgBouncer (or Supabase pooler) in
+transaction pooling mode: no server-side prepared statements, no
+session-level settings sent at connect time, and a smaller local pool since
+PgBouncer does the pooling.
+
+``stats()`` reports pool occupancy and connect/checkout/invalidation counts
+per engine; admins can read them at ``/admin/db-pool``.
+"""
+import os
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+class DatabasePool:
+    """Engine options for the configured database and pool metrics"""
+
+    def __init__(self, app=None, database_url=None):
+        self.app = None
+        self.pgbouncer = False
+        self._engines = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, database_url)
+
+    def init_app(self, app, database_url=None):
+        """Set SQLALCHEMY_ENGINE_OPTIONS from DB_POOL_* settings (call before SQLAlchemy(app))"""
+        self.app = app
+        database_url = database_url or app.config.get('SQLALCHEMY_DATABASE_URI')
+        app.config.setdefault('DB_PGBOUNCER', os.environ.get('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes'))
+        self.pgbouncer = app.config['DB_PGBOUNCER']
+        app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', 2 if self.pgbouncer else 5)))
+        app.config.setdefault('DB_MAX_OVERFLOW', int(os.environ.get('DB_MAX_OVERFLOW', 5)))
+        app.config.setdefault('DB_POOL_TIMEOUT', int(os.environ.get('DB_POOL_TIMEOUT', 10)))
+        app.config.setdefault('DB_POOL_RECYCLE', int(os.environ.get('DB_POOL_RECYCLE', 1800)))
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', self.engine_options(database_url))
+        app.extensions['database_pool'] = self
+        # Any forking server, not just gunicorn: children must not reuse the parent's sockets
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def engine_options(self, database_url):
+        """create_engine() keyword arguments for database_url"""
+        if not database_url:
+            return {}
+        url = make_url(database_url)
+        if url.get_backend_name() == 'sqlite':
+            # A local file; SQLAlchemy's default pool for it is fine
+            return {}
+
+        config = self.app.config
+        options = {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+        }
+        if self.pgbouncer:
+            connect_args = {}
+            if url.get_driver_name() == 'psycopg':
+                # psycopg 3 prepares repeated statements server-side; a
+                # transaction pooler may run the next one on another server
+                # connection. psycopg2 never prepares.
+                connect_args['prepare_threshold'] = None
+            options['connect_args'] = connect_args
+        else:
+            options['connect_args'] = {'application_name': 'hepsihikaye'}
+        return options
+
+    def watch(self, db):
+        """Record pool events of db's engines (call after SQLAlchemy(app))"""
+        with self.app.app_context():
+            engines = dict(db.engines)
+        for bind, engine in engines.items():
+            name = bind or 'default'
+            self._engines[name] = engine
+            self._counters[name] = {'connects': 0, 'checkouts': 0, 'invalidations': 0, 'peak_checked_out': 0}
+            self._listen(name, engine)
+
+    def after_fork(self):
+        """Forget connections inherited from the parent process without closing them"""
+        # The lock may have been held by another thread at fork time; counts start over per worker
+        self._lock = threading.Lock()
+        for name, engine in self._engines.items():
+            engine.dispose(close=False)
+            self._counters[name].update(connects=0, checkouts=0, invalidations=0, peak_checked_out=0)
+
+    def stats(self):
+        """Pool occupancy and event counts per engine"""
+        result = {}
+        for name, engine in self._engines.items():
+            pool = engine.pool
+            with self._lock:
+                stats = dict(self._counters[name])
+            stats['pool'] = type(pool).__name__
+            for key, method in (('size', 'size'), ('checked_in', 'checkedin'),
+                                ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+                if hasattr(pool, method):
+                    stats[key] = getattr(pool, method)()
+            if hasattr(pool, '_max_overflow') and hasattr(pool, 'size'):
+                stats['max_connections'] = pool.size() + max(pool._max_overflow, 0)
+            result[name] = stats
+        return result
+
+    def _listen(self, name, engine):
+        counters = self._counters[name]
+
+        @event.listens_for(engine, 'connect')
+        def on_connect(dbapi_connection, connection_record):
+            with self._lock:
+                counters['connects'] += 1
+
+        @event.listens_for(engine, 'checkout')
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            checked_out = getattr(engine.pool, 'checkedout', lambda: 0)()
+            with self._lock:
+                counters['checkouts'] += 1
+                counters['peak_checked_out'] = max(counters['peak_checked_out'], checked_out)
+
+        @event.listens_for(engine, 'invalidate')
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            # Pre-ping failures and connections lost mid-query
+            with self._lock:
+                counters['invalidations'] += 1
+            if exception is not None:
+                self.app.logger.warning(f"Database connection invalidated ({name}): {exception}")
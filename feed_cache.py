@@ -0,0 +1,209 @@
+"""
+Pre-rendered RSS feed.
+
+Feed readers poll ``/feed`` far more often than posts change, so the feed
+is built once per content change and then served as stored bytes with its
+ETag, Last-Modified and compressed variants; a poll only compares the
+``posts``/``categories`` cache stamps (see cache_versions.py) with the
+ones the feed was built for, without touching the database or Jinja.
+
+Publishing, editing or deleting a post bumps those stamps through
+``invalidate_content_caches`` and the next poll rebuilds the feed. The
+rebuild is incremental: each ``<item>`` is rendered once and kept until
+its post changes, so only new or edited posts go through the template.
+The built feed is written to ``FEED_CACHE_DIR`` (``instance/feed``) as the
+XML, its compressed variants and a JSON file describing them, so every
+gunicorn worker serves the same bytes (and ETag). ``FEED_REFRESH_INTERVAL``
+bounds how old the view counts in the feed may get.
+
+Links in the feed point at ``SITE_URL`` (on Render, the service's external
+URL), never at the Host header of the request.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytz
+from flask import render_template, request
+from markupsafe import Markup
+
+import cache_versions
+from page_cache import private_directory
+
+TAGS = ('posts', 'categories')
+METADATA_FILE = 'feed.json'
+
+
+class FeedCache:
+    """Build the RSS feed on content changes and serve it from memory"""
+
+    def __init__(self, app=None, db=None, post_model=None):
+        self.app = None
+        self.db = None
+        self.Post = None
+        self.size = 20
+        self.refresh_interval = 900
+        self.site_url = None
+        self.directory = None
+        self._feed = None
+        self._items = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, post_model)
+
+    def init_app(self, app, db, post_model):
+        """Bind the feed to the app, database and post model; read FEED_* settings"""
+        self.app = app
+        self.db = db
+        self.Post = post_model
+        app.config.setdefault('SITE_URL', os.environ.get('SITE_URL') or os.environ.get('RENDER_EXTERNAL_URL') or
+                              f"http://127.0.0.1:{os.environ.get('FLASK_RUN_PORT', 5000)}")
+        app.config.setdefault('FEED_SIZE', int(os.environ.get('FEED_SIZE', 20)))
+        app.config.setdefault('FEED_REFRESH_INTERVAL', int(os.environ.get('FEED_REFRESH_INTERVAL', 900)))
+        # Inside the app's instance folder, not a temp directory other users can write to
+        app.config.setdefault('FEED_CACHE_DIR', os.environ.get(
+            'FEED_CACHE_DIR', os.path.join(app.instance_path, 'feed')))
+        self.site_url = app.config['SITE_URL'].rstrip('/')
+        self.size = app.config['FEED_SIZE']
+        self.refresh_interval = app.config['FEED_REFRESH_INTERVAL']
+        self.directory = app.config['FEED_CACHE_DIR']
+        app.extensions['feed_cache'] = self
+
+    def response(self):
+        """The feed as a conditional response"""
+        stamps = {tag: cache_versions.current(f'page-{tag}') for tag in TAGS}
+        feed = self._feed
+        if not self._is_current(feed, stamps):
+            feed = self._load()
+            if not self._is_current(feed, stamps):
+                with self._lock:
+                    feed = self._load()
+                    if not self._is_current(feed, stamps):
+                        feed = self._rebuild(stamps)
+            self._feed = feed
+
+        response = self.app.response_class(feed['body'], mimetype='application/rss+xml')
+        response.set_etag(feed['etag'])
+        response.last_modified = feed['last_modified']
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        compression = self.app.extensions.get('compression')
+        if compression is not None and feed['encoded']:
+            compression.respond_encoded(response, feed['body'], feed['encoded'])
+        return response.make_conditional(request)
+
+    def _is_current(self, feed, stamps):
+        return feed is not None and feed['stamps'] == stamps and \
+            feed['built_at'] + self.refresh_interval > time.time()
+
+    def _rebuild(self, stamps):
+        Post = self.Post
+        site_url = self.site_url
+        built_at = time.time()
+        epoch = int(built_at // self.refresh_interval)
+        rows = self.db.session.query(Post.id, Post.updated_at, Post.created_at) \
+            .filter(Post.published == True) \
+            .order_by(Post.created_at.desc()).limit(self.size).all()
+
+        # An item is re-rendered when its post, the category names or the view-count epoch change
+        versions = {row.id: (row.updated_at, row.created_at, stamps['categories'], epoch,
+                             cache_versions.current(f'page-post-{row.id}')) for row in rows}
+        stale = [post_id for post_id, version in versions.items()
+                 if self._items.get(post_id, (None,))[0] != version]
+        if stale:
+            queries = self.app.extensions['listing_queries']
+            for post in queries.posts(with_author=True).filter(Post.id.in_(stale)).all():
+                self._items[post.id] = (versions[post.id], Markup(render_template(
+                    'partials/feed_item.xml', post=post, site_url=site_url)))
+        self._items = {post_id: self._items[post_id] for post_id in versions if post_id in self._items}
+
+        turkey_tz = pytz.timezone('Europe/Istanbul')
+        body = render_template('feed.xml',
+                               items=[self._items[row.id][1] for row in rows if row.id in self._items],
+                               site_url=site_url,
+                               last_build_date=datetime.now(turkey_tz).strftime('%a, %d %b %Y %H:%M:%S %z'))
+        body = body.encode('utf-8')
+        compression = self.app.extensions.get('compression')
+        feed = {
+            'stamps': stamps,
+            'body': body,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'last_modified': int(built_at),
+            'built_at': built_at,
+            'encoded': compression.encode_entry(body) if compression is not None else {},
+        }
+        self._store(feed)
+        self.app.logger.info(f"Rebuilt RSS feed ({len(stale)} of {len(rows)} items rendered)")
+        # Another worker may have stored its build at the same time; serve whichever was kept
+        stored = self._load()
+        return stored if self._is_current(stored, stamps) else feed
+
+    # --- shared copy ----------------------------------------------------------
+    #
+    # feed.xml holds the body and feed.xml.<encoding> each compressed
+    # variant; feed.json, written last, names their SHA-1s, so a reader that
+    # catches two workers storing at once sees a mismatch and rebuilds.
+
+    def _variant_path(self, encoding=None):
+        return os.path.join(self.directory, f'feed.xml.{encoding}' if encoding else 'feed.xml')
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, METADATA_FILE)) as f:
+                metadata = json.load(f)
+            with open(self._variant_path(), 'rb') as f:
+                body = f.read()
+            if metadata.get('site_url') != self.site_url or hashlib.sha1(body).hexdigest() != metadata['etag']:
+                return None
+            encoded = {}
+            for encoding, digest in metadata['encoded'].items():
+                with open(self._variant_path(encoding), 'rb') as f:
+                    data = f.read()
+                if hashlib.sha1(data).hexdigest() != digest:
+                    return None
+                # gzip variants are a list of segments (see compression.gzip_segments); the feed has one
+                encoded[encoding] = [data] if encoding == 'gzip' else data
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return {
+            'stamps': metadata['stamps'],
+            'body': body,
+            'etag': metadata['etag'],
+            'last_modified': metadata['last_modified'],
+            'built_at': metadata['built_at'],
+            'encoded': encoded,
+        }
+
+    def _store(self, feed):
+        files = {self._variant_path(): feed['body']}
+        digests = {}
+        for encoding, data in feed['encoded'].items():
+            data = b''.join(data) if isinstance(data, list) else data
+            files[self._variant_path(encoding)] = data
+            digests[encoding] = hashlib.sha1(data).hexdigest()
+        metadata = {
+            'site_url': self.site_url,
+            'stamps': feed['stamps'],
+            'etag': feed['etag'],
+            'last_modified': feed['last_modified'],
+            'built_at': feed['built_at'],
+            'encoded': digests,
+        }
+        files[os.path.join(self.directory, METADATA_FILE)] = json.dumps(metadata).encode('utf-8')
+
+        suffix = f'{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            private_directory(self.directory)
+            for path, data in files.items():
+                tmp_path = f'{path}.{suffix}'
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        except OSError as e:
+            self.app.logger.error(f"Storing the RSS feed failed: {str(e)}")
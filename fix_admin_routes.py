@@ -157,8 +157,13 @@ def add_debug_logging():
 
 def create_error_log_viewer():
     """Create a temporary error log viewer script"""
+    if os.path.exists('view_error_logs.py'):
+        # The maintained log analyzer; don't replace it with this simpler one
+        logger.info("view_error_logs.py already exists, leaving it in place")
+        return True
+
     logger.info("Creating error log viewer script...")
-    
+
     script_content = """import os
 import sys
 import re
@@ -1,8 +1,153 @@
-workers = 4
-bind = "0.0.0.0:10000"
+"""
+Gunicorn settings (loaded automatically by `gunicorn app:app`).
+
+GUNICORN_WORKER_CLASS selects the concurrency model:
+
+- gthread (default): each worker serves GUNICORN_THREADS requests at once,
+  so a slow Supabase upload or a slow client only ties up one thread
+- gevent: cooperative workers handling GUNICORN_WORKER_CONNECTIONS requests
+  each; needs `pip install gevent` (and psycogreen for PostgreSQL)
+- sync: one request per worker
+
+Worker counts are derived from the CPUs and the memory limit of the
+container (GUNICORN_WORKER_MEMORY_MB per worker); WEB_CONCURRENCY
+overrides them.
+
+Workers share their Prometheus metrics through PROMETHEUS_MULTIPROC_DIR
+(see metrics.py), emptied whenever the server starts.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+# Platform probes -------------------------------------------------------------
+
+def cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def memory_limit_mb():
+    """Memory available to the container (cgroup limit, else physical memory), or None"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "unlimited" as a huge number
+        if value.isdigit() and int(value) < 1 << 50:
+            return int(value) // (1024 * 1024)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _int_env(name, default):
+    value = os.environ.get(name)
+    return int(value) if value and value.isdigit() else default
+
+
+# Concurrency -----------------------------------------------------------------
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').lower()
+if worker_class not in ('sync', 'gthread', 'gevent'):
+    worker_class = 'gthread'
+
+cpus = cpu_count()
+memory_mb = memory_limit_mb()
+worker_memory_mb = _int_env('GUNICORN_WORKER_MEMORY_MB', 160)
+# Leave room for the master process and the OS
+memory_workers = max(1, (memory_mb - 64) // worker_memory_mb) if memory_mb else None
+
+if worker_class == 'sync':
+    cpu_workers = cpus * 2 + 1
+elif worker_class == 'gthread':
+    cpu_workers = cpus + 1
+else:
+    # One event loop per CPU
+    cpu_workers = cpus
+
+workers = _int_env('WEB_CONCURRENCY', min(cpu_workers, memory_workers or cpu_workers))
+threads = _int_env('GUNICORN_THREADS', 4) if worker_class == 'gthread' else 1
+worker_connections = _int_env('GUNICORN_WORKER_CONNECTIONS', 100)
+
+# gevent patches the standard library when a worker starts; an app imported
+# by the master before that would keep unpatched locks and sockets
+preload_app = worker_class != 'gevent'
+
+# Metrics ---------------------------------------------------------------------
+
+# Must be set before the app (and prometheus_client) is imported, and cleared
+# of the previous run's files so counters start from zero
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'hepsihikaye-metrics'))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+# Server ----------------------------------------------------------------------
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
 timeout = 120
+graceful_timeout = 60
 keepalive = 5
-worker_class = "sync"
-worker_connections = 1000
 max_requests = 0
 max_requests_jitter = 0
+
+errorlog = "-"  # stderr
+loglevel = "info"
+accesslog = "-"  # stdout
+# Ends with the request ID the app logs under (see log_pipeline.py)
+access_log_format = '%({X-Real-IP}i)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %({X-Request-ID}o)s'
+
+
+# Server hooks ----------------------------------------------------------------
+
+def when_ready(server):
+    server.log.info("Serving with %s %s worker(s), %s thread(s) each (%s CPUs, %s MB memory)",
+                    workers, worker_class, threads, cpus, memory_mb or 'unknown')
+
+
+def post_fork(server, worker):
+    # With preload_app the Supabase HTTP client was created in the master;
+    # connections must not be shared across processes. The database pool
+    # resets itself after a fork (see db_pool.py).
+    if 'app' in sys.modules:
+        from app import supabase_storage
+        if supabase_storage is not None:
+            supabase_storage.close()
+    server.log.info("Worker spawned (pid: %s)", worker.pid)
+
+
+def post_worker_init(worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            worker.log.warning("psycogreen is not installed; PostgreSQL queries will block the gevent worker")
+        else:
+            patch_psycopg()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker from the in-progress gauge
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid, metrics_dir)
+
+
+def worker_exit(server, worker):
+    # Write out any buffered post views and votes before the worker goes away
+    from app import view_counter, ratings, image_pipeline, log_pipeline
+    view_counter.stop()
+    ratings.stop()
+    # Let queued image variants finish so they get recorded
+    image_pipeline.shutdown()
+    # Last, so the lines logged above are written too
+    log_pipeline.stop()
@@ -1,49 +1,7 @@
+# Kept for deployments started with `gunicorn -c gunicorn_config.py app:app`;
+# all settings live in gunicorn.conf.py
 import os
-import multiprocessing
 
-# Configuration
-bind = "0.0.0.0:10000"
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
-worker_connections = 1000
-timeout = 120
-keepalive = 5
-spew = False
-daemon = False
-pidfile = None
-umask = 0
-user = None
-group = None
-tmp_upload_dir = None
-errorlog = "-"  # stderr
-loglevel = "info"
-accesslog = "-"  # stdout
-access_log_format = '%({X-Real-IP}i)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
-
-# Graceful restart timeout
-graceful_timeout = 60
-
-# Preload app for better performance
-preload_app = True
-
-# Process name
-proc_name = None
-
-# Server hooks
-def post_fork(server, worker):
-    server.log.info("Worker spawned (pid: %s)", worker.pid)
-
-def pre_fork(server, worker):
-    pass
-
-def pre_exec(server):
-    server.log.info("Forked child, re-executing.")
-
-def when_ready(server):
-    server.log.info("Server is ready. Spawning workers")
-
-def worker_int(worker):
-    worker.log.info("worker received INT or QUIT signal")
-
-def worker_abort(worker):
-    worker.log.info("worker received SIGABRT signal") 
\ No newline at end of file
+_config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+with open(_config) as f:
+    exec(compile(f.read(), _config, 'exec'))
@@ -0,0 +1,135 @@
+"""
+Homepage data cache.
+
+The index route needs trending posts, recent posts and recent videos. The
+lists are built once, kept in memory for ``HOMEPAGE_CACHE_TTL`` seconds and
+rebuilt early when content changes (see ``HomepageCache.invalidate``).
+
+Trending order uses the stored, indexed ``post.trending_score`` column
+(``likes * 2 + views``), which is refreshed in the background every
+``TRENDING_REFRESH_INTERVAL`` seconds instead of being computed per request.
+"""
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import func, or_
+
+import cache_versions
+from view_counter import PeriodicFlusher
+
+VERSION_NAME = 'homepage'
+
+
+def snapshot(obj):
+    """Copy the column values of a model instance into a plain, session-free object"""
+    return SimpleNamespace(**{column.key: getattr(obj, column.key) for column in obj.__table__.columns})
+
+
+class HomepageCache(PeriodicFlusher):
+    """Serve the index page lists from memory and keep trending scores fresh"""
+
+    thread_name = 'trending-refresh'
+
+    def __init__(self, app=None, db=None, post_model=None, video_model=None):
+        super().__init__()
+        self.app = None
+        self.db = None
+        self.Post = None
+        self.Video = None
+        self.ttl = 60
+        self._data = None
+        self._built_at = 0
+        self._version = None
+        self._build_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, post_model, video_model)
+
+    def init_app(self, app, db, post_model, video_model):
+        """Bind the cache to the app, database and the post/video models"""
+        self.app = app
+        self.db = db
+        self.Post = post_model
+        self.Video = video_model
+        app.config.setdefault('HOMEPAGE_CACHE_TTL', float(os.environ.get('HOMEPAGE_CACHE_TTL', 60)))
+        app.config.setdefault('TRENDING_REFRESH_INTERVAL',
+                              float(os.environ.get('TRENDING_REFRESH_INTERVAL', 300)))
+        self.ttl = app.config['HOMEPAGE_CACHE_TTL']
+        self.flush_interval = app.config['TRENDING_REFRESH_INTERVAL']
+        app.extensions['homepage_cache'] = self
+
+    def get(self):
+        """Return the cached homepage lists, rebuilding them when stale"""
+        self._ensure_flusher()
+        version = cache_versions.current(VERSION_NAME)
+        data = self._data
+        if data is not None and self._version == version and time.time() - self._built_at < self.ttl:
+            return data
+
+        # Only one thread rebuilds; the others keep serving the old copy
+        if data is not None and not self._build_lock.acquire(blocking=False):
+            return data
+        if data is None:
+            self._build_lock.acquire()
+        try:
+            # Another thread may have rebuilt while we waited for the lock
+            if self._data is not None and self._data is not data:
+                return self._data
+            self._data = self._build()
+            self._built_at = time.time()
+            self._version = version
+            return self._data
+        finally:
+            self._build_lock.release()
+
+    def invalidate(self):
+        """Drop the cached lists in this worker and every other worker"""
+        self._data = None
+        cache_versions.bump(VERSION_NAME)
+
+    def refresh_trending_scores(self):
+        """Recompute post.trending_score for rows whose likes or views changed"""
+        Post = self.Post
+        score = func.coalesce(Post.likes, 0) * 2 + func.coalesce(Post.views, 0)
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    result = conn.execute(
+                        Post.__table__.update()
+                        .where(or_(Post.trending_score.is_(None), Post.trending_score != score))
+                        .values(trending_score=score)
+                    )
+            return result.rowcount
+        except Exception as e:
+            self.app.logger.error(f"Trending score refresh error: {str(e)}")
+            return 0
+
+    def flush(self):
+        """Background job: refresh trending scores and drop the local copy if they moved"""
+        if self.refresh_trending_scores():
+            self._data = None
+        return 0
+
+    def _build(self):
+        Post, Video = self.Post, self.Video
+
+        trending_posts = Post.query.filter_by(published=True) \
+            .order_by(Post.trending_score.desc()) \
+            .limit(3).all()
+
+        # Exclude trending posts from the recent list to avoid duplication
+        trending_ids = [post.id for post in trending_posts]
+        recent_posts = Post.query.filter(Post.published == True, ~Post.id.in_(trending_ids)) \
+            .order_by(Post.created_at.desc()) \
+            .limit(6).all()
+
+        recent_videos = Video.query.filter_by(published=True) \
+            .order_by(Video.created_at.desc()) \
+            .limit(3).all()
+
+        return {
+            'trending_posts': [snapshot(post) for post in trending_posts],
+            'posts': [snapshot(post) for post in recent_posts],
+            'videos': [snapshot(video) for video in recent_videos],
+        }
@@ -0,0 +1,241 @@
+"""
+Responsive image variants for uploaded post images.
+
+An uploaded image is decoded once, auto-rotated from its EXIF orientation
+and scaled down to each configured width (``IMAGE_WIDTHS``, largest first,
+each step resized from the previous one). Every width is encoded as AVIF
+(when Pillow supports it), WebP and a JPEG fallback, without EXIF or other
+metadata. The work runs in a small thread pool (``IMAGE_WORKERS``) so the
+upload request returns as soon as the original is stored.
+
+Variants sit next to the original and are named after it
+(``photo.jpg`` -> ``photo-640w.webp``), so only the list of widths and
+formats is recorded on the post (``post.image_variants``) for templates to
+build ``srcset`` attributes from.
+"""
+import io
+import json
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+from PIL import Image, ImageOps
+
+DEFAULT_WIDTHS = (1280, 640, 320)
+
+CONTENT_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+EXTENSIONS = {
+    'avif': 'avif',
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+# Pillow save() options per format; no exif/icc_profile is passed, so none is written
+SAVE_OPTIONS = {
+    'avif': {'format': 'AVIF', 'speed': 8},
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+
+
+def supported_formats():
+    """Variant formats this Pillow build can encode, preferred first"""
+    Image.init()
+    return tuple(fmt for fmt in ('avif', 'webp', 'jpeg') if SAVE_OPTIONS[fmt]['format'] in Image.SAVE)
+
+
+def variant_name(name, width, fmt):
+    """Name (or URL) of one variant of the image stored as name"""
+    parts = urlsplit(name)
+    stem = posixpath.splitext(parts.path)[0]
+    path = f"{stem}-{width}w.{EXTENSIONS[fmt]}"
+    return urlunsplit((parts.scheme, parts.netloc, path, '', '')) if parts.scheme else path
+
+
+def load_variants(value):
+    """Parse a recorded variants manifest; None when absent or invalid"""
+    if not value:
+        return None
+    try:
+        variants = json.loads(value) if isinstance(value, str) else value
+    except ValueError:
+        return None
+    if not variants.get('widths') or not variants.get('formats'):
+        return None
+    return variants
+
+
+def render_variants(source, widths, formats, quality=80):
+    """
+    Decode source (bytes, file object or path) once and return
+    ([(width, fmt, data), ...], actual widths). Widths larger than the
+    original are replaced by the original width.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with Image.open(source) as original:
+        img = ImageOps.exif_transpose(original)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    # Drop EXIF, ICC, XMP... so encoders have nothing to copy over
+    img.info = {}
+
+    targets = sorted({min(width, img.width) for width in widths}, reverse=True)
+    results = []
+    current = img
+    for width in targets:
+        if width < current.width:
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            frame = current
+            if fmt == 'jpeg' and frame.mode != 'RGB':
+                # JPEG has no alpha; flatten onto white
+                background = Image.new('RGB', frame.size, (255, 255, 255))
+                background.paste(frame, mask=frame.getchannel('A'))
+                frame = background
+            buffer = io.BytesIO()
+            frame.save(buffer, quality=quality, **SAVE_OPTIONS[fmt])
+            results.append((width, fmt, buffer.getvalue()))
+    return results, targets
+
+
+def fit_within(stream, max_size):
+    """
+    Scale an image down to fit max_size (width, height), keeping its format.
+    Returns a BytesIO of the smaller image, or None when the image already
+    fits or can't be decoded (the caller then keeps the original).
+    """
+    try:
+        with Image.open(stream) as original:
+            if original.width <= max_size[0] and original.height <= max_size[1]:
+                return None
+            fmt = original.format
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail(max_size)
+            buffer = io.BytesIO()
+            img.save(buffer, format=fmt)
+        buffer.seek(0)
+        return buffer
+    except Exception:
+        return None
+    finally:
+        stream.seek(0)
+
+
+class ImagePipeline:
+    """Generate and record responsive variants of post images off the request thread"""
+
+    def __init__(self, app=None, db=None, post_model=None, on_change=None):
+        self.app = None
+        self.db = None
+        self.Post = None
+        self.on_change = None
+        self.widths = DEFAULT_WIDTHS
+        self.formats = ()
+        self.quality = 80
+        self.workers = 2
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, post_model, on_change)
+
+    def init_app(self, app, db, post_model, on_change=None):
+        """Configure from IMAGE_* settings; on_change(post_id) runs after variants are recorded"""
+        self.app = app
+        self.db = db
+        self.Post = post_model
+        self.on_change = on_change
+        app.config.setdefault('IMAGE_WIDTHS', os.environ.get('IMAGE_WIDTHS', '1280,640,320'))
+        app.config.setdefault('IMAGE_FORMATS', os.environ.get('IMAGE_FORMATS', 'avif,webp,jpeg'))
+        app.config.setdefault('IMAGE_QUALITY', int(os.environ.get('IMAGE_QUALITY', 80)))
+        app.config.setdefault('IMAGE_WORKERS', int(os.environ.get('IMAGE_WORKERS', 2)))
+
+        widths = app.config['IMAGE_WIDTHS']
+        if isinstance(widths, str):
+            widths = [int(width) for width in widths.split(',') if width.strip()]
+        self.widths = tuple(sorted(set(widths), reverse=True)) or DEFAULT_WIDTHS
+
+        requested = app.config['IMAGE_FORMATS']
+        if isinstance(requested, str):
+            requested = [fmt.strip().lower() for fmt in requested.split(',')]
+        available = supported_formats()
+        self.formats = tuple(fmt for fmt in available if fmt in requested)
+        if 'jpeg' not in self.formats:
+            # Always keep a fallback every browser can show
+            self.formats += ('jpeg',)
+
+        self.quality = app.config['IMAGE_QUALITY']
+        self.workers = app.config['IMAGE_WORKERS']
+        app.extensions['image_pipeline'] = self
+
+    def submit_post_image(self, post_id, image, source, store, key=None, discard_source=False):
+        """
+        Queue variant generation for the image just stored for a post.
+
+        image is the value saved in post.image, source the original (bytes
+        or local path) and store(name, data, content_type) writes one
+        variant; key is the storage name variants are derived from
+        (defaults to image). With discard_source the source file is
+        deleted once it has been read.
+        """
+        key = key or image
+        return self._submit(self._process_post_image, post_id, image, source, store, key, discard_source)
+
+    def process_post_image(self, post_id, image, source, store, key=None, discard_source=False):
+        """Synchronous version of submit_post_image; returns the recorded variants"""
+        return self._process_post_image(post_id, image, source, store, key or image, discard_source)
+
+    def shutdown(self, wait=True):
+        """Wait for queued images to finish (used on worker exit)"""
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            # Executors don't survive a fork; give each worker process its own
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='image-pipeline')
+                self._pid = os.getpid()
+            return self._executor.submit(fn, *args)
+
+    def _process_post_image(self, post_id, image, source, store, key, discard_source=False):
+        try:
+            try:
+                rendered, widths = render_variants(source, self.widths, self.formats, self.quality)
+            finally:
+                if discard_source:
+                    os.remove(source)
+            for width, fmt, data in rendered:
+                store(variant_name(key, width, fmt), data, CONTENT_TYPES[fmt])
+            variants = {'widths': widths, 'formats': list(self.formats)}
+        except Exception as e:
+            self.app.logger.error(f"Image variant generation failed for post {post_id}: {str(e)}")
+            return None
+
+        Post = self.Post
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    # Only record if the post still shows this image
+                    result = conn.execute(
+                        Post.__table__.update()
+                        .where(Post.id == post_id, Post.image == image)
+                        .values(image_variants=json.dumps(variants))
+                    )
+                if result.rowcount and self.on_change is not None:
+                    self.on_change(post_id)
+        except Exception as e:
+            self.app.logger.error(f"Recording image variants failed for post {post_id}: {str(e)}")
+            return None
+        return variants
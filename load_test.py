@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Load test for the public pages and API.
+
+Runs concurrent GET requests against a server and reports throughput,
+latency percentiles and errors:
+
+    python load_test.py --url http://127.0.0.1:10000 --concurrency 50 --duration 30
+
+With --compare, starts gunicorn with gunicorn.conf.py once per worker class
+(on --port, with the same WEB_CONCURRENCY) and prints the results side by
+side, e.g. to see what gthread workers gain over sync ones:
+
+    python load_test.py --compare sync gthread --workers 2 --concurrency 50
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+DEFAULT_PATHS = ['/', '/post/1', '/feed', '/api/v1/public/feed', '/api/v1/public/post/1']
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_load(base_url, paths, concurrency, duration, timeout=30):
+    """Hit base_url + paths from concurrency threads for duration seconds"""
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(offset):
+        # One connection per thread, like a browser tab or app instance
+        with httpx.Client(base_url=base_url, timeout=timeout, headers={'Accept-Encoding': 'gzip'}) as client:
+            i = offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    response = client.get(path)
+                    response.read()
+                except httpx.HTTPError as e:
+                    with lock:
+                        errors[type(e).__name__] += 1
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[response.status_code] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - started
+
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'statuses': dict(statuses),
+        'errors': dict(errors),
+    }
+
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(base_url + '/', timeout=5)
+            return True
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    return False
+
+
+def start_gunicorn(worker_class, port, workers, threads):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, PORT=str(port))
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    if threads:
+        env['GUNICORN_THREADS'] = str(threads)
+    root = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(root, 'gunicorn.conf.py'),
+         '--access-logfile', '/dev/null', 'app:app'],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def print_result(label, result):
+    print(f"{label:<10} {result['requests']:>8} req  {result['rps']:>8.1f} req/s  "
+          f"p50 {result['p50']:>7.1f} ms  p95 {result['p95']:>7.1f} ms  p99 {result['p99']:>7.1f} ms  "
+          f"status {result['statuses']}" + (f"  errors {result['errors']}" if result['errors'] else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test HepsiHikaye')
+    parser.add_argument('--url', default='http://127.0.0.1:10000', help='server to test (without --compare)')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per run')
+    parser.add_argument('--compare', nargs='+', choices=['sync', 'gthread', 'gevent'],
+                        help='start gunicorn with each worker class and compare them')
+    parser.add_argument('--port', type=int, default=18000, help='port for --compare servers')
+    parser.add_argument('--workers', type=int, help='WEB_CONCURRENCY for --compare servers')
+    parser.add_argument('--threads', type=int, help='GUNICORN_THREADS for --compare gthread servers')
+    args = parser.parse_args()
+
+    if not args.compare:
+        print_result('server', run_load(args.url.rstrip('/'), args.paths, args.concurrency, args.duration))
+        return
+
+    results = {}
+    for worker_class in args.compare:
+        base_url = f'http://127.0.0.1:{args.port}'
+        process = start_gunicorn(worker_class, args.port, args.workers, args.threads)
+        try:
+            if not wait_until_up(base_url):
+                print(f"{worker_class}: gunicorn did not come up on port {args.port}")
+                continue
+            # Warm caches so every run measures the same steady state
+            run_load(base_url, args.paths, 1, 2)
+            results[worker_class] = run_load(base_url, args.paths, args.concurrency, args.duration)
+            print_result(worker_class, results[worker_class])
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=90)
+
+    if len(results) > 1:
+        baseline_class = next(iter(results))
+        baseline = results[baseline_class]['rps']
+        for worker_class, result in results.items():
+            if worker_class != baseline_class and baseline:
+                print(f"{worker_class} vs {baseline_class}: {result['rps'] / baseline:.2f}x throughput")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Structured logging off the request thread.
+
+``LogPipeline`` puts a ``QueueHandler`` on the root logger: a log call in a
+view only formats the message and appends it to a bounded in-memory queue,
+and a ``QueueListener`` thread writes the records to stderr and to the
+rotating ``LOG_FILE`` (``logs/app.log``, ``LOG_FILE_MAX_BYTES`` per file).
+When the queue is full records are dropped and counted rather than
+blocking the request. Other modules can send one logger to its own file on
+the same thread with ``add_log_file`` (query_profiler.py's perf.log).
+
+Under gunicorn several processes would rotate the same file over each
+other, so there ``LOG_FILE`` is off by default (Render keeps stderr); a
+file set explicitly is opened with ``WatchedFileHandler`` and left to an
+external rotator such as logrotate.
+
+Records are JSON lines (``LOG_FORMAT=text`` for the old one-line format)
+carrying the request ID, method, path and endpoint of the request that
+logged them. The request ID comes from an incoming ``X-Request-ID`` header
+or is generated, and is returned in the response header of the same name.
+Each request also logs one ``request`` record with its status and
+``duration_ms``.
+
+INFO and DEBUG records logged during a request are sampled per request at
+``LOG_SAMPLE_RATE`` (all of a request's lines or none of them); warnings,
+errors, slow requests (``LOG_SLOW_REQUEST_MS``) and everything logged
+outside a request are always kept.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+TEXT_FORMAT = '%(asctime)s %(levelname)s: %(message)s [%(request_id)s] [in %(pathname)s:%(lineno)d]'
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+# Attributes every LogRecord has; anything else was passed with extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'method', 'path', 'endpoint'}
+
+
+def under_gunicorn():
+    """Whether this process is (or will be forked into) a gunicorn worker"""
+    return os.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'method', None):
+            data.update(request_id=record.request_id, method=record.method,
+                        path=record.path, endpoint=record.endpoint)
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                data[key] = value
+        data['pid'] = record.process
+        data['source'] = f'{record.module}:{record.lineno}'
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class LoggerFilter(logging.Filter):
+    """Pass only the records of the named loggers (include) or all others (exclude)"""
+
+    def __init__(self, names, include=True):
+        super().__init__()
+        self.names = names
+        self.include = include
+
+    def filter(self, record):
+        return (record.name in self.names) == self.include
+
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request to records and sample INFO/DEBUG records per request"""
+
+    def __init__(self, unsampled=()):
+        super().__init__()
+        self.unsampled = unsampled
+
+    def filter(self, record):
+        if not has_request_context():
+            record.request_id = '-'
+            return True
+        record.request_id = g.get('request_id', '-')
+        record.method = request.method
+        record.path = request.path
+        record.endpoint = request.endpoint
+        if record.levelno >= logging.WARNING or record.name in self.unsampled:
+            return True
+        return g.get('log_sampled', True)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Resolve the message on the calling thread but keep the traceback
+        # separate so the formatter can put it in its own field
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class LogPipeline:
+    """Queue-based JSON logging with request IDs, request durations and sampling"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.handler = None
+        self.listener = None
+        self.handlers = []
+        # Loggers written to their own file by add_log_file
+        self.separate = set()
+        self.multiprocess = False
+        self.queue_size = 10000
+        self.sample_rate = 1.0
+        self.slow_seconds = 1.0
+        self.request_logger = logging.getLogger('hepsihikaye.request')
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Route all logging through the queue according to LOG_* settings"""
+        self.app = app
+        app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO').upper())
+        app.config.setdefault('LOG_FORMAT', os.environ.get('LOG_FORMAT', 'json').lower())
+        self.multiprocess = under_gunicorn()
+        app.config.setdefault('LOG_FILE', os.environ.get(
+            'LOG_FILE', '' if self.multiprocess else os.path.join('logs', 'app.log')))
+        app.config.setdefault('LOG_FILE_MAX_BYTES', int(os.environ.get('LOG_FILE_MAX_BYTES', 10 * 1024 * 1024)))
+        app.config.setdefault('LOG_FILE_BACKUPS', int(os.environ.get('LOG_FILE_BACKUPS', 5)))
+        app.config.setdefault('LOG_QUEUE_SIZE', int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+        # Render sets RENDER=true; keep a fifth of the routine lines there
+        app.config.setdefault('LOG_SAMPLE_RATE', float(os.environ.get(
+            'LOG_SAMPLE_RATE', 0.2 if os.environ.get('RENDER') else 1.0)))
+        app.config.setdefault('LOG_SLOW_REQUEST_MS', float(os.environ.get('LOG_SLOW_REQUEST_MS', 1000)))
+        self.queue_size = app.config['LOG_QUEUE_SIZE']
+        self.sample_rate = app.config['LOG_SAMPLE_RATE']
+        self.slow_seconds = app.config['LOG_SLOW_REQUEST_MS'] / 1000
+        app.extensions['log_pipeline'] = self
+
+        if app.config['LOG_FORMAT'] == 'text':
+            formatter = logging.Formatter(TEXT_FORMAT)
+        else:
+            formatter = JsonFormatter()
+        stream = logging.StreamHandler(sys.stderr)
+        self.handlers = [stream]
+        file_handler = self._file_handler(app.config['LOG_FILE'])
+        if file_handler is not None:
+            self.handlers.append(file_handler)
+        for handler in self.handlers:
+            handler.setFormatter(formatter)
+            handler.addFilter(LoggerFilter(self.separate, include=False))
+
+        self.handler = NonBlockingQueueHandler(queue.Queue(self.queue_size))
+        self.handler.addFilter(RequestContextFilter(self.separate))
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(app.config['LOG_LEVEL'])
+        # Flask's own stderr handler would write synchronously and twice
+        app.logger.removeHandler(default_handler)
+        self._start()
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        atexit.register(self.stop)
+        # gunicorn forks after preloading the app; the listener thread doesn't survive that
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.after_fork)
+
+    def add_log_file(self, logger_name, path, formatter=None, max_bytes=None, backups=None):
+        """
+        Write logger_name's records, unsampled, to their own file instead of
+        the main log; returns False if the file can't be opened
+        """
+        handler = self._file_handler(path, max_bytes, backups)
+        if handler is None:
+            return False
+        handler.setFormatter(formatter or logging.Formatter('%(message)s'))
+        handler.addFilter(LoggerFilter({logger_name}))
+        self.separate.add(logger_name)
+        self.handlers.append(handler)
+        logging.getLogger(logger_name).setLevel(logging.INFO)
+        # The listener's handlers are fixed when it starts
+        self.stop()
+        self._start()
+        return True
+
+    @property
+    def dropped(self):
+        """Records dropped because the queue was full"""
+        return self.handler.dropped if self.handler else 0
+
+    def stop(self):
+        """Write out queued records and stop the listener thread"""
+        with self._lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def after_fork(self):
+        """Give the child its own queue and listener thread"""
+        if self.handler is None:
+            return
+        self._lock = threading.Lock()
+        self.listener = None
+        self.handler.queue = queue.Queue(self.queue_size)
+        self.handler.dropped = 0
+        self._start()
+
+    def _file_handler(self, path, max_bytes=None, backups=None):
+        if not path:
+            return None
+        config = self.app.config
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if self.multiprocess:
+                # Reopens the file when an external rotator moves it; no process rotates it itself
+                return WatchedFileHandler(path, encoding='utf-8')
+            return RotatingFileHandler(path, maxBytes=max_bytes or config['LOG_FILE_MAX_BYTES'],
+                                       backupCount=backups or config['LOG_FILE_BACKUPS'], encoding='utf-8')
+        except OSError as e:
+            sys.stderr.write(f"Log file {path} unavailable: {str(e)}\n")
+            return None
+
+    def _start(self):
+        with self._lock:
+            self.listener = QueueListener(self.handler.queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+
+    # --- hooks ----------------------------------------------------------------
+
+    def _start_request(self):
+        if 'request_id' in g:
+            return
+        request_id = request.headers.get('X-Request-ID', '')
+        g.request_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+        g.log_sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _finish_request(self, response):
+        request_id = g.get('request_id')
+        if request_id is None:
+            return response
+        response.headers['X-Request-ID'] = request_id
+        duration = time.perf_counter() - g.request_started
+        level = logging.INFO
+        if response.status_code >= 500 or duration >= self.slow_seconds:
+            level = logging.WARNING
+        self.request_logger.log(level, f"{request.method} {request.path} {response.status_code}",
+                                extra={'status': response.status_code, 'duration_ms': round(duration * 1000, 1)})
+        return response
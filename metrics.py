@@ -0,0 +1,143 @@
+"""
+Prometheus metrics for the web routes and the mobile API.
+
+Every request is counted by endpoint, method and status code and its
+duration goes into a latency histogram; template render times and the
+size of multipart uploads are recorded as histograms too. Endpoint names
+(``post_detail``, ``mobile_api.feed``) are used rather than paths so the
+number of series stays bounded.
+
+Under gunicorn each worker writes its samples to memory-mapped files in
+``PROMETHEUS_MULTIPROC_DIR`` (set up by gunicorn.conf.py) and a scrape of
+``/metrics`` merges the files of all workers. Without that variable (the
+development server) the metrics of the single process are served.
+
+``/metrics`` requires ``Authorization: Bearer <METRICS_TOKEN>`` when
+``METRICS_TOKEN`` is set; otherwise it only answers direct requests from
+localhost. Needs ``prometheus_client``; metrics are off without it.
+"""
+import hmac
+import os
+import time
+
+from flask import before_render_template, g, request, template_rendered
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                                   generate_latest, multiprocess)
+except ImportError:  # optional; no metrics without it
+    multiprocess = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RENDER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# Up to MAX_CONTENT_LENGTH (16 MB)
+UPLOAD_BUCKETS = (10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 2 * 1024 * 1024,
+                  5 * 1024 * 1024, 10 * 1024 * 1024, 16 * 1024 * 1024)
+
+
+class Metrics:
+    """Request, template and upload metrics with a Prometheus scrape endpoint"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.token = None
+        self.multiprocess_dir = None
+        self.registry = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the metrics and register the hooks and /metrics according to METRICS_* settings"""
+        self.app = app
+        app.config.setdefault('METRICS', os.environ.get('METRICS', '1').lower() in ('1', 'true', 'yes'))
+        app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+        app.config.setdefault('METRICS_PATH', os.environ.get('METRICS_PATH', '/metrics'))
+        self.token = app.config['METRICS_TOKEN']
+        app.extensions['metrics'] = self
+        if not app.config['METRICS']:
+            return
+        if multiprocess is None:
+            app.logger.warning("prometheus_client is not installed; metrics are disabled")
+            return
+
+        # prometheus_client picks its storage from this variable when it is imported
+        self.multiprocess_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+        if self.multiprocess_dir:
+            os.makedirs(self.multiprocess_dir, exist_ok=True)
+        self.registry = CollectorRegistry()
+        self.requests = Counter(
+            'hepsihikaye_http_requests_total', 'HTTP requests handled',
+            ['endpoint', 'method', 'status'], registry=self.registry)
+        self.latency = Histogram(
+            'hepsihikaye_http_request_duration_seconds', 'Time spent handling HTTP requests',
+            ['endpoint', 'method'], buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.in_progress = Gauge(
+            'hepsihikaye_http_requests_in_progress', 'HTTP requests being handled',
+            multiprocess_mode='livesum', registry=self.registry)
+        self.render_time = Histogram(
+            'hepsihikaye_template_render_seconds', 'Time spent rendering templates',
+            ['template'], buckets=RENDER_BUCKETS, registry=self.registry)
+        self.upload_size = Histogram(
+            'hepsihikaye_upload_bytes', 'Size of multipart upload requests',
+            ['endpoint'], buckets=UPLOAD_BUCKETS, registry=self.registry)
+        self.enabled = True
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.scrape)
+
+    def scrape(self):
+        """Text exposition of the metrics of all workers"""
+        if not self._authorized():
+            return self.app.response_class('Not Found', status=404, mimetype='text/plain')
+        if self.multiprocess_dir:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry, path=self.multiprocess_dir)
+        else:
+            registry = self.registry
+        response = self.app.response_class(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    def _authorized(self):
+        if self.token:
+            auth_header = request.headers.get('Authorization', '')
+            return auth_header.startswith('Bearer ') and hmac.compare_digest(auth_header[7:], self.token)
+        # Without a token only a scraper on the same host gets through, not the public behind a proxy
+        return (request.remote_addr in ('127.0.0.1', '::1')
+                and 'X-Forwarded-For' not in request.headers and 'X-Real-IP' not in request.headers)
+
+    # --- hooks ----------------------------------------------------------------
+
+    def _start_request(self):
+        if 'metrics_started' in g:
+            return
+        g.metrics_started = time.perf_counter()
+        self.in_progress.inc()
+
+    def _finish_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        self.latency.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        self.requests.labels(endpoint, request.method, str(response.status_code)).inc()
+        if request.mimetype == 'multipart/form-data' and request.content_length:
+            self.upload_size.labels(endpoint).observe(request.content_length)
+        return response
+
+    def _teardown_request(self, exc):
+        if g.pop('metrics_started', None) is not None:
+            self.in_progress.dec()
+
+    def _start_render(self, sender, template, context, **extra):
+        g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def _finish_render(self, sender, template, context, **extra):
+        renders = g.get('metrics_renders')
+        if renders:
+            self.render_time.labels(template.name or '(string)').observe(time.perf_counter() - renders.pop())
@@ -59,12 +59,17 @@ def run_migrations():
             ('title', 'VARCHAR(200) NOT NULL', None),  # This should already exist
             ('content', 'TEXT NOT NULL', None),  # This should already exist
             ('excerpt', 'TEXT', None),
+            ('summary', 'TEXT', None),  # Filled by backfill_post_text.py
+            ('word_count', 'INTEGER', '0'),
+            ('reading_time', 'INTEGER', '1'),
             ('image', 'VARCHAR(200)', None),  # Missing column found in logs
+            ('image_variants', 'TEXT', None),
             ('views', 'INTEGER', '0'),
             ('likes', 'INTEGER', '0'),
             ('dislikes', 'INTEGER', '0'),
             ('published', 'BOOLEAN', 'TRUE'),
             ('featured', 'BOOLEAN', 'FALSE'),
+            ('trending_score', 'INTEGER', '0'),
             ('category_id', 'INTEGER', None),  # This should already exist
             ('created_at', 'TIMESTAMP', 'CURRENT_TIMESTAMP'),  # This should already exist
             ('updated_at', 'TIMESTAMP', 'CURRENT_TIMESTAMP')  # This should already exist
@@ -75,6 +80,15 @@ def run_migrations():
         for column_name, data_type, default in post_columns:
             add_column_if_not_exists(cursor, 'post', column_name, data_type, default)
         
+        # Backfill the precomputed trending score and index it for the homepage
+        cursor.execute(
+            "UPDATE post SET trending_score = COALESCE(likes, 0) * 2 + COALESCE(views, 0) "
+            "WHERE trending_score IS DISTINCT FROM COALESCE(likes, 0) * 2 + COALESCE(views, 0)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_post_published_trending ON post (published, trending_score)"
+        )
+        
         # Now check if Video table exists
         cursor.execute(
             "SELECT EXISTS(SELECT 1 FROM information_schema.tables WHERE table_name = 'video')"
@@ -111,13 +125,51 @@ def run_migrations():
             category_columns = [
                 ('id', 'SERIAL PRIMARY KEY', None),  # This should already exist
                 ('name', 'VARCHAR(50) NOT NULL', None),  # This should already exist
-                ('slug', 'VARCHAR(50) NOT NULL', None)  # This should already exist
+                ('slug', 'VARCHAR(50) NOT NULL', None),  # This should already exist
+                ('post_count', 'INTEGER', '0'),
+                ('video_count', 'INTEGER', '0')
             ]
             
             # Check each column and add if it doesn't exist for Category table
             logger.info("Checking for missing columns in category table...")
             for column_name, data_type, default in category_columns:
                 add_column_if_not_exists(cursor, 'category', column_name, data_type, default)
+            
+            # Resync the denormalized counters used when CATEGORY_COUNTS=denormalized
+            cursor.execute(
+                "UPDATE category SET "
+                "post_count = (SELECT COUNT(*) FROM post WHERE post.category_id = category.id), "
+                "video_count = (SELECT COUNT(*) FROM video WHERE video.category_id = category.id)"
+            )
+        
+        # Full-text search vectors (see search.py); filled by rebuild_search_index.py
+        logger.info("Ensuring full-text search columns and indexes exist...")
+        for table in ('post', 'video'):
+            add_column_if_not_exists(cursor, table, 'search_vector', 'TSVECTOR')
+            cursor.execute(
+                sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING GIN (search_vector)").format(
+                    sql.Identifier(f'ix_{table}_search_vector'),
+                    sql.Identifier(table)
+                )
+            )
+        
+        # Counter shards for like/dislike votes (RATING_MODE=sharded)
+        logger.info("Ensuring post_rating_shard table exists...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS post_rating_shard (
+                post_id INTEGER NOT NULL REFERENCES post(id) ON DELETE CASCADE,
+                shard INTEGER NOT NULL,
+                likes INTEGER NOT NULL DEFAULT 0,
+                dislikes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (post_id, shard)
+            )
+        """)
+        
+        # Indexes for the public listings and comment lookups (declared on the
+        # models in app.py as well); check_indexes.py verifies the queries use them
+        logger.info("Ensuring listing and comment indexes exist...")
+        for name, table, columns in HOT_PATH_INDEXES:
+            create_index_if_not_exists(cursor, name, table, columns)
         
         logger.info("All migrations completed successfully")
         conn.close()
@@ -128,6 +180,47 @@ def run_migrations():
             conn.close()
         return False
 
+# (index name, table, indexed columns)
+HOT_PATH_INDEXES = [
+    ('ix_post_published_created_at', 'post', 'published, created_at DESC, id DESC'),
+    ('ix_post_category_published_created_at', 'post', 'category_id, published, created_at DESC, id DESC'),
+    ('ix_post_created_at', 'post', 'created_at DESC'),
+    ('ix_video_published_created_at', 'video', 'published, created_at DESC, id DESC'),
+    ('ix_video_category_published_created_at', 'video', 'category_id, published, created_at DESC, id DESC'),
+    ('ix_video_created_at', 'video', 'created_at DESC'),
+    ('ix_comment_post_status', 'comment', 'post_id, status'),
+    ('ix_comment_video_id', 'comment', 'video_id'),
+    ('ix_comment_status_created_at', 'comment', 'status, created_at DESC'),
+]
+
+def create_index_if_not_exists(cursor, name, table, columns):
+    """Build an index without blocking writes to the table (needs an autocommit connection)"""
+    try:
+        # A CONCURRENTLY build that failed leaves an invalid index behind; rebuild it
+        cursor.execute(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+            (name,)
+        )
+        row = cursor.fetchone()
+        if row is not None and row[0]:
+            logger.info(f"Index '{name}' already exists")
+            return
+        if row is not None:
+            logger.warning(f"Index '{name}' is invalid, rebuilding it")
+            cursor.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name)))
+        
+        cursor.execute(
+            sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})").format(
+                sql.Identifier(name),
+                sql.Identifier(table),
+                sql.SQL(columns)
+            )
+        )
+        logger.info(f"Created index '{name}' on table '{table}'")
+    except Exception as e:
+        logger.error(f"Error creating index '{name}' on table '{table}': {str(e)}")
+        raise
+
 def add_column_if_not_exists(cursor, table, column, data_type, default=None):
     """Add a column to a table if it doesn't exist"""
     try:
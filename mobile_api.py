@@ -1,26 +1,19 @@
-from flask import jsonify, request, Blueprint, current_app
+from flask import jsonify, request, Blueprint
 from flask_login import current_user, login_required
 from werkzeug.security import check_password_hash
 from functools import wraps
 from datetime import datetime, timedelta
 import jwt
-from app import db, User, Post, Category, Comment, Video
+from app import db, User, Post, Category, Comment, Video, view_counter, ratings, invalidate_content_caches, search_index, listing_queries, category_stats, conditional_get
 import os
 import logging
-from werkzeug.utils import secure_filename
-from bs4 import BeautifulSoup
+from category_stats import EMPTY_COUNTS
 
 # Create Blueprint for mobile API
 mobile_api = Blueprint('mobile_api', __name__, url_prefix='/api/v1')
 
-# Setup logging
+# Records go through the app's log pipeline (see log_pipeline.py)
 logger = logging.getLogger('mobile_api')
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-logger.addHandler(handler)
-logger.setLevel(logging.INFO)
 
 # JWT Configuration
 JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'hepsihikaye-mobile-dev-key')
@@ -112,13 +105,14 @@ def refresh_token(current_user):
 # Posts routes
 @mobile_api.route('/posts', methods=['GET'])
 @token_required
+@listing_queries.budget(5)
 def mobile_get_posts(current_user):
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     category_id = request.args.get('category_id', type=int)
     featured = request.args.get('featured', type=bool)
     
-    query = Post.query
+    query = listing_queries.posts(with_content=False)
     
     if category_id:
         query = query.filter_by(category_id=category_id)
@@ -127,17 +121,22 @@ def mobile_get_posts(current_user):
         query = query.filter_by(featured=featured)
     
     posts = query.order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page)
+    # Counts for the whole page in one query, as reported by the single-post endpoint
+    ratings.prefetch(posts.items)
     
     result = {
         'items': [{
             'id': post.id,
             'title': post.title,
-            'excerpt': post.excerpt or (BeautifulSoup(post.content, 'html.parser').get_text()[:150] + '...' if len(BeautifulSoup(post.content, 'html.parser').get_text()) > 150 else BeautifulSoup(post.content, 'html.parser').get_text()),
+            'excerpt': post.display_excerpt,
+            'word_count': post.word_count,
+            'reading_time': post.reading_time,
             'category_id': post.category_id,
             'category_name': post.category.name if post.category else None,
             'created_at': post.created_at.isoformat(),
-            'views': post.views,
-            'likes': post.likes,
+            'views': view_counter.live_count(post),
+            'likes': ratings.live_likes(post),
+            'dislikes': ratings.live_dislikes(post),
             'published': post.published,
             'featured': post.featured,
             'image': post.image
@@ -159,6 +158,8 @@ def mobile_get_post(current_user, post_id):
         'title': post.title,
         'content': post.content,
         'excerpt': post.excerpt,
+        'word_count': post.word_count,
+        'reading_time': post.reading_time,
         'category_id': post.category_id,
         'category_name': post.category.name if post.category else None,
         'author_id': post.author_id,
@@ -213,6 +214,8 @@ def mobile_create_post(current_user):
     
     db.session.add(post)
     db.session.commit()
+    search_index.index_post(post)
+    invalidate_content_caches('posts')
     
     return api_response({'id': post.id, 'title': post.title}, status=201, message="Post created successfully")
 
@@ -246,6 +249,8 @@ def mobile_update_post(current_user, post_id):
     if 'image' in data: post.image = data['image'] # Assuming image URL might be passed
     
     db.session.commit()
+    search_index.index_post(post)
+    invalidate_content_caches('posts', f'post-{post.id}')
     
     return api_response({'id': post.id, 'title': post.title}, message="Post updated successfully")
 
@@ -256,20 +261,25 @@ def mobile_delete_post(current_user, post_id):
     
     db.session.delete(post)
     db.session.commit()
+    search_index.remove_post(post_id)
+    invalidate_content_caches('posts', f'post-{post_id}')
     
     return api_response(message="Post deleted successfully")
 
 # Category routes
 @mobile_api.route('/categories', methods=['GET'])
 @token_required
+@listing_queries.budget(3)
 def mobile_get_categories(current_user):
     categories = Category.query.all()
+    counts = category_stats.counts()
     
     result = [{
         'id': category.id,
         'name': category.name,
         'slug': category.slug,
-        'post_count': len(category.posts)
+        'post_count': counts.get(category.id, EMPTY_COUNTS).posts,
+        'video_count': counts.get(category.id, EMPTY_COUNTS).videos
     } for category in categories]
     
     return api_response(result)
@@ -277,12 +287,13 @@ def mobile_get_categories(current_user):
 # Comments routes
 @mobile_api.route('/comments', methods=['GET'])
 @token_required
+@listing_queries.budget(5)
 def mobile_get_comments(current_user):
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     status = request.args.get('status')
     
-    query = Comment.query
+    query = listing_queries.comments()
     
     if status:
         query = query.filter_by(status=status)
@@ -321,6 +332,8 @@ def mobile_update_comment_status(current_user, comment_id):
         comment.status = data['status']
     
     db.session.commit()
+    if comment.post_id:
+        invalidate_content_caches(f'post-{comment.post_id}')
     
     return api_response(message="Comment status updated")
 
@@ -392,33 +405,14 @@ def mobile_upload_media(current_user):
     
     folder = request.form.get('folder', 'posts')
     
-    # Upload to Supabase or local folder based on app config
-    from app import upload_to_supabase
+    from app import storage
     
     try:
-        if hasattr(current_app, 'config') and current_app.config.get('SUPABASE_URL'):
-            # Upload to Supabase
-            url = upload_to_supabase(file, folder)
-            if url:
-                return api_response({'url': url}, message="File uploaded successfully")
-            else:
-                return api_response(message="Failed to upload file to Supabase", status=500)
-        else:
-            # Local upload
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            new_filename = f"{timestamp}_{filename}"
-            
-            upload_folder = os.path.join(current_app.static_folder, 'uploads', folder)
-            
-            if not os.path.exists(upload_folder):
-                os.makedirs(upload_folder)
-                
-            file_path = os.path.join(upload_folder, new_filename)
-            file.save(file_path)
-            
-            url = url_for('static', filename=f'uploads/{folder}/{new_filename}', _external=True)
-            return api_response({'url': url}, message="File uploaded successfully")
+        stored = storage.save_upload(file, folder)
+        if not stored:
+            return api_response(message="Failed to store file", status=500)
+        url = storage.url(stored, external=True)
+        return api_response({'url': url}, message="File uploaded successfully")
             
     except Exception as e:
         logger.error(f"Upload error: {e}")
@@ -426,30 +420,37 @@ def mobile_upload_media(current_user):
 
 @mobile_api.route('/feed', methods=['GET'])
 @token_required
+@conditional_get.listing(tags=('posts', 'categories'), category_arg='category_id', live=True)
+@listing_queries.budget(5)
 def mobile_get_feed(current_user):
     """Get the latest posts in a format optimized for the iOS app."""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     category_id = request.args.get('category_id', type=int)
     
-    query = Post.query.filter_by(published=True)
+    query = listing_queries.posts(with_author=True, with_content=False).filter_by(published=True)
     
     if category_id:
         query = query.filter_by(category_id=category_id)
     
     posts = query.order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page)
+    # Counts for the whole page in one query, as reported by the single-post endpoint
+    ratings.prefetch(posts.items)
     
     result = {
         'items': [{
             'id': item.id,
             'type': 'post' if isinstance(item, Post) else 'video',
             'title': item.title,
-            'excerpt': getattr(item, 'excerpt', None) or (BeautifulSoup(getattr(item, 'content', ''), 'html.parser').get_text()[:150] + '...' if len(BeautifulSoup(getattr(item, 'content', ''), 'html.parser').get_text()) > 150 else BeautifulSoup(getattr(item, 'content', ''), 'html.parser').get_text()),
+            'excerpt': item.display_excerpt,
+            'word_count': item.word_count,
+            'reading_time': item.reading_time,
             'category_id': item.category_id,
             'category_name': item.category.name if item.category else None,
             'created_at': item.created_at.isoformat(),
-            'views': getattr(item, 'views', 0),
-            'likes': getattr(item, 'likes', 0),
+            'views': view_counter.live_count(item),
+            'likes': ratings.live_likes(item),
+            'dislikes': ratings.live_dislikes(item),
             'published': item.published,
             'featured': getattr(item, 'featured', False),
             'image': getattr(item, 'image', None),
@@ -464,30 +465,37 @@ def mobile_get_feed(current_user):
     return api_response(result)
 
 @mobile_api.route('/public/feed', methods=['GET'])
+@conditional_get.listing(tags=('posts', 'categories'), category_arg='category_id', live=True)
+@listing_queries.budget(5)
 def mobile_get_public_feed():
     """Get the latest public posts for the iOS app without requiring authentication."""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     category_id = request.args.get('category_id', type=int)
     
-    query = Post.query.filter_by(published=True)
+    query = listing_queries.posts(with_author=True, with_content=False).filter_by(published=True)
     
     if category_id:
         query = query.filter_by(category_id=category_id)
     
     posts = query.order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page)
+    # Counts for the whole page in one query, as reported by the single-post endpoint
+    ratings.prefetch(posts.items)
     
     result = {
         'items': [{
             'id': item.id,
             'type': 'post' if isinstance(item, Post) else 'video',
             'title': item.title,
-            'excerpt': getattr(item, 'excerpt', None) or (BeautifulSoup(getattr(item, 'content', ''), 'html.parser').get_text()[:150] + '...' if len(BeautifulSoup(getattr(item, 'content', ''), 'html.parser').get_text()) > 150 else BeautifulSoup(getattr(item, 'content', ''), 'html.parser').get_text()),
+            'excerpt': item.display_excerpt,
+            'word_count': item.word_count,
+            'reading_time': item.reading_time,
             'category_id': item.category_id,
             'category_name': item.category.name if item.category else None,
             'created_at': item.created_at.isoformat(),
-            'views': getattr(item, 'views', 0),
-            'likes': getattr(item, 'likes', 0),
+            'views': view_counter.live_count(item),
+            'likes': ratings.live_likes(item),
+            'dislikes': ratings.live_dislikes(item),
             'published': item.published,
             'featured': getattr(item, 'featured', False),
             'image': getattr(item, 'image', None),
@@ -502,28 +510,31 @@ def mobile_get_public_feed():
     return api_response(result)
 
 @mobile_api.route('/public/post/<int:post_id>', methods=['GET'])
+@conditional_get.post(tags=('categories',), published_only=True,
+                      on_not_modified=lambda post_id: view_counter.increment(post_id))
 def mobile_get_public_post(post_id):
     """Get a single public post with full content without requiring authentication."""
     post = Post.query.filter_by(id=post_id, published=True).first_or_404()
     
-    # Increment view count
-    post.views += 1
-    db.session.commit()
+    # Increment view count (buffered, written to the database in batches)
+    view_counter.increment(post.id)
     
     result = {
         'id': post.id,
         'title': post.title,
         'content': post.content,
         'excerpt': post.excerpt,
+        'word_count': post.word_count,
+        'reading_time': post.reading_time,
         'category_id': post.category_id,
         'category_name': post.category.name if post.category else None,
         'author_id': post.author_id,
         'author_username': post.author_relationship.username if post.author_relationship else None,
         'created_at': post.created_at.isoformat(),
         'updated_at': post.updated_at.isoformat() if post.updated_at else None,
-        'views': post.views,
-        'likes': post.likes,
-        'dislikes': post.dislikes,
+        'views': view_counter.live_count(post),
+        'likes': ratings.live_likes(post),
+        'dislikes': ratings.live_dislikes(post),
         'image': post.image,
         'enclosure': {
             'url': post.image if post.image and post.image.startswith('http') else f"{request.url_root.rstrip('/')}/static/uploads/{post.image}" if post.image else None,
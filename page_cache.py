@@ -0,0 +1,416 @@
+"""
+Rendered page cache for public routes.
+
+Pages are stored per route and query string in an in-process LRU (bounded
+by total bytes) and, optionally, in a store shared by all gunicorn workers
+(``PAGE_CACHE_BACKEND = 'filesystem'`` or ``'sqlite'``). Every entry is
+tagged (``posts``, ``post-<id>``, ``videos``, ``categories``...) and is
+dropped as soon as one of its tags is invalidated through
+``PageCache.invalidate``. Hits are answered with ETag/Last-Modified
+validators so browsers can revalidate with a 304, and in the gzip/brotli
+variant stored with the page when compression is enabled (see
+compression.py).
+
+Per-visitor bits are kept out of the cache: pages are not cached for
+logged-in admins or while flash messages are pending, and the CSRF token
+embedded at render time is swapped for the visitor's own token on each hit.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, request, session, template_rendered
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+import cache_versions
+
+# Headers that are recomputed on every hit instead of being replayed
+SKIP_HEADERS = {'content-length', 'set-cookie', 'etag', 'last-modified', 'vary'}
+# Start of a stored entry; bump when the layout changes
+ENTRY_MAGIC = b'HHPC1'
+
+
+def private_directory(path):
+    """Create path readable by this user only; cached entries are trusted when read back"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+def pack_entry(entry):
+    """
+    Serialise an entry as a JSON header followed by its raw byte strings.
+    Unlike pickle, reading a tampered file can't run code.
+    """
+    blobs = []
+
+    def encode(value):
+        if isinstance(value, bytes):
+            blobs.append(value)
+            return {'$blob': len(blobs) - 1}
+        if isinstance(value, dict):
+            return {key: encode(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(item) for item in value]
+        return value
+
+    header = json.dumps({'entry': encode(entry), 'blobs': [len(blob) for blob in blobs]}).encode('utf-8')
+    return b''.join([ENTRY_MAGIC, struct.pack('>I', len(header)), header, *blobs])
+
+
+def unpack_entry(data):
+    """The entry packed by pack_entry; ValueError if data isn't one"""
+    start = len(ENTRY_MAGIC) + 4
+    if data[:len(ENTRY_MAGIC)] != ENTRY_MAGIC or len(data) < start:
+        raise ValueError('not a cache entry')
+    header_size, = struct.unpack('>I', data[len(ENTRY_MAGIC):start])
+    header = json.loads(data[start:start + header_size])
+    blobs = []
+    offset = start + header_size
+    for size in header['blobs']:
+        blobs.append(bytes(data[offset:offset + size]))
+        offset += size
+    if offset != len(data):
+        raise ValueError('truncated cache entry')
+
+    def decode(value):
+        if isinstance(value, dict):
+            if set(value) == {'$blob'}:
+                return blobs[value['$blob']]
+            return {key: decode(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [decode(item) for item in value]
+        return value
+
+    return decode(header['entry'])
+
+
+def entry_size(entry):
+    """Bytes held by an entry: the page and its compressed variants"""
+    size = len(entry['body'])
+    for variant in entry.get('encoded', {}).values():
+        size += sum(map(len, variant)) if isinstance(variant, list) else len(variant)
+    return size
+
+
+class MemoryBackend:
+    """In-process LRU cache bounded by entry count and total body bytes"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=2000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= entry_size(old)
+            self._entries[key] = entry
+            self.size += size
+            while self._entries and (self.size > self.max_bytes or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= entry_size(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= entry_size(old)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class FileSystemBackend:
+    """One file per page in a directory shared by all workers"""
+
+    def __init__(self, directory):
+        self.directory = private_directory(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.page')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = unpack_entry(f.read())
+        except (OSError, ValueError, KeyError, IndexError):
+            return None
+        return entry if entry.get('key') == key else None
+
+    def set(self, key, entry):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(pack_entry(entry))
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.page'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class SQLiteBackend:
+    """Pages stored in a local SQLite file shared by all workers"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        # sqlite3 connections can't cross threads (or forks); keep one per thread and pid
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM page_cache WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+            return unpack_entry(row[0]) if row else None
+        except (sqlite3.Error, ValueError, KeyError, IndexError):
+            return None
+
+    def set(self, key, entry):
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO page_cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, pack_entry(entry), entry['expires'])
+            )
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key):
+        try:
+            self._connection().execute("DELETE FROM page_cache WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM page_cache")
+        except sqlite3.Error:
+            pass
+
+
+def _record_template(sender, template, context, **extra):
+    if template.name:
+        g.setdefault('rendered_templates', []).append(template.name)
+
+
+class PageCache:
+    """Cache whole rendered responses of public routes"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.memory = None
+        self.shared = None
+        self.default_timeout = 300
+        self.enabled = True
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure backends from PAGE_CACHE_* settings"""
+        self.app = app
+        app.config.setdefault('PAGE_CACHE_BACKEND', os.environ.get('PAGE_CACHE_BACKEND', 'memory'))
+        app.config.setdefault('PAGE_CACHE_TIMEOUT', int(os.environ.get('PAGE_CACHE_TIMEOUT', 300)))
+        app.config.setdefault('PAGE_CACHE_MAX_BYTES',
+                              int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)))
+        app.config.setdefault('PAGE_CACHE_MAX_ENTRIES', int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 2000)))
+        # Inside the app's instance folder, not a temp directory other users can write to
+        app.config.setdefault('PAGE_CACHE_DIR', os.environ.get(
+            'PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page-cache')
+        ))
+
+        backend = app.config['PAGE_CACHE_BACKEND']
+        self.default_timeout = app.config['PAGE_CACHE_TIMEOUT']
+        self.enabled = backend != 'none'
+        self.memory = MemoryBackend(app.config['PAGE_CACHE_MAX_BYTES'], app.config['PAGE_CACHE_MAX_ENTRIES'])
+        try:
+            if backend == 'filesystem':
+                self.shared = FileSystemBackend(app.config['PAGE_CACHE_DIR'])
+            elif backend == 'sqlite':
+                private_directory(app.config['PAGE_CACHE_DIR'])
+                self.shared = SQLiteBackend(os.path.join(app.config['PAGE_CACHE_DIR'], 'pages.sqlite3'))
+            elif backend not in ('memory', 'none'):
+                app.logger.warning(f"Unknown PAGE_CACHE_BACKEND '{backend}', using memory only")
+        except Exception as e:
+            app.logger.error(f"Page cache backend '{backend}' unavailable, using memory only: {str(e)}")
+            self.shared = None
+
+        template_rendered.connect(_record_template, app)
+        app.extensions['page_cache'] = self
+
+    def cached(self, tags=(), timeout=None, on_hit=None):
+        """
+        Decorator caching a view's response.
+
+        tags may be a tuple or a callable taking the view arguments; on_hit
+        is called with the view arguments when a cached response is served.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._can_cache():
+                    return view(*args, **kwargs)
+
+                entry_tags = tags(**kwargs) if callable(tags) else tags
+                key = self._make_key()
+                entry = self._load(key)
+                if entry is not None:
+                    if on_hit is not None:
+                        on_hit(*args, **kwargs)
+                    return self._respond(entry, 'HIT')
+
+                # Take the tag stamps before rendering so an invalidation that
+                # lands mid-render leaves this entry stale rather than fresh
+                stamps = {tag: cache_versions.current(f'page-{tag}') for tag in entry_tags}
+                response = self.app.make_response(view(*args, **kwargs))
+                entry = self._build_entry(key, response, stamps, timeout or self.default_timeout)
+                if entry is None:
+                    return response
+                self.memory.set(key, entry)
+                if self.shared is not None:
+                    self.shared.set(key, entry)
+                return self._respond(entry, 'MISS')
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        """Drop every cached page carrying one of tags, in all workers"""
+        for tag in tags:
+            # A tag that can't be bumped must not keep the others stale
+            try:
+                cache_versions.bump(f'page-{tag}')
+            except OSError as e:
+                self.app.logger.error(f"Page cache invalidation of '{tag}' failed: {str(e)}")
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def _can_cache(self):
+        if not self.enabled or request.method not in ('GET', 'HEAD'):
+            return False
+        if current_user.is_authenticated or session.get('_flashes'):
+            return False
+        return True
+
+    def _make_key(self):
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'{request.path}?{query}'
+
+    def _is_fresh(self, entry):
+        if entry['expires'] <= time.time():
+            return False
+        return all(cache_versions.current(f'page-{tag}') == stamp for tag, stamp in entry['tags'].items())
+
+    def _load(self, key):
+        entry = self.memory.get(key)
+        if entry is not None and not self._is_fresh(entry):
+            self.memory.delete(key)
+            entry = None
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None and not self._is_fresh(entry):
+                self.shared.delete(key)
+                entry = None
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def _build_entry(self, key, response, stamps, timeout):
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return None
+        # Routes render the error templates with a 200 status; never cache those
+        if any(name.startswith('errors/') for name in g.get('rendered_templates', [])):
+            return None
+
+        body = response.get_data()
+        now = time.time()
+        csrf_token = g.get('csrf_token')
+        compression = self.app.extensions.get('compression')
+        return {
+            'key': key,
+            'body': body,
+            'status': response.status_code,
+            'headers': [(k, v) for k, v in response.headers.items() if k.lower() not in SKIP_HEADERS],
+            'etag': hashlib.sha1(body).hexdigest(),
+            'last_modified': now,
+            'expires': now + timeout,
+            'tags': stamps,
+            'csrf_token': csrf_token,
+            # Compressed once here rather than on every hit
+            'encoded': compression.encode_entry(body, csrf_token.encode('utf-8') if csrf_token else None)
+            if compression is not None else {},
+        }
+
+    def _respond(self, entry, state):
+        body = entry['body']
+        etag = entry['etag']
+        old_token = new_token = None
+        if entry.get('csrf_token'):
+            # Give every visitor their own token in place of the one rendered
+            old_token = entry['csrf_token'].encode('utf-8')
+            new_token = generate_csrf().encode('utf-8')
+            body = body.replace(old_token, new_token)
+            etag = hashlib.sha1(f"{etag}:{session.get('csrf_token', '')}:{int(time.time() // 1800)}"
+                                .encode('utf-8')).hexdigest()
+
+        response = self.app.response_class(body, status=entry['status'], headers=entry['headers'])
+        response.set_etag(etag)
+        response.last_modified = entry['last_modified']
+        response.headers['X-Cache'] = state
+        response.headers.setdefault('Cache-Control', 'no-cache')
+        compression = self.app.extensions.get('compression')
+        if compression is not None and entry.get('encoded'):
+            compression.respond_encoded(response, entry['body'], entry['encoded'], old_token, new_token)
+        return response.make_conditional(request)
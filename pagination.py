@@ -0,0 +1,116 @@
+"""
+Shared pagination helpers.
+
+Public listings use keyset pagination: rows are ordered by
+``(created_at DESC, id DESC)`` and the next page starts strictly after the
+last row of the current one, so the cost of a page does not grow with the
+archive and new posts never shift items between pages. The position is
+carried in an opaque, URL-safe ``cursor`` token.
+
+Admin listings keep numbered pages (``Query.paginate``), and listings can be
+fetched as JSON fragments for infinite scrolling (``?fragment=1``).
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from flask import jsonify, render_template, request, url_for
+from sqlalchemy import and_, or_
+
+DEFAULT_PER_PAGE = 12
+MAX_PER_PAGE = 50
+
+
+def encode_cursor(created_at, object_id):
+    """Encode a (created_at, id) position as a URL-safe token"""
+    raw = f"{created_at.isoformat() if created_at else ''}|{object_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token, returning (created_at, id) or None if invalid"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, _, object_id = base64.urlsafe_b64decode(padded).decode('utf-8').partition('|')
+        return (datetime.fromisoformat(created_at) if created_at else None), int(object_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+
+
+def per_page_arg(default=DEFAULT_PER_PAGE):
+    """Read ?per_page= from the request, clamped to a sane range"""
+    return max(1, min(request.args.get('per_page', default, type=int), MAX_PER_PAGE))
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing"""
+
+    def __init__(self, items, next_cursor, cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def next_url(self, endpoint, **values):
+        """URL of the next page for endpoint, or None on the last page"""
+        if self.next_cursor is None:
+            return None
+        values.setdefault('per_page', request.args.get('per_page', type=int))
+        return url_for(endpoint, cursor=self.next_cursor, **values)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_query(query, model, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """
+    query ordered newest first, limited to the page after cursor plus one
+    row (to learn whether there is a next page). query must not be ordered yet.
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, object_id = position
+        if created_at is not None:
+            query = query.filter(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < object_id)
+            ))
+        else:
+            query = query.filter(model.id < object_id)
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1)
+
+
+def keyset_paginate(query, model, cursor=None, per_page=DEFAULT_PER_PAGE):
+    """
+    Return a KeysetPage of query ordered newest first, starting after cursor.
+    query must not be ordered yet.
+    """
+    rows = keyset_query(query, model, cursor, per_page).all()
+    items = rows[:per_page]
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return KeysetPage(items, next_cursor, cursor)
+
+
+def wants_fragment():
+    """True when the listing was requested as an infinite-scroll fragment"""
+    return request.args.get('fragment') == '1'
+
+
+def fragment_response(template, next_url, **context):
+    """Render the item cards of a listing page as JSON for infinite scrolling"""
+    return jsonify({
+        'html': render_template(template, **context),
+        'next_url': next_url,
+        'has_next': next_url is not None,
+    })
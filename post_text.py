@@ -0,0 +1,86 @@
+"""
+Plain-text fields derived from post HTML.
+
+Listings and the mobile API need a short text excerpt, a word count and a
+reading time for every post. Parsing ``post.content`` for that on each
+request is expensive, so the values are computed once when a post is
+written (see the ``before_insert``/``before_update`` hooks in app.py) and
+stored on ``post.summary``, ``post.word_count`` and ``post.reading_time``.
+Rows written before these columns existed are filled by
+backfill_post_text.py.
+"""
+import math
+
+from bs4 import BeautifulSoup
+
+EXCERPT_LENGTH = 150
+WORDS_PER_MINUTE = 200
+
+
+def html_to_text(html):
+    """Return the visible text of an HTML fragment with collapsed whitespace"""
+    if not html:
+        return ''
+    return ' '.join(BeautifulSoup(html, 'html.parser').get_text(' ').split())
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """Shorten text to at most length characters, cutting on a word boundary"""
+    if len(text) <= length:
+        return text
+    cut = text[:length]
+    if ' ' in cut and not text[length].isspace():
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip(' ,.;:') + '...'
+
+
+def reading_minutes(word_count):
+    """Estimated reading time in whole minutes (at least 1)"""
+    return max(1, math.ceil(word_count / WORDS_PER_MINUTE))
+
+
+def derive(html):
+    """Compute (summary, word_count, reading_time) for a post body"""
+    text = html_to_text(html)
+    word_count = len(text.split())
+    return make_excerpt(text), word_count, reading_minutes(word_count)
+
+
+def apply(post):
+    """Store the derived text fields on a post instance"""
+    post.summary, post.word_count, post.reading_time = derive(post.content)
+
+
+def backfill(db, post_model, batch_size=200, only_missing=True):
+    """Fill the derived fields for existing posts in batches; returns the number updated"""
+    query = post_model.query.order_by(post_model.id)
+    if only_missing:
+        query = query.filter(post_model.summary.is_(None))
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = query.filter(post_model.id > last_id).limit(batch_size).all()
+        if not batch:
+            break
+        rows = []
+        for post in batch:
+            summary, word_count, reading_time = derive(post.content)
+            rows.append({'b_id': post.id, 'summary': summary,
+                         'word_count': word_count, 'reading_time': reading_time})
+        last_id = batch[-1].id
+
+        # Core UPDATE so the ORM update hooks (and updated_at) don't fire
+        table = post_model.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('b_id')).values(
+                summary=db.bindparam('summary'),
+                word_count=db.bindparam('word_count'),
+                reading_time=db.bindparam('reading_time'),
+            ),
+            rows
+        )
+        db.session.commit()
+        db.session.expunge_all()
+        updated += len(rows)
+    return updated
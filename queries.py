@@ -0,0 +1,138 @@
+"""
+Query builders for listings.
+
+Listing pages and API endpoints show related fields for every row
+(``post.category.name``, ``post.author_relationship.username``,
+``comment.post.title``...). Loading those lazily costs one SELECT per row,
+so the builders here eager-load exactly what each kind of listing needs.
+
+``ListingQueries.budget`` guards a view against regressions: it counts the
+SQL statements a request runs and fails (in tests, or with
+``QUERY_BUDGET_STRICT``) or logs a warning when the count goes over the
+view's budget. ``check_query_budgets.py`` requests every listing view with
+``TESTING`` on.
+"""
+import os
+from functools import wraps
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import defer, joinedload, load_only
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more SQL statements than its budget allows"""
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        counter = g.get('query_counter')
+        if counter is not None:
+            counter.count += 1
+            if counter.statements is not None:
+                counter.statements.append(statement)
+
+
+class QueryCounter:
+    """Count the SQL statements run in the current app context"""
+
+    def __init__(self, keep_statements=False):
+        self.count = 0
+        self.statements = [] if keep_statements else None
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = g.get('query_counter')
+        g.query_counter = self
+        return self
+
+    def __exit__(self, *exc):
+        g.query_counter = self._outer
+        # Statements also count towards an enclosing counter
+        if self._outer is not None:
+            self._outer.count += self.count
+            if self._outer.statements is not None and self.statements is not None:
+                self._outer.statements.extend(self.statements)
+        return False
+
+
+class uncounted(QueryCounter):
+    """Run one-off work (schema setup, backfills) without charging it to a view's budget"""
+
+    def __enter__(self):
+        if has_app_context():
+            super().__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        if has_app_context():
+            g.query_counter = self._outer
+        return False
+
+
+class ListingQueries:
+    """Eager-loading queries for post, video and comment listings"""
+
+    def __init__(self, app=None, db=None, post_model=None, video_model=None, comment_model=None):
+        self.app = None
+        self.Post = None
+        self.Video = None
+        self.Comment = None
+        if app is not None:
+            self.init_app(app, db, post_model, video_model, comment_model)
+
+    def init_app(self, app, db, post_model, video_model, comment_model):
+        """Bind the builders to the app and the post/video/comment models"""
+        self.app = app
+        self.Post = post_model
+        self.Video = video_model
+        self.Comment = comment_model
+        app.config.setdefault('QUERY_BUDGET_STRICT',
+                              os.environ.get('QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes'))
+        app.extensions['listing_queries'] = self
+
+    def posts(self, with_author=False, with_content=True):
+        """Posts with their category (and author) loaded in the same query"""
+        Post = self.Post
+        options = [joinedload(Post.category)]
+        if with_author:
+            options.append(joinedload(Post.author_relationship))
+        if not with_content:
+            # Listings that show the stored summary never need the full body
+            options.append(defer(Post.content))
+        return Post.query.options(*options)
+
+    def videos(self):
+        """Videos with their category loaded in the same query"""
+        return self.Video.query.options(joinedload(self.Video.category))
+
+    def comments(self):
+        """Comments with the id and title of the post or video they belong to"""
+        Comment, Post, Video = self.Comment, self.Post, self.Video
+        return Comment.query.options(
+            joinedload(Comment.post).options(load_only(Post.id, Post.title)),
+            joinedload(Comment.video).options(load_only(Video.id, Video.title)),
+        )
+
+    def budget(self, max_queries):
+        """Decorator failing (or warning) when a view runs more than max_queries statements"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                with QueryCounter(keep_statements=self._is_strict()) as counter:
+                    response = view(*args, **kwargs)
+                if counter.count > max_queries:
+                    message = (f"{view.__name__} ran {counter.count} SQL statements "
+                               f"(budget {max_queries})")
+                    if self._is_strict():
+                        details = '\n'.join(counter.statements or [])
+                        raise QueryBudgetExceeded(f"{message}:\n{details}")
+                    self.app.logger.warning(message)
+                return response
+            return wrapper
+        return decorator
+
+    def _is_strict(self):
+        return self.app.testing or self.app.config['QUERY_BUDGET_STRICT']
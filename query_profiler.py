@@ -0,0 +1,232 @@
+"""
+Per-request SQL profiling.
+
+SQLAlchemy cursor events time every statement run while a request is being
+handled. For each request the profiler keeps the query count, the total
+database time and the statements slower than ``QUERY_PROFILE_SLOW_MS``;
+bound parameters are never recorded, only their types and sizes.
+
+The numbers are:
+
+- sent back as a ``Server-Timing`` header (``db`` and ``app`` durations),
+  visible in the browser's network panel. On by default except on Render;
+  ``SERVER_TIMING`` switches it explicitly.
+- aggregated per endpoint in each worker and shown at ``/admin/perf``
+  together with the most recent slow statements.
+- written as one JSON line per request to ``QUERY_PROFILE_LOG``
+  (``logs/perf.log``, off by default under gunicorn like ``LOG_FILE``)
+  through the log pipeline's writer thread (see log_pipeline.py); slow
+  statements are also logged as warnings.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from log_pipeline import under_gunicorn
+
+
+def redact(parameters):
+    """Describe bound parameters without their values"""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: _describe(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            # executemany: report the batch size and the shape of one row
+            return {'rows': len(parameters), 'first': redact(parameters[0])}
+        return [_describe(value) for value in parameters]
+    return _describe(parameters)
+
+
+def _describe(value):
+    if value is None:
+        return None
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+class RequestProfile:
+    """SQL statements run while handling one request"""
+
+    __slots__ = ('started', 'queries', 'db_time', 'slow')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slow = []
+
+
+class EndpointStats:
+    """Totals for one endpoint in this worker"""
+
+    __slots__ = ('requests', 'queries', 'max_queries', 'db_time', 'max_db_time', 'total_time', 'max_total_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.max_db_time = 0.0
+        self.total_time = 0.0
+        self.max_total_time = 0.0
+
+    def add(self, profile, total_time):
+        self.requests += 1
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+        self.db_time += profile.db_time
+        self.max_db_time = max(self.max_db_time, profile.db_time)
+        self.total_time += total_time
+        self.max_total_time = max(self.max_total_time, total_time)
+
+
+class QueryProfiler:
+    """Time SQL per request and aggregate it per endpoint"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = True
+        self.server_timing = False
+        self.slow_seconds = 0.1
+        self.log_enabled = False
+        self.endpoints = {}
+        self.slow_queries = deque(maxlen=50)
+        self.started_at = time.time()
+        self.logger = logging.getLogger('hepsihikaye.perf')
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install the SQL and request hooks according to QUERY_PROFILE_* settings"""
+        self.app = app
+        app.config.setdefault('QUERY_PROFILE',
+                              os.environ.get('QUERY_PROFILE', '1').lower() in ('1', 'true', 'yes'))
+        app.config.setdefault('QUERY_PROFILE_SLOW_MS', float(os.environ.get('QUERY_PROFILE_SLOW_MS', 100)))
+        app.config.setdefault('QUERY_PROFILE_LOG', os.environ.get(
+            'QUERY_PROFILE_LOG', '' if under_gunicorn() else os.path.join('logs', 'perf.log')))
+        # Render sets RENDER=true; timings stay out of production responses unless asked for
+        app.config.setdefault('SERVER_TIMING', os.environ.get(
+            'SERVER_TIMING', '0' if os.environ.get('RENDER') else '1').lower() in ('1', 'true', 'yes'))
+        self.enabled = app.config['QUERY_PROFILE']
+        self.server_timing = app.config['SERVER_TIMING']
+        self.slow_seconds = app.config['QUERY_PROFILE_SLOW_MS'] / 1000
+        app.extensions['query_profiler'] = self
+        if not self.enabled:
+            return
+
+        self._setup_log(app.config['QUERY_PROFILE_LOG'])
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def stats(self):
+        """Per-endpoint averages and maxima (times in milliseconds), busiest first"""
+        with self._lock:
+            items = list(self.endpoints.items())
+            rows = [{
+                'endpoint': endpoint,
+                'requests': s.requests,
+                'avg_queries': s.queries / s.requests,
+                'max_queries': s.max_queries,
+                'avg_db_ms': s.db_time * 1000 / s.requests,
+                'max_db_ms': s.max_db_time * 1000,
+                'avg_ms': s.total_time * 1000 / s.requests,
+                'max_ms': s.max_total_time * 1000,
+                'db_share': s.db_time / s.total_time if s.total_time else 0.0,
+            } for endpoint, s in items]
+        return sorted(rows, key=lambda row: row['requests'] * row['avg_ms'], reverse=True)
+
+    def recent_slow_queries(self):
+        with self._lock:
+            return list(reversed(self.slow_queries))
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.slow_queries.clear()
+            self.started_at = time.time()
+
+    # --- hooks ----------------------------------------------------------------
+
+    def _setup_log(self, path):
+        pipeline = self.app.extensions.get('log_pipeline')
+        if not path or pipeline is None:
+            return
+        # Written on the pipeline's listener thread, not the request thread
+        self.log_enabled = pipeline.add_log_file(self.logger.name, path, max_bytes=1024 * 1024, backups=5)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profile_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_profile_start', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        if not has_request_context():
+            return
+        profile = g.get('query_profile')
+        if profile is None:
+            return
+        profile.queries += 1
+        profile.db_time += elapsed
+        if elapsed >= self.slow_seconds:
+            slow = {
+                'endpoint': request.endpoint,
+                'path': request.path,
+                'ms': round(elapsed * 1000, 1),
+                'statement': ' '.join(statement.split()),
+                'parameters': redact(parameters),
+                'at': time.time(),
+            }
+            profile.slow.append(slow)
+            with self._lock:
+                self.slow_queries.append(slow)
+            self.app.logger.warning(f"Slow query ({slow['ms']} ms) in {request.endpoint}: {slow['statement'][:500]}")
+
+    def _start_request(self):
+        g.query_profile = RequestProfile()
+
+    def _finish_request(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        total_time = time.perf_counter() - profile.started
+        endpoint = request.endpoint or '(unmatched)'
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.add(profile, total_time)
+
+        if self.server_timing:
+            response.headers.add('Server-Timing', f'db;dur={profile.db_time * 1000:.1f};desc="{profile.queries} queries"')
+            response.headers.add('Server-Timing', f'app;dur={total_time * 1000:.1f}')
+
+        if self.log_enabled:
+            self.logger.info(json.dumps({
+                'ts': round(time.time(), 3),
+                'pid': os.getpid(),
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'ms': round(total_time * 1000, 1),
+                'queries': profile.queries,
+                'db_ms': round(profile.db_time * 1000, 1),
+                'slow_queries': [{'ms': q['ms'], 'statement': q['statement'][:500]} for q in profile.slow],
+            }, ensure_ascii=False))
+        return response
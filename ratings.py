@@ -0,0 +1,258 @@
+"""
+Like/dislike rating engine.
+
+Votes are applied with server-side increments instead of read-modify-write
+on the ORM object, so concurrent votes are never lost. Three modes are
+available through ``RATING_MODE``:
+
+- ``atomic`` (default): ``UPDATE post SET likes = likes + 1 ... RETURNING``
+- ``sharded``: votes land on one of ``RATING_SHARDS`` counter rows per post
+  and are summed on read; shards are folded back into ``post`` periodically
+- ``buffered``: votes are collected per worker and flushed in batches
+"""
+import atexit
+import os
+import random
+
+from flask import g
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.exc import IntegrityError
+
+from view_counter import BufferedCounter, PeriodicFlusher
+
+RATING_COLUMNS = {'like': 'likes', 'dislike': 'dislikes'}
+
+
+class RatingEngine(PeriodicFlusher):
+    """Apply and read post like/dislike counts without lost updates"""
+
+    thread_name = 'rating-shard-compact'
+
+    def __init__(self, app=None, db=None, post_model=None, shard_model=None):
+        super().__init__()
+        self.app = None
+        self.db = None
+        self.posts = None
+        self.shards = None
+        self.mode = 'atomic'
+        self.shard_count = 8
+        self.buffers = {}
+        if app is not None:
+            self.init_app(app, db, post_model, shard_model)
+
+    def init_app(self, app, db, post_model, shard_model=None):
+        """Bind the engine to the app, database, post model and shard model"""
+        self.app = app
+        self.db = db
+        self.posts = post_model.__table__
+        self.shards = shard_model.__table__ if shard_model is not None else None
+
+        app.config.setdefault('RATING_MODE', os.environ.get('RATING_MODE', 'atomic'))
+        app.config.setdefault('RATING_SHARDS', int(os.environ.get('RATING_SHARDS', 8)))
+        app.config.setdefault('RATING_FLUSH_INTERVAL', float(os.environ.get('RATING_FLUSH_INTERVAL', 10)))
+        self.mode = app.config['RATING_MODE']
+        self.shard_count = max(1, app.config['RATING_SHARDS'])
+        self.flush_interval = app.config['RATING_FLUSH_INTERVAL']
+
+        if self.mode not in ('atomic', 'sharded', 'buffered'):
+            app.logger.warning(f"Unknown RATING_MODE '{self.mode}', falling back to 'atomic'")
+            self.mode = 'atomic'
+        if self.mode == 'sharded' and self.shards is None:
+            app.logger.warning("RATING_MODE 'sharded' needs a shard model, falling back to 'atomic'")
+            self.mode = 'atomic'
+        if self.mode == 'buffered':
+            self.buffers = {
+                column: BufferedCounter(app, db, post_model, column=column, config_prefix='RATING')
+                for column in RATING_COLUMNS.values()
+            }
+
+        app.extensions['ratings'] = self
+        app.add_template_filter(self.live_likes, 'live_likes')
+        app.add_template_filter(self.live_dislikes, 'live_dislikes')
+        if self.mode == 'sharded':
+            atexit.register(self.flush)
+
+    def rate(self, post_id, action):
+        """
+        Record a like or dislike and return the resulting (likes, dislikes),
+        or None if the post does not exist
+        """
+        column = RATING_COLUMNS[action]
+        if self.mode == 'sharded':
+            return self._rate_sharded(post_id, column)
+        if self.mode == 'buffered':
+            return self._rate_buffered(post_id, column)
+        return self._rate_atomic(post_id, column)
+
+    def counts(self, post_id):
+        """Return the current (likes, dislikes) for a post, including pending votes"""
+        cache = g.setdefault('rating_counts', {})
+        if post_id not in cache:
+            cache[post_id] = self._read_counts(post_id)
+        return cache[post_id]
+
+    def prefetch(self, posts):
+        """Read the counts of a listing's posts in one query for live_likes/live_dislikes"""
+        if self.mode == 'atomic':
+            return
+        cache = g.setdefault('rating_counts', {})
+        missing = {post.id for post in posts} - cache.keys()
+        if missing:
+            counts = self._read_many(missing)
+            for post_id in missing:
+                cache[post_id] = counts.get(post_id)
+
+    def live_likes(self, post):
+        """Template filter: like count including sharded/buffered votes"""
+        if self.mode == 'atomic':
+            return post.likes or 0
+        return (self.counts(post.id) or (0, 0))[0]
+
+    def live_dislikes(self, post):
+        """Template filter: dislike count including sharded/buffered votes"""
+        if self.mode == 'atomic':
+            return post.dislikes or 0
+        return (self.counts(post.id) or (0, 0))[1]
+
+    def flush(self):
+        """Write buffered votes or fold counter shards into the post table"""
+        if self.mode == 'buffered':
+            return sum(buffer.flush() for buffer in self.buffers.values())
+        if self.mode == 'sharded':
+            return self.compact_shards()
+        return 0
+
+    def stop(self):
+        """Stop background work and write out anything still pending"""
+        for buffer in self.buffers.values():
+            buffer.stop()
+        super().stop()
+
+    def compact_shards(self):
+        """Move the totals accumulated in counter shards onto the post rows"""
+        if self.shards is None:
+            return 0
+
+        try:
+            with self.app.app_context():
+                with self.db.engine.begin() as conn:
+                    shard_rows = conn.execute(
+                        select(self.shards.c.post_id, self.shards.c.shard,
+                               self.shards.c.likes, self.shards.c.dislikes)
+                        .where((self.shards.c.likes != 0) | (self.shards.c.dislikes != 0))
+                    ).all()
+                    if not shard_rows:
+                        return 0
+
+                    # Subtract what was read rather than zeroing the shard, so
+                    # votes landing while we compact are kept.
+                    conn.execute(
+                        self.shards.update()
+                        .where(self.shards.c.post_id == bindparam('b_post_id'))
+                        .where(self.shards.c.shard == bindparam('b_shard'))
+                        .values(likes=self.shards.c.likes - bindparam('b_likes'),
+                                dislikes=self.shards.c.dislikes - bindparam('b_dislikes')),
+                        [{'b_post_id': row.post_id, 'b_shard': row.shard,
+                          'b_likes': row.likes, 'b_dislikes': row.dislikes} for row in shard_rows]
+                    )
+
+                    totals = {}
+                    for row in shard_rows:
+                        likes, dislikes = totals.get(row.post_id, (0, 0))
+                        totals[row.post_id] = (likes + row.likes, dislikes + row.dislikes)
+                    conn.execute(
+                        self.posts.update()
+                        .where(self.posts.c.id == bindparam('b_id'))
+                        .values(likes=func.coalesce(self.posts.c.likes, 0) + bindparam('b_likes'),
+                                dislikes=func.coalesce(self.posts.c.dislikes, 0) + bindparam('b_dislikes')),
+                        [{'b_id': post_id, 'b_likes': likes, 'b_dislikes': dislikes}
+                         for post_id, (likes, dislikes) in totals.items()]
+                    )
+            return len(totals)
+        except Exception as e:
+            self.app.logger.error(f"Rating shard compaction error: {str(e)}")
+            return 0
+
+    def _rate_atomic(self, post_id, column):
+        session = self.db.session
+        col = self.posts.c[column]
+        stmt = self.posts.update() \
+            .where(self.posts.c.id == post_id) \
+            .values({col: func.coalesce(col, 0) + 1})
+
+        if self.db.engine.dialect.update_returning:
+            row = session.execute(stmt.returning(self.posts.c.likes, self.posts.c.dislikes)).first()
+            session.commit()
+            return (row.likes or 0, row.dislikes or 0) if row else None
+
+        result = session.execute(stmt)
+        session.commit()
+        if result.rowcount == 0:
+            return None
+        return self._read_counts(post_id)
+
+    def _rate_sharded(self, post_id, column):
+        session = self.db.session
+        if session.execute(select(self.posts.c.id).where(self.posts.c.id == post_id)).first() is None:
+            return None
+
+        shard = random.randrange(self.shard_count)
+        col = self.shards.c[column]
+        stmt = self.shards.update() \
+            .where(self.shards.c.post_id == post_id) \
+            .where(self.shards.c.shard == shard) \
+            .values({col: col + 1})
+
+        if session.execute(stmt).rowcount == 0:
+            try:
+                with session.begin_nested():
+                    session.execute(self.shards.insert().values(
+                        post_id=post_id, shard=shard,
+                        likes=1 if column == 'likes' else 0,
+                        dislikes=1 if column == 'dislikes' else 0
+                    ))
+            except IntegrityError:
+                # Another request created the shard row first
+                session.execute(stmt)
+        session.commit()
+
+        self._ensure_flusher()
+        return self._read_counts(post_id)
+
+    def _rate_buffered(self, post_id, column):
+        counts = self._read_counts(post_id)
+        if counts is None:
+            return None
+        self.buffers[column].increment(post_id)
+        likes, dislikes = counts
+        return (likes + 1, dislikes) if column == 'likes' else (likes, dislikes + 1)
+
+    def _read_counts(self, post_id):
+        return self._read_many([post_id]).get(post_id)
+
+    def _read_many(self, post_ids):
+        """{post_id: (likes, dislikes)} for the posts that exist, in one query"""
+        posts = self.posts
+        if self.mode == 'sharded':
+            # Shard totals are summed in the same query through a grouped outer join
+            shards = self.shards
+            stmt = select(posts.c.id, posts.c.likes, posts.c.dislikes,
+                          func.coalesce(func.sum(shards.c.likes), 0),
+                          func.coalesce(func.sum(shards.c.dislikes), 0)) \
+                .select_from(posts.outerjoin(shards, shards.c.post_id == posts.c.id)) \
+                .group_by(posts.c.id, posts.c.likes, posts.c.dislikes)
+        else:
+            stmt = select(posts.c.id, posts.c.likes, posts.c.dislikes)
+        rows = self.db.session.execute(stmt.where(posts.c.id.in_(list(post_ids)))).all()
+
+        counts = {}
+        for post_id, likes, dislikes, *shard_counts in rows:
+            likes, dislikes = likes or 0, dislikes or 0
+            if shard_counts:
+                likes += shard_counts[0]
+                dislikes += shard_counts[1]
+            elif self.mode == 'buffered':
+                likes += self.buffers['likes'].pending(post_id)
+                dislikes += self.buffers['dislikes'].pending(post_id)
+            counts[post_id] = (likes, dislikes)
+        return counts
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Rebuild the full-text search index for all posts and videos.
+
+Run after migrations.py has added the search columns on PostgreSQL, or any
+time the index looks out of sync. On SQLite the FTS tables are created and
+filled automatically on first use.
+"""
+import logging
+from app import app, search_index
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    with app.app_context():
+        logger.info(f"Rebuilding search index using the '{search_index.backend}' backend...")
+        count = search_index.reindex_all()
+        logger.info(f"Indexed {count} posts and videos")
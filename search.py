@@ -0,0 +1,285 @@
+"""
+Full-text search for posts and videos.
+
+Backends, picked automatically from the database in use:
+
+- PostgreSQL: ``search_vector`` tsvector columns with GIN indexes (created
+  by migrations.py), queried with the ``turkish`` text search config
+- SQLite: FTS5 virtual tables ``post_fts`` / ``video_fts``
+- anything else (or missing schema): the old ILIKE scan, but paginated
+
+Results are ranked, paginated and carry an HTML-safe highlighted snippet.
+The index is updated incrementally from the post/video write paths through
+``index_post``, ``remove_post``, ``index_video`` and ``remove_video``.
+"""
+import math
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import inspect, text
+
+from post_text import html_to_text
+from queries import uncounted
+
+TS_CONFIG = 'turkish'
+HIGHLIGHT_START = '[[hl]]'
+HIGHLIGHT_STOP = '[[/hl]]'
+SNIPPET_LENGTH = 200
+
+
+def highlight(raw_snippet):
+    """Escape a snippet and turn the highlight markers into <mark> tags"""
+    if not raw_snippet:
+        return Markup('')
+    parts = []
+    for i, chunk in enumerate(raw_snippet.split(HIGHLIGHT_START)):
+        if i == 0:
+            parts.append(escape(chunk))
+            continue
+        marked, _, rest = chunk.partition(HIGHLIGHT_STOP)
+        parts.append(Markup('<mark>') + escape(marked) + Markup('</mark>') + escape(rest))
+    return Markup('').join(parts)
+
+
+class SearchResults:
+    """One page of ranked search hits"""
+
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page)) if self.per_page else 1
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SearchIndex:
+    """Rank and paginate post/video matches and keep the index up to date"""
+
+    # (table, text columns) indexed per model; the first column is the title
+    SOURCES = {
+        'post': ('title', 'content'),
+        'video': ('title', 'description'),
+    }
+
+    def __init__(self, app=None, db=None, post_model=None, video_model=None):
+        self.app = None
+        self.db = None
+        self.models = {}
+        self._backend = None
+        if app is not None:
+            self.init_app(app, db, post_model, video_model)
+
+    def init_app(self, app, db, post_model, video_model):
+        """Bind the index to the app, database and the post/video models"""
+        self.app = app
+        self.db = db
+        self.models = {'post': post_model, 'video': video_model}
+        app.extensions['search_index'] = self
+
+    @property
+    def backend(self):
+        """'postgres', 'sqlite' or 'like', detected once per process"""
+        if self._backend is None:
+            with uncounted():
+                self._backend = self._detect_backend()
+        return self._backend
+
+    def search_posts(self, query, page=1, per_page=12, published_only=True, base_query=None):
+        return self._search('post', query, page, per_page, published_only, base_query)
+
+    def search_videos(self, query, page=1, per_page=12, published_only=True, base_query=None):
+        return self._search('video', query, page, per_page, published_only, base_query)
+
+    def index_post(self, post):
+        self._index('post', post.id, post.title, post.content)
+
+    def index_video(self, video):
+        self._index('video', video.id, video.title, video.description)
+
+    def remove_post(self, post_id):
+        self._remove('post', post_id)
+
+    def remove_video(self, video_id):
+        self._remove('video', video_id)
+
+    def reindex_all(self):
+        """Rebuild the whole index from the post and video tables"""
+        count = 0
+        for kind, (title_column, body_column) in self.SOURCES.items():
+            model = self.models[kind]
+            for obj in model.query.yield_per(200):
+                self._index(kind, obj.id, getattr(obj, title_column), getattr(obj, body_column), commit=False)
+                count += 1
+            self.db.session.commit()
+        return count
+
+    def _detect_backend(self):
+        dialect = self.db.engine.dialect.name
+        try:
+            if dialect == 'postgresql':
+                columns = {column['name'] for column in inspect(self.db.engine).get_columns('post')}
+                if 'search_vector' in columns:
+                    return 'postgres'
+                self.app.logger.warning("post.search_vector missing, run migrations.py; using ILIKE search")
+            elif dialect == 'sqlite':
+                self._ensure_sqlite_schema()
+                return 'sqlite'
+        except Exception as e:
+            self.app.logger.error(f"Search backend setup error: {str(e)}")
+        return 'like'
+
+    def _ensure_sqlite_schema(self):
+        with self.db.engine.begin() as conn:
+            existing = {row[0] for row in conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'table'")
+            )}
+            created = []
+            for kind in self.SOURCES:
+                if f'{kind}_fts' not in existing:
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {kind}_fts USING fts5("
+                        f"title, body, tokenize = 'unicode61 remove_diacritics 2')"
+                    ))
+                    created.append(kind)
+        if created:
+            self._backend = 'sqlite'
+            self.reindex_all()
+            self.app.logger.info(f"Created and filled SQLite search tables: {', '.join(created)}")
+
+    def _index(self, kind, object_id, title, body, commit=True):
+        try:
+            backend = self.backend
+            body_text = html_to_text(body)
+            if backend == 'postgres':
+                self.db.session.execute(text(
+                    f"UPDATE {kind} SET search_vector = "
+                    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(:title, '')), 'A') || "
+                    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(:body, '')), 'B') "
+                    f"WHERE id = :id"
+                ), {'id': object_id, 'title': title, 'body': body_text})
+            elif backend == 'sqlite':
+                self.db.session.execute(text(f"DELETE FROM {kind}_fts WHERE rowid = :id"), {'id': object_id})
+                self.db.session.execute(
+                    text(f"INSERT INTO {kind}_fts (rowid, title, body) VALUES (:id, :title, :body)"),
+                    {'id': object_id, 'title': title or '', 'body': body_text}
+                )
+            else:
+                return
+            if commit:
+                self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            self.app.logger.error(f"Search index update error ({kind} {object_id}): {str(e)}")
+
+    def _remove(self, kind, object_id):
+        # On PostgreSQL the vector lives on the row itself and goes with it
+        if self.backend != 'sqlite':
+            return
+        try:
+            self.db.session.execute(text(f"DELETE FROM {kind}_fts WHERE rowid = :id"), {'id': object_id})
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            self.app.logger.error(f"Search index delete error ({kind} {object_id}): {str(e)}")
+
+    def _search(self, kind, query, page, per_page, published_only, base_query=None):
+        page = max(1, page or 1)
+        query = (query or '').strip()
+        if not query:
+            return SearchResults([], 0, page, per_page)
+
+        backend = self.backend
+        if backend == 'postgres':
+            hits, total = self._search_postgres(kind, query, page, per_page, published_only)
+        elif backend == 'sqlite':
+            hits, total = self._search_sqlite(kind, query, page, per_page, published_only)
+        else:
+            hits, total = self._search_like(kind, query, page, per_page, published_only)
+
+        # Load the page of objects in one query and keep the ranked order;
+        # base_query lets callers eager-load what their listing shows
+        model = self.models[kind]
+        base_query = base_query if base_query is not None else model.query
+        ids = [object_id for object_id, _ in hits]
+        objects = {obj.id: obj for obj in base_query.filter(model.id.in_(ids)).all()} if ids else {}
+        items = []
+        for object_id, snippet in hits:
+            obj = objects.get(object_id)
+            if obj is not None:
+                obj.search_snippet = highlight(snippet)
+                items.append(obj)
+        return SearchResults(items, total, page, per_page)
+
+    def _search_postgres(self, kind, query, page, per_page, published_only):
+        body_column = self.SOURCES[kind][1]
+        published = f"AND {kind}.published" if published_only else ""
+        params = {'q': query, 'limit': per_page, 'offset': (page - 1) * per_page}
+
+        total = self.db.session.execute(text(
+            f"SELECT count(*) FROM {kind}, websearch_to_tsquery('{TS_CONFIG}', :q) query "
+            f"WHERE {kind}.search_vector @@ query {published}"
+        ), params).scalar()
+        rows = self.db.session.execute(text(
+            f"SELECT {kind}.id, ts_headline('{TS_CONFIG}', "
+            f"regexp_replace(coalesce({kind}.{body_column}, ''), '<[^>]+>', ' ', 'g'), query, "
+            f"'StartSel=\"{HIGHLIGHT_START}\", StopSel=\"{HIGHLIGHT_STOP}\", MaxWords=35, MinWords=15') AS snippet "
+            f"FROM {kind}, websearch_to_tsquery('{TS_CONFIG}', :q) query "
+            f"WHERE {kind}.search_vector @@ query {published} "
+            f"ORDER BY ts_rank_cd({kind}.search_vector, query) DESC, {kind}.created_at DESC "
+            f"LIMIT :limit OFFSET :offset"
+        ), params).all()
+        return [(row.id, row.snippet) for row in rows], total
+
+    def _search_sqlite(self, kind, query, page, per_page, published_only):
+        # Quote every word so user input can't inject FTS5 query syntax
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return [], 0
+        match = ' '.join(f'"{term}"*' for term in terms)
+        published = f"AND {kind}.published = 1" if published_only else ""
+        params = {'q': match, 'limit': per_page, 'offset': (page - 1) * per_page}
+
+        total = self.db.session.execute(text(
+            f"SELECT count(*) FROM {kind}_fts JOIN {kind} ON {kind}.id = {kind}_fts.rowid "
+            f"WHERE {kind}_fts MATCH :q {published}"
+        ), params).scalar()
+        rows = self.db.session.execute(text(
+            f"SELECT {kind}_fts.rowid AS id, "
+            f"snippet({kind}_fts, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '…', 24) AS snippet "
+            f"FROM {kind}_fts JOIN {kind} ON {kind}.id = {kind}_fts.rowid "
+            f"WHERE {kind}_fts MATCH :q {published} "
+            f"ORDER BY bm25({kind}_fts, 10.0, 1.0), {kind}.created_at DESC "
+            f"LIMIT :limit OFFSET :offset"
+        ), params).all()
+        return [(row.id, row.snippet) for row in rows], total
+
+    def _search_like(self, kind, query, page, per_page, published_only):
+        model = self.models[kind]
+        title_column, body_column = self.SOURCES[kind]
+        pattern = f'%{query}%'
+        q = model.query.filter(
+            getattr(model, title_column).ilike(pattern) | getattr(model, body_column).ilike(pattern)
+        )
+        if published_only:
+            q = q.filter(model.published == True)
+        total = q.count()
+        objects = q.order_by(model.created_at.desc()) \
+            .offset((page - 1) * per_page).limit(per_page).all()
+        return [(obj.id, html_to_text(getattr(obj, body_column))[:SNIPPET_LENGTH]) for obj in objects], total
@@ -137,6 +137,11 @@ function loadContent(url, pushState) {
                     // Reinitialize page elements
                     initializePageElements();
                     
+                    // Current vote counts on post pages (see post.js)
+                    if (typeof refreshRatingCounts === 'function') {
+                        refreshRatingCounts();
+                    }
+                    
                     // Scroll to top
                     window.scrollTo(0, 0);
                     
@@ -198,6 +203,9 @@ function initializePageElements() {
     // Attach pagination handlers
     attachPaginationHandlers();
     
+    // Infinite scrolling for keyset-paginated listings
+    initInfiniteScroll();
+    
     // Initialize any other components
 }
 
@@ -354,6 +362,97 @@ function attachPaginationHandlers() {
     });
 }
 
+// Observer of the current page's "load more" link (see initInfiniteScroll)
+var infiniteScrollObserver = null;
+
+/**
+ * Infinite scrolling for listings with a "load more" link
+ *
+ * The link points at the next page (?cursor=...). The same URL with
+ * fragment=1 returns {html, next_url}; the cards are appended to the
+ * [data-infinite-list] container and the link moves on to next_url.
+ */
+function initInfiniteScroll() {
+    // The previous page's observer watches a link that is no longer in the page
+    if (infiniteScrollObserver) {
+        infiniteScrollObserver.disconnect();
+        infiniteScrollObserver = null;
+    }
+    
+    var $list = $('[data-infinite-list]');
+    var $link = $('.load-more');
+    
+    if (!$list.length || !$link.length) return;
+    
+    var loading = false;
+    var observer = null;
+    
+    function loadMore() {
+        var href = $link.attr('href');
+        if (loading || !href) return;
+        loading = true;
+        
+        $.ajax({
+            url: href + (href.indexOf('?') === -1 ? '?' : '&') + 'fragment=1',
+            type: 'GET',
+            dataType: 'json',
+            timeout: 10000,
+            success: function(data) {
+                $list.append(data.html);
+                
+                if (data.next_url) {
+                    $link.attr('href', data.next_url);
+                } else {
+                    $link.closest('.load-more-container').remove();
+                    $link = $();
+                    if (observer) {
+                        observer.disconnect();
+                    }
+                }
+                
+                lazyLoadImages();
+                handleImageErrors();
+            },
+            error: function() {
+                // Fall back to loading the next page normally
+                window.location = href;
+            },
+            complete: function() {
+                loading = false;
+                
+                // If the new cards didn't push the link out of view, the observer
+                // won't fire again by itself; observing anew reports its current state.
+                // Skipped once navigation has replaced this page's observer.
+                if (observer && observer === infiniteScrollObserver && $link.length) {
+                    observer.unobserve($link[0]);
+                    observer.observe($link[0]);
+                }
+            }
+        });
+    }
+    
+    $link.off('click.infinite').on('click.infinite', function(e) {
+        e.preventDefault();
+        loadMore();
+    });
+    
+    // Load the next page automatically when the link scrolls into view
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(function(entries) {
+            entries.forEach(function(entry) {
+                if (entry.isIntersecting && $link.length) {
+                    loadMore();
+                }
+            });
+        }, {
+            rootMargin: '200px 0px'
+        });
+        
+        observer.observe($link[0]);
+        infiniteScrollObserver = observer;
+    }
+}
+
 /**
  * Handle image loading errors
  */
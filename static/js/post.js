@@ -46,6 +46,8 @@ function ratePost(postId, isLike) {
                 console.log(`Updated dislikes to ${data.dislikes}`);
             }
             
+            showRatingTotal(postId, data.likes, data.dislikes);
+            
             // Method 2: Update by class (used in post.html)
             const likeBtn = document.querySelector(`.like-btn-${postId}`);
             const dislikeBtn = document.querySelector(`.dislike-btn-${postId}`);
@@ -82,6 +84,33 @@ function ratePost(postId, isLike) {
     });
 }
 
+// The post page is cached, so its counts may be behind; read the current ones
+function refreshRatingCounts() {
+    document.querySelectorAll('[data-rating-post]').forEach(container => {
+        const postId = container.getAttribute('data-rating-post');
+        
+        fetch(`/post/${postId}/rating`, {credentials: 'same-origin'})
+            .then(response => response.ok ? response.json() : null)
+            .then(data => {
+                if (!data) return;
+                
+                const likesElement = document.getElementById(`likes-${postId}`);
+                const dislikesElement = document.getElementById(`dislikes-${postId}`);
+                if (likesElement) likesElement.textContent = data.likes;
+                if (dislikesElement) dislikesElement.textContent = data.dislikes;
+                showRatingTotal(postId, data.likes, data.dislikes);
+            })
+            .catch(error => console.error('Error reading rating counts:', error));
+    });
+}
+
+function showRatingTotal(postId, likes, dislikes) {
+    const totalElement = document.getElementById(`rating-total-${postId}`);
+    if (totalElement) {
+        totalElement.textContent = `Toplam Oy: ${likes + dislikes}`;
+    }
+}
+
 // Helper function to show feedback messages
 function showFeedback(message, type) {
     // First try to find a message container
@@ -119,6 +148,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Initialize rating buttons
     initRatingButtons();
+    
+    // Current like/dislike counts
+    refreshRatingCounts();
 });
 
 // Animate story cards with a staggered effect
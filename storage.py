@@ -0,0 +1,269 @@
+"""
+Storage for uploaded files.
+
+Every upload (post images, video thumbnails, editor images, mobile media)
+goes through ``Storage.save_upload``, which names the file, writes it to
+the configured backend and returns the value kept in the database: a path
+under the uploads directory for the local backend, a public URL for
+Supabase.
+
+``STORAGE_BACKEND`` selects the backend: ``supabase`` (the default when
+``SUPABASE_URL`` and ``SUPABASE_SERVICE_KEY`` are set) or ``local``
+(files under ``STORAGE_LOCAL_DIR``, served from ``/static/uploads``). When
+Supabase rejects an upload the file is written locally instead, and
+pointing ``STORAGE_LOCAL_DIR`` at a temporary directory lets tests run the
+upload paths without Supabase.
+
+``STORAGE_NAMING`` selects how files are named:
+
+- ``timestamp`` (default): ``posts/20240101_120000_123456_photo.jpg``
+- ``content``: ``posts/<sha256 of the bytes>.jpg``. Uploading the same file
+  again stores nothing new, and since a name always refers to the same
+  bytes the file is served with ``Cache-Control: immutable``. One file can
+  back several posts, so ``delete`` leaves content-addressed files alone.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from datetime import datetime
+
+from flask import request, url_for
+from werkzeug.utils import secure_filename
+
+import images
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# <sha256>.ext, or a scaled copy of one (<sha256>-640w.webp, see images.variant_name)
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{64}(-\d+w)?\.[a-z0-9]+$')
+
+HASH_CHUNK_SIZE = 256 * 1024
+
+
+def content_digest(stream):
+    """sha256 hex digest of a seekable stream's contents; rewinds it"""
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def is_content_addressed(key):
+    """Whether key was named after its contents (or derived from such a file)"""
+    return bool(key and CONTENT_NAME.search(key.split('?', 1)[0]))
+
+
+class LocalBackend:
+    """Files under a local directory served by the static route"""
+
+    name = 'local'
+
+    def __init__(self, directory, url_prefix='uploads'):
+        self.directory = directory
+        self.url_prefix = url_prefix
+
+    def path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, stream, content_type=None, cache_control=None):
+        """Write stream (or bytes) to key atomically and return the stored value"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            if isinstance(stream, (bytes, bytearray)):
+                f.write(stream)
+            else:
+                for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+        return self.value(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def value(self, key):
+        """What the database keeps for key: the path itself"""
+        return key
+
+    def key_for(self, value):
+        if not value or value.startswith('http'):
+            return None
+        return value
+
+    def url(self, key, external=False):
+        return url_for('static', filename=f'{self.url_prefix}/{key}', _external=external)
+
+
+class SupabaseBackend:
+    """Objects in a Supabase Storage bucket (see supabase_storage.py)"""
+
+    name = 'supabase'
+
+    def __init__(self, client):
+        self.client = client
+
+    def exists(self, key):
+        return self.client.exists(key)
+
+    def save(self, key, stream, content_type=None, cache_control=None):
+        return self.client.upload(key, stream, content_type or 'application/octet-stream', upsert=True,
+                                  cache_control=cache_control)
+
+    def delete(self, *keys):
+        self.client.delete(*keys)
+
+    def value(self, key):
+        """What the database keeps for key: its public URL"""
+        return self.client.public_url(key)
+
+    def key_for(self, value):
+        return self.client.path_from_url(value)
+
+    def url(self, key, external=False):
+        return self.client.public_url(key)
+
+
+class Storage:
+    """Save, address and delete uploaded files on the configured backend"""
+
+    def __init__(self, app=None, supabase_client=None):
+        self.app = None
+        self.local = None
+        self.remote = None
+        self.naming = 'timestamp'
+        if app is not None:
+            self.init_app(app, supabase_client)
+
+    def init_app(self, app, supabase_client=None):
+        """Pick the backend and naming scheme from STORAGE_* settings"""
+        self.app = app
+        app.config.setdefault('STORAGE_BACKEND', os.environ.get(
+            'STORAGE_BACKEND', 'supabase' if supabase_client is not None else 'local'))
+        app.config.setdefault('STORAGE_NAMING', os.environ.get('STORAGE_NAMING', 'timestamp'))
+        app.config.setdefault('STORAGE_LOCAL_DIR', os.environ.get(
+            'STORAGE_LOCAL_DIR', os.path.join(app.static_folder, app.config.get('UPLOADS_FOLDER', 'uploads'))))
+
+        self.local = LocalBackend(app.config['STORAGE_LOCAL_DIR'], app.config.get('UPLOADS_FOLDER', 'uploads'))
+        self.remote = None
+        if app.config['STORAGE_BACKEND'] == 'supabase':
+            if supabase_client is not None:
+                self.remote = SupabaseBackend(supabase_client)
+            else:
+                app.logger.warning("STORAGE_BACKEND is supabase but Supabase is not configured; storing files locally")
+        elif app.config['STORAGE_BACKEND'] != 'local':
+            app.logger.warning(f"Unknown STORAGE_BACKEND '{app.config['STORAGE_BACKEND']}', storing files locally")
+
+        self.naming = app.config['STORAGE_NAMING']
+        if self.naming not in ('timestamp', 'content'):
+            app.logger.warning(f"Unknown STORAGE_NAMING '{self.naming}', using timestamp names")
+            self.naming = 'timestamp'
+
+        app.after_request(self._cache_uploads)
+        app.extensions['storage'] = self
+
+    def save_upload(self, file, folder='posts', prefix='', max_size=None):
+        """
+        Store an uploaded file (a Werkzeug FileStorage) under folder and
+        return the value to keep in the database, or None on failure.
+        Images larger than max_size are scaled down before storing.
+        """
+        if not file or not file.filename:
+            return None
+        folder = '/'.join(secure_filename(part) for part in folder.split('/') if secure_filename(part)) or 'posts'
+        content_type = file.content_type or mimetypes.guess_type(file.filename)[0] or 'application/octet-stream'
+        stream = file.stream
+        if max_size:
+            stream.seek(0)
+            stream = images.fit_within(stream, max_size) or stream
+        stream.seek(0)
+
+        if self.naming == 'content':
+            key = f"{folder}/{content_digest(stream)}{self._extension(file.filename, content_type)}"
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            filename = secure_filename(f"{prefix}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{file.filename}")
+            key = f"{folder}/{filename}"
+            cache_control = None
+
+        for backend in filter(None, (self.remote, self.local)):
+            try:
+                if self.naming == 'content' and backend.exists(key):
+                    # Same bytes already stored under this name
+                    return backend.value(key)
+                stream.seek(0)
+                value = backend.save(key, stream, content_type, cache_control)
+                self.app.logger.info(f"Stored upload at {backend.name}:{key}")
+                return value
+            except Exception as e:
+                self.app.logger.error(f"Storing {key} on {backend.name} failed: {e}")
+                if backend is self.remote:
+                    self.app.logger.warning("Falling back to local storage")
+        return None
+
+    def store_for(self, value):
+        """store(key, data, content_type) callable writing derived files (e.g. scaled
+        images) to the backend holding value"""
+        backend, _ = self.locate(value)
+
+        def store(key, data, content_type):
+            backend.save(key, data, content_type)
+        return store
+
+    def locate(self, value):
+        """(backend, key) of a stored value, or (None, None) for foreign URLs"""
+        if not value:
+            return None, None
+        if value.startswith('http'):
+            key = self.remote.key_for(value) if self.remote else None
+            return (self.remote, key) if key else (None, None)
+        return self.local, value
+
+    def local_path(self, value):
+        """Filesystem path of a locally stored value, or None"""
+        backend, key = self.locate(value)
+        return backend.path(key) if backend is self.local and key else None
+
+    def url(self, value, external=False):
+        """Public URL of a stored value"""
+        if value.startswith('http'):
+            return value
+        return self.local.url(value, external=external)
+
+    def delete(self, *values):
+        """Remove stored files; content-addressed files may be shared and are kept"""
+        for value in values:
+            backend, key = self.locate(value)
+            if backend is None or is_content_addressed(key):
+                continue
+            try:
+                backend.delete(key)
+            except Exception as e:
+                self.app.logger.error(f"Removing {value} failed: {e}")
+
+    @staticmethod
+    def _extension(filename, content_type):
+        ext = posixpath.splitext(secure_filename(filename))[1].lower()
+        if not ext:
+            ext = mimetypes.guess_extension(content_type or '') or ''
+        return '.jpg' if ext == '.jpeg' else ext
+
+    def _cache_uploads(self, response):
+        # Content-addressed local files never change; let browsers and CDNs keep them
+        if request.endpoint == 'static' and response.status_code == 200:
+            filename = (request.view_args or {}).get('filename', '')
+            if filename.startswith(f'{self.local.url_prefix}/') and is_content_addressed(filename):
+                response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
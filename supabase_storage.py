@@ -0,0 +1,187 @@
+"""
+Streaming client for Supabase Storage.
+
+Uploads are sent straight from the file object (usually the spooled
+temporary file Werkzeug keeps the upload in) in fixed-size chunks, so a
+16MB upload never sits in worker memory as one ``bytes`` object. Files
+larger than ``resumable_threshold`` go through Supabase's resumable (TUS)
+endpoint in 6MB parts and pick up from the last acknowledged offset when
+a part fails. Public URLs are built locally from the project URL and
+bucket name instead of asking the API, and every request goes through one
+pooled HTTP client per process.
+"""
+import base64
+import os
+import threading
+from urllib.parse import quote, unquote
+
+import httpx
+
+# Supabase's resumable endpoint requires 6MB parts (except the last one)
+TUS_CHUNK_SIZE = 6 * 1024 * 1024
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class SupabaseStorageError(Exception):
+    """An upload or delete was rejected by Supabase Storage"""
+
+
+def _file_size(stream):
+    """Bytes left in a seekable stream, or None"""
+    try:
+        position = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell() - position
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _iter_chunks(stream, chunk_size=STREAM_CHUNK_SIZE, limit=None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        chunk = stream.read(chunk_size if remaining is None else min(chunk_size, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+class SupabaseStorage:
+    """Upload, delete and address objects in one Supabase Storage bucket"""
+
+    def __init__(self, url, key, bucket='uploads', timeout=60, resumable_threshold=TUS_CHUNK_SIZE,
+                 max_retries=3, max_connections=10):
+        self.url = url.rstrip('/')
+        self.key = key
+        self.bucket = bucket
+        self.timeout = timeout
+        self.resumable_threshold = resumable_threshold
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Pooled HTTP client, recreated after a fork"""
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = httpx.Client(
+                        headers={'Authorization': f'Bearer {self.key}', 'apikey': self.key},
+                        timeout=httpx.Timeout(self.timeout, connect=10),
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections),
+                    )
+                    self._pid = os.getpid()
+        return self._client
+
+    def public_url(self, path):
+        """Public URL of an object, built without an API call"""
+        return f"{self.url}/storage/v1/object/public/{self.bucket}/{quote(path)}"
+
+    def path_from_url(self, url):
+        """Object path of one of this bucket's public URLs, or None"""
+        prefix = f"{self.url}/storage/v1/object/public/{self.bucket}/"
+        if not url or not url.startswith(prefix):
+            return None
+        return unquote(url[len(prefix):].split('?', 1)[0])
+
+    def upload(self, path, data, content_type='application/octet-stream', upsert=False,
+               cache_control=None):
+        """
+        Upload bytes or a readable file object to path and return its public
+        URL. File objects are streamed from their current position.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            size = len(data)
+        else:
+            size = _file_size(data)
+
+        if size is not None and size > self.resumable_threshold and not isinstance(data, (bytes, bytearray)):
+            self._upload_resumable(path, data, size, content_type, upsert, cache_control)
+        else:
+            self._upload_simple(path, data, size, content_type, upsert, cache_control)
+        return self.public_url(path)
+
+    def exists(self, path):
+        """Whether an object is stored at path"""
+        response = self.client.head(f"{self.url}/storage/v1/object/{self.bucket}/{quote(path)}")
+        return response.status_code == 200
+
+    def delete(self, *paths):
+        """Remove objects from the bucket"""
+        if not paths:
+            return
+        response = self.client.request(
+            'DELETE', f"{self.url}/storage/v1/object/{self.bucket}", json={'prefixes': list(paths)}
+        )
+        if response.status_code >= 400:
+            raise SupabaseStorageError(f"Delete failed ({response.status_code}): {response.text}")
+
+    def close(self):
+        if self._client is not None and self._pid == os.getpid():
+            self._client.close()
+        self._client = None
+
+    def _upload_simple(self, path, data, size, content_type, upsert, cache_control):
+        headers = {'Content-Type': content_type, 'x-upsert': 'true' if upsert else 'false'}
+        if cache_control:
+            headers['Cache-Control'] = cache_control
+        if size is not None:
+            # With a known length the body is streamed without chunked encoding
+            headers['Content-Length'] = str(size)
+        content = data if isinstance(data, (bytes, bytearray)) else _iter_chunks(data)
+        response = self.client.post(
+            f"{self.url}/storage/v1/object/{self.bucket}/{quote(path)}", content=content, headers=headers
+        )
+        if response.status_code >= 400:
+            raise SupabaseStorageError(f"Upload of {path} failed ({response.status_code}): {response.text}")
+
+    def _upload_resumable(self, path, stream, size, content_type, upsert, cache_control):
+        def b64(value):
+            return base64.b64encode(value.encode('utf-8')).decode('ascii')
+
+        metadata = {'bucketName': self.bucket, 'objectName': path, 'contentType': content_type}
+        if cache_control:
+            metadata['cacheControl'] = cache_control
+        response = self.client.post(f"{self.url}/storage/v1/upload/resumable", headers={
+            'Tus-Resumable': '1.0.0',
+            'Upload-Length': str(size),
+            'Upload-Metadata': ','.join(f'{k} {b64(v)}' for k, v in metadata.items()),
+            'x-upsert': 'true' if upsert else 'false',
+        })
+        if response.status_code != 201 or 'Location' not in response.headers:
+            raise SupabaseStorageError(f"Could not start upload of {path} ({response.status_code}): {response.text}")
+        location = response.headers['Location']
+
+        start = stream.tell()
+        offset = 0
+        failures = 0
+        while offset < size:
+            length = min(TUS_CHUNK_SIZE, size - offset)
+            stream.seek(start + offset)
+            try:
+                response = self.client.patch(location, content=_iter_chunks(stream, limit=length), headers={
+                    'Tus-Resumable': '1.0.0',
+                    'Upload-Offset': str(offset),
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Content-Length': str(length),
+                })
+                if response.status_code != 204:
+                    raise SupabaseStorageError(f"part at {offset} rejected ({response.status_code}): {response.text}")
+                offset = int(response.headers.get('Upload-Offset', offset + length))
+                failures = 0
+            except (httpx.HTTPError, SupabaseStorageError) as e:
+                failures += 1
+                if failures > self.max_retries:
+                    raise SupabaseStorageError(f"Upload of {path} failed: {e}") from e
+                # Ask the server how much it kept and resume from there
+                head = self.client.head(location, headers={'Tus-Resumable': '1.0.0'})
+                if head.status_code >= 400:
+                    raise SupabaseStorageError(f"Upload of {path} can't be resumed ({head.status_code})") from e
+                offset = int(head.headers.get('Upload-Offset', offset))
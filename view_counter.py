@@ -0,0 +1,147 @@
+"""
+Write-behind counters.
+
+Increments are accumulated in a per-worker in-memory buffer and written to
+the database in periodic batched ``UPDATE post SET views = views + n``
+statements instead of one transaction per page hit.
+"""
+import atexit
+import os
+import threading
+from collections import Counter
+
+from sqlalchemy import bindparam, func
+
+
+class PeriodicFlusher:
+    """Run self.flush() every flush_interval seconds on a per-process daemon thread"""
+
+    flush_interval = 10
+    thread_name = 'periodic-flush'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def flush(self):
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop the background flusher and write out anything still buffered"""
+        thread = self._thread
+        self._thread = None
+        self._wakeup.set()
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so gunicorn workers started from a
+        # preloaded app each need their own flusher.
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._wakeup = threading.Event()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        wakeup = self._wakeup
+        while not wakeup.wait(self.flush_interval):
+            self.flush()
+
+
+class BufferedCounter(PeriodicFlusher):
+    """Buffer increments of one integer column per worker and flush them in batches"""
+
+    def __init__(self, app=None, db=None, model=None, column='views', config_prefix='VIEW_COUNTER'):
+        super().__init__()
+        self.app = None
+        self.db = None
+        self.table = None
+        self.column = column
+        self.config_prefix = config_prefix
+        self.thread_name = f'{column}-counter-flush'
+        self.max_pending = 500
+        self._pending = Counter()
+        self._flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, model)
+
+    def init_app(self, app, db, model):
+        """Bind the counter to the app, database and model owning the column"""
+        self.app = app
+        self.db = db
+        self.table = model.__table__
+        interval_key = f'{self.config_prefix}_FLUSH_INTERVAL'
+        max_pending_key = f'{self.config_prefix}_MAX_PENDING'
+        app.config.setdefault(interval_key, float(os.environ.get(interval_key, 10)))
+        app.config.setdefault(max_pending_key, int(os.environ.get(max_pending_key, 500)))
+        self.flush_interval = app.config[interval_key]
+        self.max_pending = app.config[max_pending_key]
+        atexit.register(self.flush)
+
+    def increment(self, object_id, amount=1):
+        """Record an increment; the database is updated on the next flush"""
+        with self._lock:
+            self._pending[object_id] += amount
+            total_pending = sum(self._pending.values())
+
+        # A flush interval of 0 disables buffering (write-through)
+        if self.flush_interval <= 0 or total_pending >= self.max_pending:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def pending(self, object_id):
+        """Return the increments not yet written to the database"""
+        with self._lock:
+            return self._pending.get(object_id, 0)
+
+    def live_count(self, obj):
+        """Return the stored count plus any buffered increments for obj"""
+        return (getattr(obj, self.column, 0) or 0) + self.pending(obj.id)
+
+    def flush(self):
+        """Write all buffered increments to the database in a single batch"""
+        if self.app is None:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, Counter()
+            if not batch:
+                return 0
+
+            column = self.table.c[self.column]
+            rows = [{'b_id': object_id, 'b_amount': amount} for object_id, amount in batch.items()]
+            stmt = self.table.update() \
+                .where(self.table.c.id == bindparam('b_id')) \
+                .values({column: func.coalesce(column, 0) + bindparam('b_amount')})
+
+            try:
+                with self.app.app_context():
+                    with self.db.engine.begin() as conn:
+                        conn.execute(stmt, rows)
+                return len(rows)
+            except Exception as e:
+                # Put the increments back so they are retried on the next flush
+                with self._lock:
+                    self._pending.update(batch)
+                self.app.logger.error(f"Counter flush error ({self.table.name}.{self.column}): {str(e)}")
+                return 0
+
+
+class ViewCounter(BufferedCounter):
+    """Buffered post view counter, exposed to templates as the live_views filter"""
+
+    def init_app(self, app, db, model):
+        super().init_app(app, db, model)
+        app.extensions['view_counter'] = self
+        app.add_template_filter(self.live_count, 'live_views')
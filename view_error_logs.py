@@ -1,104 +1,458 @@
+#!/usr/bin/env python3
+"""
+Summarise the errors in the application logs.
+
+Reads the JSON lines written by log_pipeline.py as well as the older text
+format and gunicorn's error log. Files are memory-mapped and scanned line by
+line, so large logs are never loaded whole. Errors are grouped by
+fingerprint: the exception type and the stack frames it went through (or,
+without a traceback, the message with numbers, IDs and quoted values
+masked), with counts, first/last seen and the endpoints involved:
+
+    python view_error_logs.py                      # logs/app.log and its rotations
+    python view_error_logs.py --since 2h --show 3  # last two hours, with 3 samples
+    python view_error_logs.py --since "2024-05-01 09:00" --until "2024-05-01 12:00"
+    python view_error_logs.py --follow             # print errors as they are logged
+
+For --since/--until each file gets an index of the byte offset at which
+every hour starts, kept in .index/ next to the logs and extended as the
+file grows, so a time window only reads the hours it covers.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import mmap
 import os
-import sys
 import re
-from datetime import datetime, timedelta
-
-def read_error_logs():
-    # Define common log file locations
-    possible_log_files = [
-        'app.log',
-        'error.log',
-        'flask.log',
-        '/var/log/nginx/error.log',
-        '/var/log/apache2/error.log',
-        os.path.join('logs', 'app.log'),
-        os.path.join('log', 'app.log')
-    ]
-    
-    # Check if running on Render.com
-    if os.environ.get('RENDER'):
-        render_log_dir = '/var/log/app'
-        if os.path.isdir(render_log_dir):
-            for filename in os.listdir(render_log_dir):
-                if filename.endswith('.log'):
-                    possible_log_files.append(os.path.join(render_log_dir, filename))
-    
-    errors = []
-    
-    # Time threshold - last 24 hours
-    time_threshold = datetime.now() - timedelta(hours=24)
-    
-    # Regular expressions for different log formats
-    error_patterns = [
-        r'.*ERROR.*',  # Standard ERROR level
-        r'.*Error.*',  # Error message
-        r'.*Exception.*',  # Exceptions
-        r'.*HTTP.*(500|502|503|504).*',  # HTTP error status codes
-        r'.*Traceback.*'  # Python tracebacks
-    ]
-    compiled_patterns = [re.compile(pattern) for pattern in error_patterns]
-    
-    for log_file in possible_log_files:
-        if os.path.isfile(log_file):
-            print(f"Reading log file: {log_file}")
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+# log_pipeline.py with LOG_FORMAT=text, and the format app.py used before it
+TEXT_HEADER = re.compile(rb'^(\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d)[,.]?\d* (DEBUG|INFO|WARNING|ERROR|CRITICAL):? ?(.*)')
+# gunicorn: [2024-05-01 09:00:00 +0000] [42] [ERROR] message
+GUNICORN_HEADER = re.compile(rb'^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) ([+-]\d{4})\] \[\d+\] \[(\w+)\] ?(.*)')
+JSON_LEVEL = re.compile(rb'"level": "(\w+)"')
+FRAME = re.compile(r'File "([^"]+)", line \d+, in (\S+)')
+MASKS = [
+    (re.compile(r'[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}', re.I), '<uuid>'),
+    (re.compile(r'0x[0-9a-f]+|\b[0-9a-f]{12,}\b', re.I), '<hex>'),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), '<str>'),
+    (re.compile(r'\d+(\.\d+)?'), '<n>'),
+]
+MAX_EXCEPTION_LINES = 200
+INDEX_DIR = '.index'
+
+
+# --- parsing -------------------------------------------------------------------
+
+def parse_time(value):
+    """'2h', '30m', '1d' before now, or an ISO date/time (local time unless it has an offset)"""
+    match = re.fullmatch(r'(\d+)([smhd])', value.strip())
+    if match:
+        seconds = int(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        return datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    moment = datetime.fromisoformat(value.strip())
+    return moment.astimezone(timezone.utc)
+
+
+def hour_key(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H')
+
+
+class LineParser:
+    """Turns log lines into entries; continuation lines (tracebacks) join the entry before them"""
+
+    def __init__(self, min_level=LEVELS['ERROR'], match=None):
+        self.min_level = min_level
+        self.match = match.lower() if match else None
+        self.current = None
+
+    def header(self, line):
+        """(timestamp, level, kind, match) if line starts an entry, else None"""
+        if line[:1] == b'{':
+            end = line.find(b'"', 8)
+            if not line.startswith(b'{"ts": "') or end < 0:
+                return None
+            level = JSON_LEVEL.search(line, 0, 200)
             try:
-                with open(log_file, 'r', errors='ignore') as f:
-                    lines = f.readlines()
-                    
-                    # Process the log file
-                    current_error = []
-                    in_error = False
-                    
-                    for line in lines:
-                        # Check if line matches any error pattern
-                        is_error_line = any(pattern.match(line) for pattern in compiled_patterns)
-                        
-                        # If we find an error line
-                        if is_error_line:
-                            if not in_error:
-                                in_error = True
-                                current_error = [line]
-                            else:
-                                current_error.append(line)
-                        # If we're in an error block but this line isn't an error
-                        elif in_error:
-                            # If line starts with whitespace, it's likely part of a traceback
-                            if line.startswith(' ') or line.startswith('\t'):
-                                current_error.append(line)
-                            else:
-                                # End of error block
-                                errors.append(''.join(current_error))
-                                in_error = False
-                                current_error = []
-                    
-                    # Add the last error if we're still processing one
-                    if in_error and current_error:
-                        errors.append(''.join(current_error))
-                        
-            except Exception as e:
-                print(f"Error reading log file {log_file}: {e}")
-    
-    # Sort errors by timestamp if available
-    return errors
+                moment = datetime.fromisoformat(line[8:end].decode())
+            except ValueError:
+                return None
+            return moment, level.group(1).decode() if level else 'INFO', 'json', None
+        if line[:1].isdigit():
+            match = TEXT_HEADER.match(line)
+            if match:
+                moment = datetime.fromisoformat(match.group(1).decode()).astimezone(timezone.utc)
+                return moment, match.group(2).decode(), 'text', match
+        elif line[:1] == b'[':
+            match = GUNICORN_HEADER.match(line)
+            if match:
+                moment = datetime.strptime(f'{match.group(1).decode()} {match.group(2).decode()}',
+                                           '%Y-%m-%d %H:%M:%S %z').astimezone(timezone.utc)
+                return moment, match.group(3).decode().upper(), 'gunicorn', match
+        return None
+
+    def feed(self, line, header=None):
+        """Add one line (bytes, no newline); returns the entry it completed, if any"""
+        if header is None:
+            header = self.header(line)
+        if header is None:
+            if self.current is not None and len(self.current['lines']) < MAX_EXCEPTION_LINES:
+                self.current['lines'].append(line.decode('utf-8', 'replace'))
+            return None
+        done = self.flush()
+        moment, level, kind, match = header
+        if LEVELS.get(level, 20) < self.min_level:
+            return done
+        if kind == 'json':
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return done
+            entry = {
+                'ts': moment, 'level': level, 'logger': record.get('logger'),
+                'message': record.get('message', ''), 'exception': record.get('exception'),
+                'request_id': record.get('request_id'), 'endpoint': record.get('endpoint'),
+                'path': record.get('path'), 'lines': [],
+            }
+        else:
+            message = match.group(match.re.groups).decode('utf-8', 'replace')
+            entry = {
+                'ts': moment, 'level': level, 'logger': 'gunicorn' if kind == 'gunicorn' else None,
+                'message': message, 'exception': None, 'request_id': None,
+                'endpoint': None, 'path': None, 'lines': [],
+            }
+        self.current = entry
+        return done
+
+    def flush(self):
+        """The entry being collected, once it has all its lines"""
+        entry, self.current = self.current, None
+        if entry is None:
+            return None
+        if entry['lines']:
+            # Text logs: the traceback follows the message line
+            text = '\n'.join(entry['lines'])
+            entry['exception'] = f"{entry['exception']}\n{text}" if entry['exception'] else text
+        if self.match and not any(self.match in (entry.get(key) or '').lower()
+                                  for key in ('message', 'exception', 'endpoint', 'path')):
+            return None
+        return entry
+
+
+def fingerprint(entry):
+    """(id, title) grouping entries with the same cause"""
+    exception = entry['exception'] or ''
+    frames = FRAME.findall(exception)
+    if frames:
+        last = exception.strip().splitlines()[-1]
+        exc_type = last.split(':', 1)[0].strip()
+        # Where it was raised, not the line numbers, which change with every deploy
+        parts = [exc_type] + [f'{os.path.basename(path)}:{function}' for path, function in frames[-5:]]
+        title = last
+    else:
+        title = entry['message'].splitlines()[0] if entry['message'] else '(empty)'
+        masked = title
+        for pattern, replacement in MASKS:
+            masked = pattern.sub(replacement, masked)
+        parts = [entry['logger'] or '', masked]
+    digest = hashlib.sha1('|'.join(parts).encode()).hexdigest()[:12]
+    return digest, title[:200]
+
+
+class ErrorGroups:
+    """Counts, first/last seen and a sample per fingerprint"""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, entry):
+        key, title = fingerprint(entry)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {
+                'fingerprint': key, 'title': title, 'level': entry['level'], 'count': 0,
+                'first_seen': entry['ts'], 'last_seen': entry['ts'], 'endpoints': Counter(), 'sample': entry,
+            }
+        group['count'] += 1
+        group['first_seen'] = min(group['first_seen'], entry['ts'])
+        if entry['ts'] >= group['last_seen']:
+            group['last_seen'] = entry['ts']
+            group['sample'] = entry
+        if entry['endpoint'] or entry['path']:
+            group['endpoints'][entry['endpoint'] or entry['path']] += 1
+        return group
+
+    def top(self, limit=None):
+        groups = sorted(self.groups.values(), key=lambda g: (g['count'], g['last_seen']), reverse=True)
+        return groups[:limit] if limit else groups
+
+
+# --- files and hour index --------------------------------------------------------
+
+def default_files():
+    """logs/app.log (or LOG_FILE) and its rotations, oldest first"""
+    path = os.environ.get('LOG_FILE', os.path.join('logs', 'app.log'))
+    rotated = sorted(glob.glob(f'{glob.escape(path)}.[0-9]*'), key=lambda p: int(p.rsplit('.', 1)[1]), reverse=True)
+    files = rotated + [path]
+    if os.environ.get('RENDER') and os.path.isdir('/var/log/app'):
+        files += sorted(glob.glob('/var/log/app/*.log'))
+    return [f for f in files if os.path.isfile(f)]
+
+
+class HourIndex:
+    """Byte offset of the first line of every hour in one log file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.hours = {}
+        self.scanned = 0
+        self.changed = False
+        self._stat = os.stat(path)
+        self._head = self._read_head()
+        self._index_path = os.path.join(os.path.dirname(path) or '.', INDEX_DIR,
+                                        f'{self._stat.st_dev}-{self._stat.st_ino}.json')
+        # The index follows the file through renames (same inode); a new file
+        # at the same inode, or a truncated one, starts over
+        saved = self._load()
+        if saved and saved.get('head') == self._head and saved.get('scanned', 0) <= self._stat.st_size:
+            self.hours = saved['hours']
+            self.scanned = saved['scanned']
+
+    def _read_head(self):
+        with open(self.path, 'rb') as f:
+            return hashlib.sha1(f.read(256)).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._index_path), exist_ok=True)
+            tmp_path = f'{self._index_path}.{os.getpid()}'
+            with open(tmp_path, 'w') as f:
+                json.dump({'path': self.path, 'head': self._head, 'scanned': self.scanned, 'hours': self.hours}, f)
+            os.replace(tmp_path, self._index_path)
+        except OSError:
+            pass  # read-only log directory; the next run scans again
+
+    def record(self, hour, offset, end):
+        if offset >= self.scanned:
+            if hour not in self.hours:
+                self.hours[hour] = offset
+            self.scanned = end
+            self.changed = True
+
+    def range(self, since, until, size):
+        """Byte range that holds the entries between since and until"""
+        start, end = 0, size
+        if since is not None:
+            # A few minutes of slack for lines written slightly out of order by several workers
+            first_hour = hour_key(since - timedelta(minutes=5))
+            earlier = [offset for hour, offset in self.hours.items() if hour <= first_hour]
+            start = max(earlier) if earlier else 0
+        if until is not None:
+            last_hour = hour_key(until + timedelta(minutes=5))
+            later = [offset for hour, offset in self.hours.items() if hour > last_hour]
+            if later:
+                end = min(later)
+        return start, max(start, end)
+
+
+def scan_file(path, parser, since=None, until=None):
+    """Entries of path between since and until, reading only the indexed hours that matter"""
+    if since is not None and os.path.getmtime(path) < since.timestamp():
+        return
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    index = HourIndex(path)
+    start, end = index.range(since, until, size)
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = start
+        last_prefix = None
+        while position < end:
+            newline = mm.find(b'\n', position, end)
+            if newline < 0:
+                break  # a line still being written
+            line = mm[position:newline].rstrip(b'\r')
+            header = parser.header(line)
+            if header is not None:
+                # Same date and hour as the line before: nothing new for the index
+                prefix = line[:21] if header[2] == 'json' else line[:14]
+                if prefix != last_prefix:
+                    last_prefix = prefix
+                    index.record(hour_key(header[0]), position, newline + 1)
+                elif position >= index.scanned:
+                    index.scanned = newline + 1
+                entry = parser.feed(line, header)
+            else:
+                entry = parser.feed(line)
+            if entry is not None and _in_window(entry, since, until):
+                yield entry
+            position = newline + 1
+    entry = parser.flush()
+    if entry is not None and _in_window(entry, since, until):
+        yield entry
+    index.save()
+
+
+def _in_window(entry, since, until):
+    return (since is None or entry['ts'] >= since) and (until is None or entry['ts'] <= until)
+
+
+def follow(path, parser, groups, idle_flush=1.0, interval=0.5):
+    """Print errors as they are appended to path, across rotations"""
+    handle = None
+    from_start = False
+    pending = b''
+    last_data = time.monotonic()
+    while True:
+        if handle is None:
+            try:
+                handle = open(path, 'rb')
+            except OSError:
+                time.sleep(interval)
+                continue
+            handle.seek(0, os.SEEK_SET if from_start else os.SEEK_END)
+            last_data = time.monotonic()
+        data = handle.read()
+        if data:
+            last_data = time.monotonic()
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                _print_live(parser.feed(line.rstrip(b'\r')), groups)
+            continue
+        if time.monotonic() - last_data > idle_flush:
+            _print_live(parser.flush(), groups)
+        try:
+            stat = os.stat(path)
+            rotated = stat.st_ino != os.fstat(handle.fileno()).st_ino or stat.st_size < handle.tell()
+        except OSError:
+            rotated = False
+        if rotated:
+            # The old file has been read to its end; read the new one from its start
+            handle.close()
+            handle = None
+            from_start = True
+            if pending:
+                _print_live(parser.feed(pending.rstrip(b'\r')), groups)
+                pending = b''
+            continue
+        time.sleep(interval)
+
+
+def _print_live(entry, groups):
+    if entry is None:
+        return
+    group = groups.add(entry)
+    where = entry['endpoint'] or entry['path'] or ''
+    request_id = f" [{entry['request_id']}]" if entry['request_id'] else ''
+    print(f"{_local(entry['ts'])} {entry['level']:<8} {group['fingerprint']} x{group['count']:<4} "
+          f"{group['title']}  {where}{request_id}", flush=True)
+
+
+# --- output ----------------------------------------------------------------------
+
+def _local(moment):
+    return moment.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def print_report(groups, total, show):
+    print(f"Found {total} error entries in {len(groups.groups)} groups\n")
+    if not groups.groups:
+        return
+    print(f"{'count':>7}  {'first seen':<19}  {'last seen':<19}  {'fingerprint':<12}  error")
+    for group in groups.top():
+        print(f"{group['count']:>7}  {_local(group['first_seen'])}  {_local(group['last_seen'])}  "
+              f"{group['fingerprint']:<12}  {group['title']}")
+        if group['endpoints']:
+            endpoints = ', '.join(f'{name} ({count})' for name, count in group['endpoints'].most_common(3))
+            print(f"{'':>7}  in {endpoints}")
+    for group in groups.top(show):
+        sample = group['sample']
+        print(f"\n--- {group['fingerprint']} (latest of {group['count']}) ---")
+        request_id = f" request {sample['request_id']}" if sample['request_id'] else ''
+        print(f"{_local(sample['ts'])} {sample['level']}{request_id}: {sample['message']}")
+        if sample['exception']:
+            print(sample['exception'])
+
+
+def report_json(groups, total):
+    return json.dumps({
+        'total': total,
+        'groups': [{
+            'fingerprint': group['fingerprint'],
+            'title': group['title'],
+            'level': group['level'],
+            'count': group['count'],
+            'first_seen': group['first_seen'].isoformat(),
+            'last_seen': group['last_seen'].isoformat(),
+            'endpoints': dict(group['endpoints']),
+            'sample': {
+                'ts': group['sample']['ts'].isoformat(),
+                'message': group['sample']['message'],
+                'exception': group['sample']['exception'],
+                'request_id': group['sample']['request_id'],
+            },
+        } for group in groups.top()],
+    }, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise errors in the HepsiHikaye logs')
+    parser.add_argument('files', nargs='*', help='log files (default: logs/app.log and its rotations)')
+    parser.add_argument('--since', type=parse_time, help="start of the window: '2h', '30m', '1d' or an ISO time")
+    parser.add_argument('--until', type=parse_time, help='end of the window')
+    parser.add_argument('--level', default='ERROR', choices=['WARNING', 'ERROR', 'CRITICAL'],
+                        help='lowest level to include')
+    parser.add_argument('--match', help='only entries whose message, traceback, endpoint or path contains this')
+    parser.add_argument('--show', type=int, default=0, help='print the latest sample of the N biggest groups')
+    parser.add_argument('--json', action='store_true', help='print the groups as JSON')
+    parser.add_argument('--follow', action='store_true', help='print new errors as they are logged')
+    args = parser.parse_args()
+
+    files = args.files or default_files()
+    if not files:
+        print("No log files found", file=sys.stderr)
+        sys.exit(1)
+
+    groups = ErrorGroups()
+    total = 0
+    for path in files:
+        line_parser = LineParser(LEVELS[args.level], args.match)
+        try:
+            for entry in scan_file(path, line_parser, args.since, args.until):
+                groups.add(entry)
+                total += 1
+        except OSError as e:
+            print(f"Error reading log file {path}: {e}", file=sys.stderr)
+
+    if args.follow:
+        print_report(groups, total, 0)
+        print(f"\nFollowing {files[-1]} (Ctrl+C to stop)\n", flush=True)
+        try:
+            follow(files[-1], LineParser(LEVELS[args.level], args.match), groups)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if args.json:
+        print(report_json(groups, total))
+    else:
+        print_report(groups, total, args.show)
+
 
 if __name__ == '__main__':
-    errors = read_error_logs()
-    
-    print(f"Found {len(errors)} error entries in logs")
-    
-    if errors:
-        print("\nLatest errors (most recent first):\n")
-        # Print the 10 most recent errors
-        for i, error in enumerate(errors[-10:], 1):
-            print(f"--- Error {i} ---")
-            print(error)
-            print()
-    
-    # If admin routes are mentioned in errors, highlight them
-    admin_errors = [error for error in errors if 'admin' in error.lower()]
-    if admin_errors:
-        print(f"\nFound {len(admin_errors)} errors related to admin routes:\n")
-        for i, error in enumerate(admin_errors[-5:], 1):
-            print(f"--- Admin Error {i} ---")
-            print(error)
-            print()
+    main()